@@ -0,0 +1,464 @@
+"""
+策略回调耗时基准测试
+
+使用不依赖数据库和交易接口的桩引擎，将K线逐根推送给各策略，统计每次回调耗时的
+p50/p99、每秒处理的K线数量以及每根K线回调期间的内存分配峰值。
+
+    python strategy_benchmark.py                                # 使用合成的分钟K线
+    python strategy_benchmark.py --vt-symbol rb888.SHFE         # 使用elite_cache中缓存的分钟K线
+    python strategy_benchmark.py --save baseline.json           # 保存结果作为基准
+    python strategy_benchmark.py --compare baseline.json        # 和基准比较，变慢超过阈值时返回非零退出码
+"""
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timedelta
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+ROOT: Path = Path(__file__).absolute().parent.parent
+CTA_PATH: Path = ROOT.joinpath("cta")
+PORTFOLIO_PATH: Path = ROOT.joinpath("portfolio", "oi_concentration_strategy")
+
+sys.path.append(str(CTA_PATH))
+sys.path.append(str(PORTFOLIO_PATH))
+for folder in CTA_PATH.iterdir():
+    if folder.is_dir():
+        sys.path.append(str(folder))
+
+from vnpy.trader.constant import Direction, Exchange, Interval
+from vnpy.trader.object import BarData
+from vnpy_ctastrategy import CtaTemplate
+from vnpy_ctastrategy.base import EngineType
+from vnpy_portfoliostrategy import StrategyTemplate
+
+from continuous_breakthroughs_strategy import ContiBreStrategy
+from cpv_strategy import CpvStrategy
+from extreme_follow_strategy import ExtremeFollowStrategy
+from maobv_strategy import MAOBVStrategy
+from oi_based_strategy import OiBasedStrategy
+from rumi_strategy import RumiStrategy
+from trend_model_sys_strategy import TrendModelSysStrategy
+from oi_concentration_strategy import OiConcentrationStrategy
+from rank_store import RankStore
+
+
+CTA_STRATEGIES: List[type] = [
+    RumiStrategy,
+    MAOBVStrategy,
+    ContiBreStrategy,
+    ExtremeFollowStrategy,
+    CpvStrategy,
+    OiBasedStrategy,
+    TrendModelSysStrategy
+]
+
+# 合成分钟K线的交易时段
+SESSIONS: List[Tuple[int, int, int, int]] = [
+    (21, 0, 23, 0),
+    (9, 0, 10, 15),
+    (10, 30, 11, 30),
+    (13, 30, 15, 0)
+]
+
+
+class StubCtaEngine:
+    """CTA策略的桩引擎，委托按委托价立即成交，停止单只做记录"""
+
+    engine_type: EngineType = EngineType.BACKTESTING
+
+    def __init__(self) -> None:
+        """构造函数"""
+        self.order_count: int = 0
+        self.stop_order_count: int = 0
+
+    def send_order(
+        self,
+        strategy: CtaTemplate,
+        direction: Direction,
+        offset,
+        price: float,
+        volume: float,
+        stop: bool,
+        lock: bool,
+        net: bool
+    ) -> list:
+        """记录委托，非停止单立即更新策略持仓"""
+        if stop:
+            self.stop_order_count += 1
+        else:
+            self.order_count += 1
+
+            if direction == Direction.LONG:
+                strategy.pos += volume
+            else:
+                strategy.pos -= volume
+
+        return []
+
+    def cancel_order(self, strategy: CtaTemplate, vt_orderid: str) -> None:
+        """撤销委托"""
+        pass
+
+    def cancel_all(self, strategy: CtaTemplate) -> None:
+        """全撤委托"""
+        pass
+
+    def load_bar(self, vt_symbol: str, days: int, interval: Interval, callback: Callable, use_database: bool) -> list:
+        """不加载历史数据"""
+        return []
+
+    def load_tick(self, vt_symbol: str, days: int, callback: Callable) -> list:
+        """不加载历史数据"""
+        return []
+
+    def write_log(self, msg: str, strategy: CtaTemplate = None) -> None:
+        """忽略日志"""
+        pass
+
+    def put_strategy_event(self, strategy: CtaTemplate) -> None:
+        """忽略界面更新"""
+        pass
+
+    def sync_strategy_data(self, strategy: CtaTemplate) -> None:
+        """忽略数据同步"""
+        pass
+
+    def send_email(self, msg: str, strategy: CtaTemplate = None) -> None:
+        """忽略邮件"""
+        pass
+
+    def get_engine_type(self) -> EngineType:
+        """引擎类型"""
+        return self.engine_type
+
+    def get_pricetick(self, strategy: CtaTemplate) -> float:
+        """合约最小价格跳动"""
+        return 1
+
+    def get_size(self, strategy: CtaTemplate) -> int:
+        """合约乘数"""
+        return 1
+
+
+class StubStrategyEngine(StubCtaEngine):
+    """组合策略的桩引擎，委托按委托价立即成交"""
+
+    def send_order(
+        self,
+        strategy: StrategyTemplate,
+        vt_symbol: str,
+        direction: Direction,
+        offset,
+        price: float,
+        volume: float,
+        lock: bool,
+        net: bool
+    ) -> list:
+        """记录委托并立即更新策略持仓"""
+        self.order_count += 1
+
+        if direction == Direction.LONG:
+            strategy.pos_data[vt_symbol] += volume
+        else:
+            strategy.pos_data[vt_symbol] -= volume
+
+        return []
+
+    def load_bars(self, strategy: StrategyTemplate, days: int, interval: Interval) -> None:
+        """不加载历史数据"""
+        pass
+
+    def send_notification(self, msg: str, strategy: StrategyTemplate = None) -> None:
+        """忽略通知"""
+        pass
+
+
+def generate_minute_bars(days: int, symbol: str = "rb888", exchange: Exchange = Exchange.SHFE) -> List[BarData]:
+    """生成带夜盘的随机游走分钟K线"""
+    rng: np.random.Generator = np.random.default_rng(0)
+
+    dts: List[datetime] = []
+    trading_day: datetime = datetime(2021, 1, 4)
+    for _ in range(days):
+        while trading_day.weekday() >= 5:
+            trading_day += timedelta(days=1)
+
+        # 夜盘属于下一个交易日，周一的夜盘在上周五
+        night_day: datetime = trading_day - timedelta(days=3 if trading_day.weekday() == 0 else 1)
+
+        for start_hour, start_minute, end_hour, end_minute in SESSIONS:
+            base: datetime = night_day if start_hour >= 20 else trading_day
+            dt: datetime = base.replace(hour=start_hour, minute=start_minute)
+            end: datetime = base.replace(hour=end_hour, minute=end_minute)
+
+            while dt < end:
+                dts.append(dt)
+                dt += timedelta(minutes=1)
+
+        trading_day += timedelta(days=1)
+
+    n: int = len(dts)
+    close: ndarray = 4000 + np.cumsum(rng.normal(0, 3, n))
+    open_: ndarray = np.r_[close[0], close[:-1]]
+    high: ndarray = np.maximum(open_, close) + np.abs(rng.normal(0, 1, n))
+    low: ndarray = np.minimum(open_, close) - np.abs(rng.normal(0, 1, n))
+    volume: ndarray = rng.integers(1, 2000, n).astype(float)
+    open_interest: ndarray = np.round(1e6 + np.cumsum(rng.normal(0, 200, n)))
+
+    return [
+        BarData(
+            symbol=symbol,
+            exchange=exchange,
+            datetime=dts[i],
+            interval=Interval.MINUTE,
+            open_price=open_[i],
+            high_price=high[i],
+            low_price=low[i],
+            close_price=close[i],
+            volume=volume[i],
+            turnover=volume[i] * close[i],
+            open_interest=open_interest[i],
+            gateway_name="BENCHMARK"
+        )
+        for i in range(n)
+    ]
+
+
+def load_cached_bars(vt_symbol: str, start: datetime, end: datetime) -> List[BarData]:
+    """从elite_cache读取缓存的分钟K线"""
+    from elite_cache import BarCache
+    from elite_optimization import BarSequence
+    from vnpy.trader.utility import extract_vt_symbol
+
+    symbol, exchange = extract_vt_symbol(vt_symbol)
+    arrays: Dict[str, ndarray] = BarCache().load_arrays(symbol, exchange, Interval.MINUTE, start, end)
+    return BarSequence(arrays, symbol, exchange, Interval.MINUTE)[:]
+
+
+def generate_daily_bars(vt_symbols: List[str], dates: List[datetime]) -> List[Dict[str, BarData]]:
+    """生成各品种的随机游走日K线"""
+    rng: np.random.Generator = np.random.default_rng(0)
+    close: ndarray = 3000 * np.exp(np.cumsum(rng.normal(0, 0.01, (len(dates), len(vt_symbols))), axis=0))
+
+    result: List[Dict[str, BarData]] = []
+    for i, dt in enumerate(dates):
+        bars: Dict[str, BarData] = {}
+
+        for j, vt_symbol in enumerate(vt_symbols):
+            symbol, exchange = vt_symbol.split(".")
+            price: float = close[i, j]
+
+            bars[vt_symbol] = BarData(
+                symbol=symbol,
+                exchange=Exchange(exchange),
+                datetime=dt,
+                interval=Interval.DAILY,
+                open_price=price,
+                high_price=price,
+                low_price=price,
+                close_price=price,
+                volume=1000,
+                turnover=1000 * price,
+                open_interest=100000,
+                gateway_name="BENCHMARK"
+            )
+
+        result.append(bars)
+
+    return result
+
+
+def measure(callback: Callable, items: list, create: Callable, repeat: int) -> dict:
+    """逐个推送数据，统计回调耗时和内存分配"""
+    # 计时和内存统计分开进行，避免tracemalloc影响耗时
+    callback(create(), items[0])
+
+    # 计时重复repeat轮，各项指标取多轮中的最好值以减少系统噪声的影响
+    p50: List[float] = []
+    p99: List[float] = []
+    speed: List[float] = []
+
+    for _ in range(repeat):
+        strategy = create()
+        latencies: ndarray = np.zeros(len(items), dtype=np.int64)
+
+        gc.collect()
+        gc.disable()
+        try:
+            for i, item in enumerate(items):
+                start: int = perf_counter_ns()
+                callback(strategy, item)
+                latencies[i] = perf_counter_ns() - start
+        finally:
+            gc.enable()
+
+        p50.append(float(np.percentile(latencies, 50)) / 1000)
+        p99.append(float(np.percentile(latencies, 99)) / 1000)
+        speed.append(len(items) / (latencies.sum() / 1e9))
+
+    strategy = create()
+    allocations: ndarray = np.zeros(len(items), dtype=np.int64)
+    tracemalloc.start()
+    try:
+        for i, item in enumerate(items):
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            callback(strategy, item)
+            allocations[i] = tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "count": len(items),
+        "p50_us": min(p50),
+        "p99_us": min(p99),
+        "bars_per_sec": float(max(speed)),
+        "alloc_bytes_per_bar": float(allocations.mean())
+    }
+
+
+def benchmark_cta(strategy_class: type, bars: List[BarData], repeat: int) -> dict:
+    """测试CTA策略的on_bar回调"""
+    vt_symbol: str = bars[0].vt_symbol
+
+    def create() -> CtaTemplate:
+        strategy: CtaTemplate = strategy_class(StubCtaEngine(), strategy_class.__name__, vt_symbol, {})
+        strategy.on_init()
+        strategy.inited = True
+        strategy.trading = True
+        strategy.on_start()
+        return strategy
+
+    def callback(strategy: CtaTemplate, bar: BarData) -> None:
+        strategy.on_bar(bar)
+
+    return measure(callback, bars, create, repeat)
+
+
+def benchmark_portfolio(days: int, repeat: int) -> dict:
+    """测试OiConcentrationStrategy的on_bars回调，使用持仓排名数据中的品种和交易日"""
+    # 策略从当前目录下的processed_data读取持仓排名数据
+    cwd: str = os.getcwd()
+    os.chdir(PORTFOLIO_PATH)
+    try:
+        store: RankStore = RankStore(PORTFOLIO_PATH.joinpath("processed_data"))
+        vt_symbols: List[str] = [f"{symbol}888.{Exchange.LOCAL.value}" for symbol in store.symbols]
+        dates: List[datetime] = [
+            datetime(d.year, d.month, d.day, 15) for d in store.dates.tolist()[-days:]
+        ]
+        bars_list: List[Dict[str, BarData]] = generate_daily_bars(vt_symbols, dates)
+
+        def create() -> StrategyTemplate:
+            strategy: StrategyTemplate = OiConcentrationStrategy(
+                StubStrategyEngine(), "OiConcentrationStrategy", vt_symbols, {}
+            )
+            strategy.on_init()
+            strategy.inited = True
+            strategy.trading = True
+            strategy.on_start()
+            return strategy
+
+        def callback(strategy: StrategyTemplate, bars: Dict[str, BarData]) -> None:
+            strategy.on_bars(bars)
+
+        return measure(callback, bars_list, create, repeat)
+    finally:
+        os.chdir(cwd)
+
+
+def run_benchmark(args: Namespace) -> Dict[str, dict]:
+    """运行全部策略的基准测试"""
+    if args.vt_symbol:
+        bars: List[BarData] = load_cached_bars(
+            args.vt_symbol,
+            datetime.strptime(args.start, "%Y-%m-%d"),
+            datetime.strptime(args.end, "%Y-%m-%d")
+        )
+    else:
+        bars = generate_minute_bars(args.days)
+
+    results: Dict[str, dict] = {}
+    for strategy_class in CTA_STRATEGIES:
+        results[strategy_class.__name__] = benchmark_cta(strategy_class, bars, args.repeat)
+    results[OiConcentrationStrategy.__name__] = benchmark_portfolio(args.portfolio_days, args.repeat)
+
+    return results
+
+
+def print_results(results: Dict[str, dict]) -> None:
+    """输出结果表格"""
+    print(f"{'strategy':<26}{'count':>8}{'p50_us':>10}{'p99_us':>10}{'bars/sec':>12}{'alloc_B/bar':>13}")
+
+    for name, result in results.items():
+        print(
+            f"{name:<26}{result['count']:>8}{result['p50_us']:>10.2f}{result['p99_us']:>10.2f}"
+            f"{result['bars_per_sec']:>12.0f}{result['alloc_bytes_per_bar']:>13.0f}"
+        )
+
+
+def compare_results(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """和基准结果比较，返回p50耗时或处理速度变差超过阈值的策略"""
+    failures: List[str] = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base: dict = baseline[name]
+
+        p50_change: float = result["p50_us"] / base["p50_us"] - 1
+        speed_change: float = base["bars_per_sec"] / result["bars_per_sec"] - 1
+
+        if p50_change > threshold or speed_change > threshold:
+            failures.append(
+                f"{name}：p50 {base['p50_us']:.2f}us -> {result['p50_us']:.2f}us，"
+                f"bars/sec {base['bars_per_sec']:.0f} -> {result['bars_per_sec']:.0f}"
+            )
+
+    return failures
+
+
+def main() -> None:
+    """命令行入口"""
+    parser: ArgumentParser = ArgumentParser(description="策略回调耗时基准测试")
+    parser.add_argument("--days", type=int, default=60, help="合成分钟K线的交易日数量")
+    parser.add_argument("--portfolio-days", type=int, default=1000, help="组合策略使用的交易日数量")
+    parser.add_argument("--vt-symbol", default="", help="使用elite_cache中该合约的分钟K线")
+    parser.add_argument("--start", default="2021-01-01", help="缓存K线的开始日期")
+    parser.add_argument("--end", default="2021-12-31", help="缓存K线的结束日期")
+    parser.add_argument("--repeat", type=int, default=5, help="计时的重复轮数，取最快的一轮")
+    parser.add_argument("--save", default="", help="将结果保存为json文件")
+    parser.add_argument("--compare", default="", help="和json文件中的基准结果比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许变慢的比例")
+    args: Namespace = parser.parse_args()
+
+    results: Dict[str, dict] = run_benchmark(args)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline: Dict[str, dict] = json.load(f)
+
+        failures: List[str] = compare_results(results, baseline, args.threshold)
+        if failures:
+            print(f"以下策略变慢超过{args.threshold:.0%}：")
+            for failure in failures:
+                print(failure)
+            sys.exit(1)
+
+        print(f"全部策略和基准相比变慢均未超过{args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,9 @@
+from collections import deque
+from typing import Deque, Dict, Tuple
+
 import numpy as np
+from numpy import ndarray
+from numpy.lib.stride_tricks import sliding_window_view
 
 from vnpy_ctastrategy import (
     CtaTemplate,
@@ -9,9 +14,14 @@ from vnpy_ctastrategy import (
     TradeData,
     OrderData,
     BarGenerator,
-    ArrayManager,
 )
 
+# 实盘时以strategies.<模块名>导入，elite_utility需复制到同一目录
+try:
+    from .elite_utility import generate_position, generate_window_arrays, get_setting
+except ImportError:
+    from elite_utility import generate_position, generate_window_arrays, get_setting
+
 
 class ContiBreStrategy(CtaTemplate):
     """连续突破追踪策略"""
@@ -55,9 +65,8 @@ class ContiBreStrategy(CtaTemplate):
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
         self.bg = BarGenerator(self.on_bar, self.window, self.on_Nmin_bar)
-        self.am = ArrayManager()
-        self.bar_number = []  # 记录K线序号
-        self.signal = []  # 记录信号
+        self.extreme = RollingExtreme(self.n2)          # 最近n2根K线的收盘价极值
+        self.counter = BreakoutCounter(self.count)      # 统计周期内的突破信号
 
     def on_init(self) -> None:
         """初始化"""
@@ -84,32 +93,27 @@ class ContiBreStrategy(CtaTemplate):
 
     def on_Nmin_bar(self, bar: BarData):
         """N分钟线推送"""
-        am = self.am
-        am.update_bar(bar)
-        if not am.inited:
+        # 先取前n2根K线的最高最低收盘价，再更新当前K线
+        extreme: RollingExtreme = self.extreme
+        inited: bool = extreme.inited
+        self.highest = extreme.highest      # 一段时间的最高价
+        self.lowest = extreme.lowest        # 一段时间的最低价
+        extreme.update(bar.close_price)
+
+        if not inited:
             return
 
         self.i_count += 1  # 第几根K线
-        self.highest = am.close_array[-self.n2-1:-1].max()  # 一段时间的最高价
-        self.lowest = am.close_array[-self.n2-1:-1].min()  # 一段时间的最低价
-        if bar.close_price > self.highest:  # 突破
-            self.bar_number.append(self.i_count)  # 把K线的编号记录下来
-            self.signal.append(1)  # 把信号记录下来
-            while self.bar_number[-1] - self.bar_number[0] > self.count:  # 超过统计周期
-                self.bar_number.pop(0)  # 把前面的丢掉，继续向前动态跟踪
-                self.signal.pop(0)  # 老信号丢掉
+        if bar.close_price > self.highest:  # 突破，记录K线编号和信号
+            self.counter.add(self.i_count, 1)
 
         if bar.close_price < self.lowest:  # 向下突破
-            self.bar_number.append(self.i_count)
-            self.signal.append(-1)  # 把信号记录下来
-            while self.bar_number[-1] - self.bar_number[0] > self.count:
-                self.bar_number.pop(0)
-                self.signal.pop(0)  # 老信号丢掉
+            self.counter.add(self.i_count, -1)
 
-        if len(self.signal) == 0:
+        if not self.counter.signals:
             return
 
-        if np.cumsum(np.array(self.signal))[-1] > self.n1:  # 向上突破次数累计到一定的量
+        if self.counter.total > self.n1:  # 向上突破次数累计到一定的量
             if self.pos == 0:
                 price: float = bar.close_price + self.price_add
                 self.buy(price, self.fixed_size)
@@ -117,7 +121,7 @@ class ContiBreStrategy(CtaTemplate):
                 price: float = bar.close_price + self.price_add
                 self.cover(price, abs(self.pos))
                 self.buy(price, self.fixed_size)
-        elif np.cumsum(np.array(self.signal))[-1] < -self.n1:  # 向下突破次数累积到一定的量
+        elif self.counter.total < -self.n1:  # 向下突破次数累积到一定的量
             if self.pos == 0:
                 price: float = bar.close_price - self.price_add
                 self.short(price, self.fixed_size)
@@ -139,3 +143,108 @@ class ContiBreStrategy(CtaTemplate):
     def on_stop_order(self, stop_order: StopOrder) -> None:
         """停止单推送"""
         pass
+
+
+class RollingExtreme:
+    """用单调队列维护最近window个数值的最大最小值"""
+
+    def __init__(self, window: int) -> None:
+        """构造函数"""
+        self.window: int = window
+        self.count: int = 0
+
+        # 单调队列中保存(序号, 数值)，队首即窗口内的最大值和最小值
+        self.max_queue: Deque[Tuple[int, float]] = deque()
+        self.min_queue: Deque[Tuple[int, float]] = deque()
+
+    @property
+    def inited(self) -> bool:
+        """窗口是否已经写满"""
+        return self.count >= self.window
+
+    @property
+    def highest(self) -> float:
+        """窗口内的最大值"""
+        return self.max_queue[0][1] if self.max_queue else 0
+
+    @property
+    def lowest(self) -> float:
+        """窗口内的最小值"""
+        return self.min_queue[0][1] if self.min_queue else 0
+
+    def update(self, value: float) -> None:
+        """写入新数据，移除窗口外的数据"""
+        self.count += 1
+
+        max_queue: Deque[Tuple[int, float]] = self.max_queue
+        while max_queue and max_queue[-1][1] <= value:
+            max_queue.pop()
+        max_queue.append((self.count, value))
+        if max_queue[0][0] <= self.count - self.window:
+            max_queue.popleft()
+
+        min_queue: Deque[Tuple[int, float]] = self.min_queue
+        while min_queue and min_queue[-1][1] >= value:
+            min_queue.pop()
+        min_queue.append((self.count, value))
+        if min_queue[0][0] <= self.count - self.window:
+            min_queue.popleft()
+
+
+class BreakoutCounter:
+    """记录突破信号，维护统计周期内信号的累计值"""
+
+    def __init__(self, count: int) -> None:
+        """构造函数"""
+        self.count: int = count
+        self.signals: Deque[Tuple[int, int]] = deque()   # (K线编号, 信号)
+        self.total: int = 0
+
+    def add(self, bar_number: int, signal: int) -> None:
+        """加入新信号，并丢弃距离新信号超过统计周期的老信号"""
+        self.signals.append((bar_number, signal))
+        self.total += signal
+
+        while bar_number - self.signals[0][0] > self.count:
+            _, old_signal = self.signals.popleft()
+            self.total -= old_signal
+
+
+def generate_signals(arrays: Dict[str, ndarray], params: dict) -> ndarray:
+    """
+    向量化计算全部历史的持仓序列，和ContiBreStrategy的逻辑一致。
+
+    arrays为一分钟K线各字段的数组，params中未给出的参数使用策略的默认值，
+    返回每根一分钟K线结束时的持仓，假设委托都在下一根K线成交。
+
+    BacktestingEngine会将委托价格按pricetick取整，且限价委托价格不够时不会成交，
+    只有K线价格在最小变动价位上且price_add足够大时，持仓才和逐K线回测完全一致。
+    """
+    setting: dict = get_setting(ContiBreStrategy, params)
+    n1: int = setting["n1"]
+    n2: int = setting["n2"]
+    count: int = setting["count"]
+
+    bars, index = generate_window_arrays(arrays, setting["window"])
+    close: ndarray = bars["close_price"]
+    n: int = len(close)
+
+    # 和前n2根K线的最高最低收盘价比较，得到突破信号
+    breakout: ndarray = np.zeros(n, dtype=int)
+    if n > n2:
+        windows: ndarray = sliding_window_view(close[:-1], n2)
+        current: ndarray = close[n2:]
+        breakout[n2:] = (current > windows.max(axis=1)).astype(int) - (current < windows.min(axis=1))
+
+    # 新信号加入时丢弃距离超过count根K线的老信号，因此累计值只在有信号时更新
+    cumsum: ndarray = np.r_[0, np.cumsum(breakout)]
+    position: ndarray = np.arange(n)
+    total: ndarray = cumsum[position + 1] - cumsum[np.maximum(position - count, 0)]
+
+    added: ndarray = breakout != 0
+    last: ndarray = np.maximum.accumulate(np.where(added, position, -1))
+    total = np.where(last >= 0, total[last], 0)
+    started: ndarray = last >= 0
+
+    signal: ndarray = np.where(total > n1, 1, np.where(total < -n1, -1, 0)) * started
+    return generate_position(len(arrays["close_price"]), index, signal, setting["fixed_size"])
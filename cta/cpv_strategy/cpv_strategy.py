@@ -1,5 +1,8 @@
+from math import nan, sqrt
+from typing import Dict
+
 import numpy as np
-import pandas as pd
+from numpy import ndarray
 
 from vnpy_ctastrategy import (
     CtaTemplate,
@@ -10,9 +13,28 @@ from vnpy_ctastrategy import (
     TradeData,
     OrderData,
     BarGenerator,
-    ArrayManager,
 )
 
+# 实盘时以strategies.<模块名>导入，elite_utility需复制到同一目录
+try:
+    from .elite_utility import (
+        TradingDaySeries,
+        generate_position,
+        get_close_mask,
+        get_day_start,
+        get_setting,
+        get_trading_day
+    )
+except ImportError:
+    from elite_utility import (
+        TradingDaySeries,
+        generate_position,
+        get_close_mask,
+        get_day_start,
+        get_setting,
+        get_trading_day
+    )
+
 
 class CpvStrategy(CtaTemplate):
     """CPV策略"""
@@ -45,9 +67,8 @@ class CpvStrategy(CtaTemplate):
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
         self.bg = BarGenerator(self.on_bar)
-        self.am = ArrayManager(500)     # 起码容纳一天以上的分钟数据
-
-        self.last_bar: BarData = None
+        self.series = TradingDaySeries(self.vt_symbol)
+        self.cpv = CpvCalculator()
 
     def on_init(self) -> None:
         """初始化"""
@@ -70,83 +91,47 @@ class CpvStrategy(CtaTemplate):
 
     def on_bar(self, bar: BarData) -> None:
         """一分钟数据推送"""
-        am: ArrayManager = self.am
-        am.update_bar(bar)
-        if not am.inited:
-            return
+        series: TradingDaySeries = self.series
+        series.update_bar(bar)
 
-        # 新的一天
-        if not self.last_bar or self.last_bar.datetime.day != bar.datetime.day:
-            self.last_bar = bar
-            self.count = 1  # 当天第一根K线
-            return
-        # 收盘执行计算
-        elif bar.datetime.minute == 59 and bar.datetime.hour == 14:
-            self.count += 1
-
-            # 使用DataFrame作为统计数据容器
-            df = pd.DataFrame()
-
-            # 读取成交量数据
-            df['vt'] = am.volume_array[-self.count:]
-
-            # 检查异常的成交量数据
-            if 0 in np.array(df['vt']):
-                return
-
-            # 计算成交量变化
-            df['pre_vt'] = am.volume_array[-self.count-1:-1]
-            df['vt_change'] = df['vt'] - df['pre_vt']
-
-            # 计算持仓量变化
-            df['oi'] = am.open_interest_array[-self.count:]
-            df['pre_oi'] = am.open_interest_array[-self.count-1:-1]
-            df['oi_change'] = df['oi'] - df['pre_oi']
-
-            # 当天持仓量变化
-            delta_oi = df['oi'].iloc[-1] - df['oi'].iloc[0]
-
-            # 当天成交量变化的累积
-            delta_vt = df['vt_change'][1:].sum()  
-
-            # T+1交易者的贡献
-            df['oi_t1'] = df['vt_change'] * delta_oi / delta_vt
-
-            # T+0交易者的贡献
-            df['oi_t0'] = -1 * (df['oi_change'] - df['oi_t1'])
-
-            # 计算修正持仓量
-            df['mod_delta_oi'] = df['oi_t0'] + df['oi_t1']
-            df['mod_delta_oi'][0] = df['oi'][0]
-            df['mod_oi'] = df['mod_delta_oi'].cumsum()
-
-            # 修正持仓量和收盘价的相关系数
-            df['close_price'] = am.close_array[-self.count:]
-            self.pv = df['close_price'].corr(df['mod_oi'])
-
-            # 执行交易
-            if self.pv > 0:
-                price: float = bar.close_price + self.price_add
-
-                if not self.pos:
-                    self.buy(price, self.fixed_size)
-                elif self.pos < 0:
-                    self.cover(price, abs(self.pos))
-                    self.buy(price, self.fixed_size)
-            else:
-                price: float = bar.close_price - self.price_add
-
-                if not self.pos:
-                    self.short(price, self.fixed_size)
-                elif self.pos > 0:
-                    self.sell(price, abs(self.pos))
-                    self.short(price, self.fixed_size)
-        # 其他日内时间等待
+        # 每根K线累计日内统计量，当天第一根K线作为累计的基准
+        if series.count == 1:
+            self.cpv.new_day(bar)
         else:
-            self.count += 1
+            self.cpv.update_bar(bar)
+
+        if series.closed:
+            self.on_day_close(bar)
 
         self.put_event()
 
+    def on_day_close(self, bar: BarData) -> None:
+        """日盘收盘K线推送"""
+        # 当天至少需要两根K线，并检查异常的成交量数据
+        if self.cpv.count < 2 or self.cpv.zero_volume:
+            return
+
+        # 修正持仓量和收盘价的相关系数，只读取累计量
+        self.pv = self.cpv.calculate()
+
+        # 执行交易
+        if self.pv > 0:
+            price: float = bar.close_price + self.price_add
+
+            if not self.pos:
+                self.buy(price, self.fixed_size)
+            elif self.pos < 0:
+                self.cover(price, abs(self.pos))
+                self.buy(price, self.fixed_size)
+        else:
+            price: float = bar.close_price - self.price_add
+
+            if not self.pos:
+                self.short(price, self.fixed_size)
+            elif self.pos > 0:
+                self.sell(price, abs(self.pos))
+                self.short(price, self.fixed_size)
+
     def on_order(self, order: OrderData) -> None:
         """委托推送"""
         pass
@@ -158,3 +143,164 @@ class CpvStrategy(CtaTemplate):
     def on_stop_order(self, stop_order: StopOrder) -> None:
         """停止单推送"""
         pass
+
+
+class CpvCalculator:
+    """
+    逐根K线累计日内统计量，收盘时直接计算修正持仓量和收盘价的相关系数。
+
+    记当天第i根K线的成交量、持仓量相对第一根K线的变化为v、o，
+    则修正持仓量mod_oi = 2 * a * v - o + 常数，其中a = 当天持仓量变化 / 当天成交量变化，
+    因此只需累计收盘价、v、o的一阶和二阶矩即可得到相关系数。
+    """
+
+    def __init__(self) -> None:
+        """构造函数"""
+        self.count: int = 0
+        self.zero_volume: bool = False
+
+        # 当天第一根K线的数据，作为累计的基准
+        self.first_close: float = 0
+        self.first_volume: float = 0
+        self.first_oi: float = 0
+
+        # 最新一根K线相对基准的变化
+        self.volume_change: float = 0
+        self.oi_change: float = 0
+
+        # 一阶和二阶矩
+        self.sum_c: float = 0
+        self.sum_v: float = 0
+        self.sum_o: float = 0
+        self.sum_cc: float = 0
+        self.sum_vv: float = 0
+        self.sum_oo: float = 0
+        self.sum_cv: float = 0
+        self.sum_co: float = 0
+        self.sum_vo: float = 0
+
+    def new_day(self, bar: BarData) -> None:
+        """新的一天，以第一根K线作为基准重新累计"""
+        self.__init__()
+
+        self.first_close = bar.close_price
+        self.first_volume = bar.volume
+        self.first_oi = bar.open_interest
+
+        self.update_bar(bar)
+
+    def update_bar(self, bar: BarData) -> None:
+        """累计一根K线"""
+        self.count += 1
+
+        if not bar.volume:
+            self.zero_volume = True
+
+        c: float = bar.close_price - self.first_close
+        v: float = bar.volume - self.first_volume
+        o: float = bar.open_interest - self.first_oi
+
+        self.volume_change = v
+        self.oi_change = o
+
+        self.sum_c += c
+        self.sum_v += v
+        self.sum_o += o
+        self.sum_cc += c * c
+        self.sum_vv += v * v
+        self.sum_oo += o * o
+        self.sum_cv += c * v
+        self.sum_co += c * o
+        self.sum_vo += v * o
+
+    def calculate(self) -> float:
+        """计算修正持仓量和收盘价的相关系数，无法计算时返回nan"""
+        # 当天成交量变化的累积为0时无法拆分T+0和T+1交易者的贡献
+        if not self.volume_change:
+            return nan
+
+        n: int = self.count
+        a: float = self.oi_change / self.volume_change
+
+        # 离差平方和与离差乘积和
+        var_c: float = self.sum_cc - self.sum_c * self.sum_c / n
+        var_v: float = self.sum_vv - self.sum_v * self.sum_v / n
+        var_o: float = self.sum_oo - self.sum_o * self.sum_o / n
+        cov_cv: float = self.sum_cv - self.sum_c * self.sum_v / n
+        cov_co: float = self.sum_co - self.sum_c * self.sum_o / n
+        cov_vo: float = self.sum_vo - self.sum_v * self.sum_o / n
+
+        cov: float = 2 * a * cov_cv - cov_co
+        var_mod_oi: float = 4 * a * a * var_v - 4 * a * cov_vo + var_o
+
+        if var_c <= 0 or var_mod_oi <= 0:
+            return nan
+
+        return cov / sqrt(var_c * var_mod_oi)
+
+
+def calculate_cpv(close: ndarray, volume: ndarray, open_interest: ndarray) -> float:
+    """
+    在整段数组上计算当天修正持仓量和收盘价的相关系数，无法计算时返回nan，供generate_signals使用。
+
+    记成交量、持仓量相对当天第一根K线的变化为v、o，
+    则修正持仓量mod_oi = 2 * a * v - o + 常数，其中a = 当天持仓量变化 / 当天成交量变化。
+    """
+    volume_change: ndarray = volume - volume[0]
+    oi_change: ndarray = open_interest - open_interest[0]
+
+    # 当天成交量变化的累积为0时无法拆分T+0和T+1交易者的贡献
+    if not volume_change[-1]:
+        return nan
+
+    a: float = oi_change[-1] / volume_change[-1]
+    mod_oi: ndarray = 2 * a * volume_change - oi_change
+
+    close_dev: ndarray = close - close.mean()
+    mod_oi_dev: ndarray = mod_oi - mod_oi.mean()
+
+    denominator: float = sqrt((close_dev * close_dev).sum() * (mod_oi_dev * mod_oi_dev).sum())
+    if not denominator:
+        return nan
+
+    return (close_dev * mod_oi_dev).sum() / denominator
+
+
+def generate_signals(arrays: Dict[str, ndarray], params: dict) -> ndarray:
+    """
+    向量化计算全部历史的持仓序列，和CpvStrategy的逻辑一致。
+
+    arrays为一分钟K线各字段的数组，params中未给出的参数使用策略的默认值，
+    可以额外传入vt_symbol用于确定收盘时间，返回每根一分钟K线结束时的持仓，
+    假设委托都在下一根K线成交。
+
+    BacktestingEngine会将委托价格按pricetick取整，且限价委托价格不够时不会成交，
+    只有K线价格在最小变动价位上且price_add足够大时，持仓才和逐K线回测完全一致。
+    """
+    setting: dict = get_setting(CpvStrategy, params)
+
+    datetime_array: ndarray = arrays["datetime"]
+    close: ndarray = arrays["close_price"]
+    volume: ndarray = arrays["volume"]
+    open_interest: ndarray = arrays["open_interest"]
+
+    # 每个交易日只在收盘K线计算一次，统计区间为当天开盘到收盘
+    day: ndarray = get_trading_day(datetime_array)
+    day_start: ndarray = get_day_start(day)
+
+    index: ndarray = np.flatnonzero(get_close_mask(datetime_array, params.get("vt_symbol", "")))
+    signal: ndarray = np.zeros(len(index), dtype=int)
+
+    for i, end in enumerate(index):
+        start: int = day_start[end]
+        if end == start or not volume[start:end + 1].all():
+            continue
+
+        pv: float = calculate_cpv(
+            close[start:end + 1],
+            volume[start:end + 1],
+            open_interest[start:end + 1]
+        )
+        signal[i] = 1 if pv > 0 else -1
+
+    return generate_position(len(close), index, signal, setting["fixed_size"])
@@ -0,0 +1,195 @@
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+import pandas as pd
+
+from vnpy.trader.constant import Exchange, Interval
+from vnpy.trader.database import BarOverview, BaseDatabase, get_database
+from vnpy.trader.object import BarData
+from vnpy.trader.utility import get_folder_path
+
+from elite_utility import BAR_FIELDS, bars_to_arrays
+
+
+def get_period_start(dt: datetime, period: str) -> datetime:
+    """获取时间所在缓存周期的开始时间"""
+    if period == "year":
+        return datetime(dt.year, 1, 1)
+    return datetime(dt.year, dt.month, 1)
+
+
+def get_next_period(dt: datetime, period: str) -> datetime:
+    """获取下一个缓存周期的开始时间，dt为周期开始时间"""
+    if period == "year":
+        return datetime(dt.year + 1, 1, 1)
+    if dt.month == 12:
+        return datetime(dt.year + 1, 1, 1)
+    return datetime(dt.year, dt.month + 1, 1)
+
+
+def get_period_name(dt: datetime, period: str) -> str:
+    """缓存周期的文件名"""
+    if period == "year":
+        return dt.strftime("%Y")
+    return dt.strftime("%Y-%m")
+
+
+def save_npz(path: Path, covered: datetime, arrays: Dict[str, ndarray]) -> None:
+    """先写入临时文件再替换，避免读到写了一半的文件"""
+    tmp_path: Path = path.with_name(path.name + ".tmp")
+
+    with open(tmp_path, "wb") as f:
+        np.savez(f, covered=np.datetime64(covered, "s"), **arrays)
+
+    os.replace(tmp_path, path)
+
+
+def load_npz(path: Path) -> Tuple[datetime, Dict[str, ndarray]]:
+    """读取缓存文件，返回已查询到的截止时间和K线数组"""
+    with np.load(path) as f:
+        covered: datetime = f["covered"].item()
+        arrays: Dict[str, ndarray] = {name: f[name] for name in ["datetime"] + BAR_FIELDS}
+
+    return covered, arrays
+
+
+def concat_arrays(parts: List[Dict[str, ndarray]]) -> Dict[str, ndarray]:
+    """按时间顺序拼接多段K线数组"""
+    if not parts:
+        return bars_to_arrays([])
+
+    return {
+        name: np.concatenate([arrays[name] for arrays in parts])
+        for name in ["datetime"] + BAR_FIELDS
+    }
+
+
+class BarCache:
+    """
+    数据库K线的本地列式缓存，按合约、交易所、周期分目录，按月或按年分文件保存。
+
+    每个文件记录已从数据库查询到的截止时间，读取时只向数据库补充缺失的部分。
+    截止时间为实际查询到的最后一根K线，数据库中已有更晚的数据时才视为周期完整，
+    因此之后补录到数据库中的K线会在下次读取时追加。
+    读取结果为和bars_to_arrays格式一致的数组，不会创建BarData对象。
+    """
+
+    def __init__(self, path: Path = None, period: str = "month") -> None:
+        """构造函数，默认保存在.vntrader目录下的bar_cache中，period为month或year"""
+        self.path: Path = path if path else get_folder_path("bar_cache")
+        self.period: str = period
+
+        self.database: BaseDatabase = None
+
+    def load_arrays(
+        self,
+        symbol: str,
+        exchange: Exchange,
+        interval: Interval,
+        start: datetime,
+        end: datetime
+    ) -> Dict[str, ndarray]:
+        """读取[start, end]范围内的K线数组，时间为不带时区的datetime64"""
+        start = start.replace(tzinfo=None)
+        end = end.replace(tzinfo=None)
+
+        folder: Path = self.path.joinpath(f"{symbol}.{exchange.value}", interval.value)
+        folder.mkdir(parents=True, exist_ok=True)
+
+        parts: List[Dict[str, ndarray]] = []
+        period_start: datetime = get_period_start(start, self.period)
+
+        while period_start <= end:
+            period_end: datetime = get_next_period(period_start, self.period)
+            file_path: Path = folder.joinpath(get_period_name(period_start, self.period) + ".npz")
+
+            parts.append(self.load_period(
+                file_path, symbol, exchange, interval, period_start, min(end, period_end - timedelta(seconds=1))
+            ))
+            period_start = period_end
+
+        arrays: Dict[str, ndarray] = concat_arrays(parts)
+
+        # 截取首尾周期中需要的部分
+        dt: ndarray = arrays["datetime"]
+        ix_start: int = np.searchsorted(dt, np.datetime64(start, "m"), side="left")
+        ix_end: int = np.searchsorted(dt, np.datetime64(end, "m"), side="right")
+
+        return {name: array[ix_start:ix_end] for name, array in arrays.items()}
+
+    def load_df(
+        self,
+        symbol: str,
+        exchange: Exchange,
+        interval: Interval,
+        start: datetime,
+        end: datetime
+    ) -> pd.DataFrame:
+        """读取[start, end]范围内的K线DataFrame"""
+        arrays: Dict[str, ndarray] = self.load_arrays(symbol, exchange, interval, start, end)
+        return pd.DataFrame(arrays)
+
+    def load_period(
+        self,
+        file_path: Path,
+        symbol: str,
+        exchange: Exchange,
+        interval: Interval,
+        period_start: datetime,
+        need: datetime
+    ) -> Dict[str, ndarray]:
+        """读取单个周期的缓存，截止时间之前未查询的部分从数据库补充"""
+        if file_path.exists():
+            covered, arrays = load_npz(file_path)
+
+            if covered >= need:
+                return arrays
+
+            query_start: datetime = covered + timedelta(seconds=1)
+        else:
+            covered, arrays = None, None
+            query_start = period_start
+
+        if not self.database:
+            self.database = get_database()
+
+        bars: List[BarData] = self.database.load_bar_data(symbol, exchange, interval, query_start, need)
+        new_arrays: Dict[str, ndarray] = bars_to_arrays(bars)
+
+        # 只记录到实际查询到的最后一根K线，数据库中已有周期之后的数据时才视为完整
+        if bars:
+            new_covered: datetime = min(bars[-1].datetime.replace(tzinfo=None), need)
+        else:
+            new_covered = covered
+
+        if not new_covered or new_covered < need:
+            database_end: datetime = self.get_database_end(symbol, exchange, interval)
+            if database_end and database_end >= need:
+                new_covered = need
+
+        if arrays:
+            new_arrays = concat_arrays([arrays, new_arrays])
+
+        if new_covered:
+            save_npz(file_path, new_covered, new_arrays)
+
+        return new_arrays
+
+    def get_database_end(self, symbol: str, exchange: Exchange, interval: Interval) -> datetime:
+        """数据库中该合约K线的最后时间，没有数据时返回None"""
+        overviews: List[BarOverview] = self.database.get_bar_overview()
+
+        for overview in overviews:
+            if (
+                overview.symbol == symbol
+                and overview.exchange == exchange
+                and overview.interval == interval
+                and overview.end
+            ):
+                return overview.end.replace(tzinfo=None)
+
+        return None
@@ -0,0 +1,150 @@
+import traceback
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, Generator, List
+
+from numpy import ndarray
+
+from vnpy.trader.constant import Exchange, Interval
+from vnpy.trader.database import BaseDatabase, get_database
+from vnpy.trader.object import BarData
+from vnpy_ctastrategy.backtesting import BacktestingEngine, BacktestingMode
+
+from elite_utility import bars_to_arrays
+
+
+def load_chunks(
+    load_func: Callable,
+    start: datetime,
+    end: datetime,
+    chunk_days: int,
+    max_workers: int
+) -> Generator:
+    """
+    将[start, end]按chunk_days天分段，在线程池中调用load_func(chunk_start, chunk_end)，
+    按时间顺序逐段返回结果。
+
+    同时最多有max_workers段在读取，每返回一段才提交下一段的读取任务，
+    消费者逐段处理时内存中最多保留max_workers + 1段数据。
+    """
+    # 各段为互不重叠的闭区间
+    ranges: List[tuple] = []
+    chunk_start: datetime = start
+    while chunk_start <= end:
+        chunk_end: datetime = chunk_start + timedelta(days=chunk_days)
+        ranges.append((chunk_start, min(chunk_end - timedelta(seconds=1), end)))
+        chunk_start = chunk_end
+
+    executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers)
+    futures: Deque[Future] = deque()
+
+    try:
+        for chunk_start, chunk_end in ranges:
+            futures.append(executor.submit(load_func, chunk_start, chunk_end))
+
+            if len(futures) >= max_workers:
+                yield futures.popleft().result()
+
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        # 提前停止迭代时取消尚未开始的任务
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def load_bar_chunks(
+    symbol: str,
+    exchange: Exchange,
+    interval: Interval,
+    start: datetime,
+    end: datetime,
+    chunk_days: int = 30,
+    max_workers: int = 4
+) -> Generator[List[BarData], None, None]:
+    """
+    分段并发读取数据库，按时间顺序逐段返回K线列表。
+
+    返回的就是数据库创建的BarData对象，不再做任何转换，用于逐K线回放的run_backtesting。
+    """
+    database: BaseDatabase = get_database()
+
+    def load_func(chunk_start: datetime, chunk_end: datetime) -> List[BarData]:
+        return database.load_bar_data(symbol, exchange, interval, chunk_start, chunk_end)
+
+    return load_chunks(load_func, start, end, chunk_days, max_workers)
+
+
+def load_array_chunks(
+    symbol: str,
+    exchange: Exchange,
+    interval: Interval,
+    start: datetime,
+    end: datetime,
+    chunk_days: int = 30,
+    max_workers: int = 4
+) -> Generator[Dict[str, ndarray], None, None]:
+    """
+    分段并发读取数据库，按时间顺序逐段返回和bars_to_arrays格式一致的K线数组。
+
+    在读取线程中完成转换，每段的BarData列表在返回前即可释放，
+    用于generate_signals等只需要数组的向量化计算。
+    """
+    database: BaseDatabase = get_database()
+
+    def load_func(chunk_start: datetime, chunk_end: datetime) -> Dict[str, ndarray]:
+        bars: List[BarData] = database.load_bar_data(symbol, exchange, interval, chunk_start, chunk_end)
+        return bars_to_arrays(bars)
+
+    return load_chunks(load_func, start, end, chunk_days, max_workers)
+
+
+def run_backtesting(engine: BacktestingEngine, chunk_days: int = 30, max_workers: int = 4) -> None:
+    """
+    边加载边回放的K线回测，替代BacktestingEngine的load_data和run_backtesting。
+
+    历史数据由load_bar_chunks分段并发读取，回放当前段时后续各段仍在加载，
+    回放过的K线不会保留在history_data中。
+    """
+    if engine.mode != BacktestingMode.BAR:
+        engine.output("边加载边回放只支持K线模式")
+        return
+
+    if not engine.end:
+        engine.end = datetime.now()
+
+    engine.strategy.on_init()
+    engine.strategy.inited = True
+    engine.output("策略初始化完成")
+
+    engine.strategy.on_start()
+    engine.strategy.trading = True
+    engine.output("开始回放历史数据")
+
+    chunks: Generator[List[BarData], None, None] = load_bar_chunks(
+        engine.symbol,
+        engine.exchange,
+        engine.interval,
+        engine.start,
+        engine.end,
+        chunk_days,
+        max_workers
+    )
+
+    count: int = 0
+    for bars in chunks:
+        for bar in bars:
+            try:
+                engine.new_bar(bar)
+            except Exception:
+                engine.output("触发异常，回测终止")
+                engine.output(traceback.format_exc())
+                chunks.close()
+                return
+
+        count += len(bars)
+        if bars:
+            engine.output(f"回放进度：{bars[-1].datetime}，数据量：{count}")
+
+    engine.strategy.on_stop()
+    engine.output("历史数据回放结束")
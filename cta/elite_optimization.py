@@ -0,0 +1,291 @@
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, Generator, List, Tuple, Union
+
+import numpy as np
+from numpy import ndarray
+
+from vnpy.trader.constant import Exchange, Interval
+from vnpy.trader.database import DB_TZ
+from vnpy.trader.object import BarData
+from vnpy.trader.optimize import OptimizationSetting, check_optimization_setting
+from vnpy_ctastrategy.backtesting import BacktestingEngine, load_bar_data
+
+from elite_cache import BarCache
+from elite_utility import BAR_FIELDS, bars_to_arrays
+
+
+# 优先使用内存文件系统保存共享数据
+SHARED_FOLDER: str = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# 工作进程中以内存映射方式打开的K线数组
+worker_arrays: Dict[str, ndarray] = {}
+
+
+def save_arrays(path: Path, arrays: Dict[str, ndarray]) -> None:
+    """将K线数组逐字段保存为npy文件"""
+    for name, array in arrays.items():
+        np.save(path.joinpath(name + ".npy"), array)
+
+
+def load_arrays(path: Path) -> Dict[str, ndarray]:
+    """以内存映射方式只读打开K线数组，多个进程共享同一份物理内存"""
+    return {
+        name: np.load(path.joinpath(name + ".npy"), mmap_mode="r")
+        for name in ["datetime"] + BAR_FIELDS
+    }
+
+
+class BarSequence:
+    """
+    基于K线数组的只读序列，切片时才创建BarData对象。
+
+    用于替代BacktestingEngine的history_data，回放时每次只生成一批K线。
+    """
+
+    def __init__(
+        self,
+        arrays: Dict[str, ndarray],
+        symbol: str,
+        exchange: Exchange,
+        interval: Interval,
+        start: int = 0,
+        end: int = None
+    ) -> None:
+        """构造函数，只使用数组中[start, end)范围内的数据"""
+        self.arrays: Dict[str, ndarray] = arrays
+        self.symbol: str = symbol
+        self.exchange: Exchange = exchange
+        self.interval: Interval = interval
+        self.start: int = start
+        self.end: int = len(arrays["datetime"]) if end is None else end
+
+    def __len__(self) -> int:
+        """K线数量"""
+        return self.end - self.start
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[BarData, List[BarData]]:
+        """按位置或切片读取K线"""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.create_bars(self.start + start, self.start + stop, step)
+
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("BarSequence index out of range")
+
+        return self.create_bars(self.start + key, self.start + key + 1)[0]
+
+    def create_bars(self, start: int, end: int, step: int = 1) -> List[BarData]:
+        """创建指定范围内的K线对象"""
+        arrays: Dict[str, ndarray] = self.arrays
+        dts: List[datetime] = arrays["datetime"][start:end:step].tolist()
+        columns: List[list] = [arrays[name][start:end:step].tolist() for name in BAR_FIELDS]
+
+        bars: List[BarData] = []
+        for dt, open_price, high_price, low_price, close_price, volume, turnover, open_interest in zip(dts, *columns):
+            bar: BarData = BarData(
+                symbol=self.symbol,
+                exchange=self.exchange,
+                datetime=dt.replace(tzinfo=DB_TZ),
+                interval=self.interval,
+                open_price=open_price,
+                high_price=high_price,
+                low_price=low_price,
+                close_price=close_price,
+                volume=volume,
+                turnover=turnover,
+                open_interest=open_interest,
+                gateway_name="DB"
+            )
+            bars.append(bar)
+
+        return bars
+
+
+def get_index(arrays: Dict[str, ndarray], dt: datetime, side: str = "left") -> int:
+    """查找时间在K线数组中的位置"""
+    value: np.datetime64 = np.datetime64(dt.replace(tzinfo=None), "m")
+    return int(np.searchsorted(arrays["datetime"], value, side=side))
+
+
+def init_worker(path: str) -> None:
+    """工作进程初始化，打开共享的K线数组"""
+    worker_arrays.update(load_arrays(Path(path)))
+
+
+def get_init_days(strategy_class: type, parameters: dict, settings: List[dict]) -> int:
+    """执行各组参数的策略初始化但不提供数据，记录策略通过load_bar请求的最大天数"""
+    init_days: List[int] = [0]
+
+    def load_bar(
+        vt_symbol: str,
+        days: int,
+        interval: Interval,
+        callback: Callable,
+        use_database: bool
+    ) -> List[BarData]:
+        """只记录请求的天数"""
+        init_days.append(days)
+        return []
+
+    for setting in settings:
+        engine: BacktestingEngine = BacktestingEngine()
+        engine.output = lambda msg: None
+
+        engine.set_parameters(**parameters)
+        engine.add_strategy(strategy_class, setting)
+        engine.load_bar = load_bar
+
+        engine.strategy.on_init()
+
+    return max(init_days)
+
+
+def evaluate(
+    target_name: str,
+    strategy_class: type,
+    parameters: dict,
+    setting: dict,
+    init_days: int
+) -> Tuple[dict, float, dict]:
+    """在工作进程中运行一次回测，历史数据和回测开始前init_days天的初始化数据都读取共享的K线数组"""
+    engine: BacktestingEngine = BacktestingEngine()
+    engine.output = lambda msg: None
+
+    engine.set_parameters(**parameters)
+    engine.add_strategy(strategy_class, setting)
+
+    arrays: Dict[str, ndarray] = worker_arrays
+    start: int = get_index(arrays, engine.start)
+    end: int = get_index(arrays, engine.end, "right")
+
+    engine.history_data = BarSequence(
+        arrays, engine.symbol, engine.exchange, engine.interval, start, end
+    )
+
+    def load_bar(
+        vt_symbol: str,
+        days: int,
+        interval: Interval,
+        callback: Callable,
+        use_database: bool
+    ) -> List[BarData]:
+        """策略初始化时读取回测开始前days天的数据"""
+        # 共享数组中的初始化数据不足时直接报错，避免静默地减少初始化数据
+        if days > init_days:
+            raise ValueError(f"策略初始化需要{days}天数据，超过了预加载的{init_days}天")
+
+        init_start: int = get_index(arrays, engine.start - timedelta(days=days))
+        return BarSequence(arrays, engine.symbol, engine.exchange, interval, init_start, start)[:]
+
+    engine.load_bar = load_bar
+
+    engine.run_backtesting()
+    engine.calculate_result()
+    statistics: dict = engine.calculate_statistics(output=False)
+
+    target_value: float = statistics.get(target_name, 0)
+    return (setting, target_value, statistics)
+
+
+def run_optimization(
+    engine: BacktestingEngine,
+    optimization_setting: OptimizationSetting,
+    init_days: int = None,
+    max_workers: int = None,
+    bar_cache: BarCache = None
+) -> Generator[Tuple[dict, float, dict], None, None]:
+    """
+    多进程穷举优化，历史数据只从数据库加载一次。
+
+    engine需要已经设置好回测参数并添加策略，init_days为预加载的初始化天数，
+    默认按各组参数执行一次策略初始化，取load_bar请求的最大天数，
+    传入的init_days小于策略需要的天数时报错，
+    数据保存为内存映射文件后由各工作进程共享，每完成一组参数就返回其结果，
+    结果和BacktestingEngine.run_bf_optimization一样为(参数, 目标值, 统计指标)，
+    传入bar_cache时从本地缓存读取K线数组。
+    """
+    if not check_optimization_setting(optimization_setting):
+        return
+
+    settings: List[dict] = optimization_setting.generate_settings()
+    engine.output(f"参数优化空间：{len(settings)}")
+
+    parameters: dict = {
+        "vt_symbol": engine.vt_symbol,
+        "interval": engine.interval,
+        "start": engine.start,
+        "end": engine.end,
+        "rate": engine.rate,
+        "slippage": engine.slippage,
+        "size": engine.size,
+        "pricetick": engine.pricetick,
+        "capital": engine.capital,
+        "mode": engine.mode,
+        "risk_free": engine.risk_free,
+        "annual_days": engine.annual_days,
+        "half_life": engine.half_life
+    }
+
+    # 初始化数据的天数由策略决定，预加载不足时回测结果会和逐个回测不同
+    required_days: int = get_init_days(engine.strategy_class, parameters, settings)
+    if init_days is None:
+        init_days = required_days
+    elif init_days < required_days:
+        raise ValueError(f"策略初始化需要{required_days}天数据，init_days只有{init_days}天")
+
+    # 一次性加载包含初始化数据在内的全部K线
+    if bar_cache:
+        arrays: Dict[str, ndarray] = bar_cache.load_arrays(
+            engine.symbol,
+            engine.exchange,
+            engine.interval,
+            engine.start - timedelta(days=init_days),
+            engine.end
+        )
+    else:
+        bars: List[BarData] = load_bar_data(
+            engine.symbol,
+            engine.exchange,
+            engine.interval,
+            engine.start - timedelta(days=init_days),
+            engine.end
+        )
+        arrays = bars_to_arrays(bars)
+        del bars
+
+    with TemporaryDirectory(dir=SHARED_FOLDER) as path:
+        save_arrays(Path(path), arrays)
+        del arrays
+
+        executor: ProcessPoolExecutor = ProcessPoolExecutor(
+            max_workers,
+            mp_context=get_context("spawn"),
+            initializer=init_worker,
+            initargs=(path,)
+        )
+
+        try:
+            futures: List[Future] = [
+                executor.submit(
+                    evaluate,
+                    optimization_setting.target_name,
+                    engine.strategy_class,
+                    parameters,
+                    setting,
+                    init_days
+                )
+                for setting in settings
+            ]
+
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # 提前停止迭代时取消尚未开始的任务
+            executor.shutdown(cancel_futures=True)
@@ -0,0 +1,817 @@
+import re
+from collections import deque
+from datetime import date, datetime, time, timedelta
+from math import isnan, nan
+from typing import Callable, Deque, Dict, List, Tuple, Union
+
+import numpy as np
+from numpy import ndarray
+
+from vnpy.trader.constant import Interval
+from vnpy.trader.object import BarData
+from vnpy.trader.utility import BarGenerator, extract_vt_symbol
+
+
+NIGHT_START: time = time(20, 0)     # 此时间之后的K线属于夜盘
+NIGHT_END: time = time(8, 0)        # 此时间之前的K线属于跨越零点的夜盘
+
+
+def is_night(dt: datetime) -> bool:
+    """是否为夜盘时段"""
+    t: time = dt.time()
+    return t >= NIGHT_START or t < NIGHT_END
+
+
+def is_new_trading_day(last_dt: datetime, dt: datetime) -> bool:
+    """判断前后两根K线之间是否切换了交易日"""
+    # 夜盘开盘时切换，夜盘中途跨越零点不切换，间隔过长说明中间缺少了日盘
+    if is_night(dt):
+        return not is_night(last_dt) or dt - last_dt > timedelta(hours=12)
+
+    # 日盘延续前一晚的夜盘，没有夜盘时按自然日切换
+    return not is_night(last_dt) and dt.date() != last_dt.date()
+
+
+class BarAccumulator:
+    """K线合成的累加器，原地更新，推送时才创建BarData"""
+
+    __slots__ = (
+        "datetime",
+        "open_price",
+        "high_price",
+        "low_price",
+        "close_price",
+        "volume",
+        "turnover",
+        "open_interest",
+        "count"
+    )
+
+    def __init__(self) -> None:
+        """构造函数"""
+        self.datetime: datetime = None
+        self.open_price: float = 0
+        self.high_price: float = 0
+        self.low_price: float = 0
+        self.close_price: float = 0
+        self.volume: float = 0
+        self.turnover: float = 0
+        self.open_interest: float = 0
+        self.count: int = 0
+
+    def start(self, bar: BarData, dt: datetime) -> None:
+        """用第一根K线开始新的合成，bar也可以是另一个累加器"""
+        self.datetime = dt
+        self.open_price = bar.open_price
+        self.high_price = bar.high_price
+        self.low_price = bar.low_price
+        self.close_price = bar.close_price
+        self.volume = bar.volume
+        self.turnover = bar.turnover
+        self.open_interest = bar.open_interest
+        self.count = 1
+
+    def update(self, bar: BarData) -> None:
+        """合并一根K线"""
+        if bar.high_price > self.high_price:
+            self.high_price = bar.high_price
+        if bar.low_price < self.low_price:
+            self.low_price = bar.low_price
+
+        self.close_price = bar.close_price
+        self.volume += bar.volume
+        self.turnover += bar.turnover
+        self.open_interest = bar.open_interest
+        self.count += 1
+
+    def to_bar(self, template: BarData) -> BarData:
+        """生成K线对象，代码等信息取自template"""
+        return BarData(
+            symbol=template.symbol,
+            exchange=template.exchange,
+            datetime=self.datetime,
+            interval=Interval.DAILY,
+            gateway_name=template.gateway_name,
+            open_price=self.open_price,
+            high_price=self.high_price,
+            low_price=self.low_price,
+            close_price=self.close_price,
+            volume=self.volume,
+            turnover=self.turnover,
+            open_interest=self.open_interest
+        )
+
+
+class DailyBarGenerator(BarGenerator):
+    """
+    按交易日合成日K线，并进一步合成N日K线。
+
+    夜盘K线归属下一个交易日，日K线的时间为日盘所在的日期。
+    传入size时额外开启数组模式，合成完成的K线直接写入预分配的数组。
+    """
+
+    def __init__(
+        self,
+        on_bar: Callable,
+        window: int = 1,
+        on_window_bar: Callable = None,
+        interval: Interval = Interval.MINUTE,
+        size: int = 0
+    ) -> None:
+        """构造函数"""
+        super().__init__(on_bar, window, on_window_bar, interval)
+
+        self.last_bar: BarData = None
+        self.daily_acc: BarAccumulator = BarAccumulator()
+        self.window_acc: BarAccumulator = BarAccumulator()
+        self.day_started: bool = False      # 当前交易日是否已有日盘K线
+
+        # 数组模式，有效数据为前count个
+        self.count: int = 0
+        self.size: int = size
+        if size:
+            self.datetime_array: ndarray = np.empty(size, dtype="datetime64[D]")
+            self.open_array: ndarray = np.zeros(size)
+            self.high_array: ndarray = np.zeros(size)
+            self.low_array: ndarray = np.zeros(size)
+            self.close_array: ndarray = np.zeros(size)
+            self.volume_array: ndarray = np.zeros(size)
+            self.turnover_array: ndarray = np.zeros(size)
+            self.open_interest_array: ndarray = np.zeros(size)
+
+    def update_bar(self, bar: BarData) -> None:
+        """分钟K线推送"""
+        daily_acc: BarAccumulator = self.daily_acc
+
+        if not self.last_bar:
+            self.start_day(bar)
+        elif is_new_trading_day(self.last_bar.datetime, bar.datetime):
+            self.update_daily()
+            self.start_day(bar)
+        else:
+            daily_acc.update(bar)
+
+            # 夜盘开始的交易日，以第一根日盘K线的日期作为交易日
+            if not self.day_started and not is_night(bar.datetime):
+                daily_acc.datetime = get_date(bar.datetime)
+                self.day_started = True
+
+        self.last_bar = bar
+
+    def start_day(self, bar: BarData) -> None:
+        """开始合成新交易日的日K线"""
+        self.daily_acc.start(bar, get_date(bar.datetime))
+        self.day_started = not is_night(bar.datetime)
+
+    def update_daily(self) -> None:
+        """日K线完成，合成N日K线"""
+        if not self.window_acc.count:
+            self.window_acc.start(self.daily_acc, self.daily_acc.datetime)
+        else:
+            self.window_acc.update(self.daily_acc)
+
+        if self.window_acc.count < self.window:
+            return
+
+        if self.size:
+            self.append_array(self.window_acc)
+
+        if self.on_window_bar:
+            self.on_window_bar(self.window_acc.to_bar(self.last_bar))
+
+        self.window_acc.count = 0
+
+    def append_array(self, acc: BarAccumulator) -> None:
+        """写入数组，容量不足时扩容一倍"""
+        if self.count == self.size:
+            self.size *= 2
+            for name in [
+                "datetime_array",
+                "open_array",
+                "high_array",
+                "low_array",
+                "close_array",
+                "volume_array",
+                "turnover_array",
+                "open_interest_array"
+            ]:
+                old: ndarray = getattr(self, name)
+                new: ndarray = np.zeros(self.size, dtype=old.dtype)
+                new[:self.count] = old
+                setattr(self, name, new)
+
+        i: int = self.count
+        self.datetime_array[i] = acc.datetime.date()
+        self.open_array[i] = acc.open_price
+        self.high_array[i] = acc.high_price
+        self.low_array[i] = acc.low_price
+        self.close_array[i] = acc.close_price
+        self.volume_array[i] = acc.volume
+        self.turnover_array[i] = acc.turnover
+        self.open_interest_array[i] = acc.open_interest
+        self.count += 1
+
+
+def get_date(dt: datetime) -> datetime:
+    """去掉时间部分，只保留日期"""
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+# 日盘收盘时间，未列出的品种按15:00收盘
+DAY_END: time = time(15, 0)
+
+PRODUCT_DAY_END: Dict[str, time] = {
+    "T": time(15, 15),      # 10年期国债期货
+    "TF": time(15, 15),     # 5年期国债期货
+    "TS": time(15, 15),     # 2年期国债期货
+    "TL": time(15, 15),     # 30年期国债期货
+}
+
+
+def get_day_end(vt_symbol: str) -> time:
+    """查询合约的日盘收盘时间"""
+    symbol, _ = extract_vt_symbol(vt_symbol)
+    product: str = re.match(r"[a-zA-Z]*", symbol).group().upper()
+    return PRODUCT_DAY_END.get(product, DAY_END)
+
+
+def get_close_time(vt_symbol: str, window: int = 1) -> time:
+    """日盘收盘K线的开始时间，window为K线包含的分钟数"""
+    day_end: time = get_day_end(vt_symbol) if vt_symbol else DAY_END
+    return (datetime.combine(date.min, day_end) - timedelta(minutes=window)).time()
+
+
+class TradingDaySeries:
+    """
+    按交易日分段保存K线数据，夜盘K线归属下一个交易日。
+
+    当天和前一交易日的数据各自存放在一块预分配的数组中，新交易日时交换两块数组，
+    因此每个交易日的数据都是一段连续内存，可以无拷贝地返回数组视图。
+    收盘时间由合约所属品种的收盘时间表决定，收盘K线更新后调用on_close回调。
+    """
+
+    def __init__(
+        self,
+        vt_symbol: str,
+        window: int = 1,
+        on_close: Callable = None,
+        size: int = 600
+    ) -> None:
+        """构造函数，window为推送K线包含的分钟数"""
+        self.close_time: time = get_close_time(vt_symbol, window)
+        self.on_close: Callable = on_close
+
+        self.last_bar: BarData = None
+        self.closed: bool = False       # 最新K线是否为当天收盘K线
+
+        # 依次为开高低收、成交量、成交额、持仓量
+        self.buffer: ndarray = np.zeros((7, size))
+        self.count: int = 0
+        self.previous_buffer: ndarray = np.zeros((7, size))
+        self.previous_count: int = 0
+
+    def update_bar(self, bar: BarData) -> None:
+        """更新K线"""
+        if self.last_bar and is_new_trading_day(self.last_bar.datetime, bar.datetime):
+            self.buffer, self.previous_buffer = self.previous_buffer, self.buffer
+            self.previous_count = self.count
+            self.count = 0
+
+        # 容量不足时扩容一倍
+        if self.count == self.buffer.shape[1]:
+            buffer: ndarray = np.zeros((7, self.count * 2))
+            buffer[:, :self.count] = self.buffer
+            self.buffer = buffer
+
+        self.buffer[:, self.count] = (
+            bar.open_price,
+            bar.high_price,
+            bar.low_price,
+            bar.close_price,
+            bar.volume,
+            bar.turnover,
+            bar.open_interest
+        )
+        self.count += 1
+        self.last_bar = bar
+
+        # K线结束时间到达日盘收盘时间即为收盘K线
+        self.closed = bar.datetime.time() == self.close_time
+        if self.closed and self.on_close:
+            self.on_close(bar)
+
+    @property
+    def inited(self) -> bool:
+        """是否已有前一交易日的数据"""
+        return self.previous_count > 0
+
+    @property
+    def open_array(self) -> ndarray:
+        """当天开盘价序列"""
+        return self.buffer[0, :self.count]
+
+    @property
+    def high_array(self) -> ndarray:
+        """当天最高价序列"""
+        return self.buffer[1, :self.count]
+
+    @property
+    def low_array(self) -> ndarray:
+        """当天最低价序列"""
+        return self.buffer[2, :self.count]
+
+    @property
+    def close_array(self) -> ndarray:
+        """当天收盘价序列"""
+        return self.buffer[3, :self.count]
+
+    @property
+    def volume_array(self) -> ndarray:
+        """当天成交量序列"""
+        return self.buffer[4, :self.count]
+
+    @property
+    def turnover_array(self) -> ndarray:
+        """当天成交额序列"""
+        return self.buffer[5, :self.count]
+
+    @property
+    def open_interest_array(self) -> ndarray:
+        """当天持仓量序列"""
+        return self.buffer[6, :self.count]
+
+    @property
+    def previous_close_array(self) -> ndarray:
+        """前一交易日收盘价序列"""
+        return self.previous_buffer[3, :self.previous_count]
+
+    @property
+    def previous_open_interest_array(self) -> ndarray:
+        """前一交易日持仓量序列"""
+        return self.previous_buffer[6, :self.previous_count]
+
+
+class SmaIndicator:
+    """增量计算简单移动平均，累加顺序与talib.SMA一致"""
+
+    lookback_offset: int = -1
+
+    def __init__(self, window: int) -> None:
+        """构造函数"""
+        self.window: int = window
+        self.values: Deque[float] = deque()
+        self.total: float = 0
+
+    def update_bar(self, bar: BarData) -> float:
+        """用K线收盘价更新"""
+        return self.update(bar.close_price)
+
+    def update(self, value: float) -> float:
+        """写入新数据，返回最新的均值，数据不足时为nan"""
+        self.values.append(value)
+        self.total += value
+
+        if len(self.values) < self.window:
+            return nan
+
+        result: float = self.total / self.window
+        self.total -= self.values.popleft()
+        return result
+
+
+class WmaIndicator:
+    """增量计算线性加权移动平均，递推方式与talib.WMA一致"""
+
+    lookback_offset: int = -1
+
+    def __init__(self, window: int) -> None:
+        """构造函数"""
+        self.window: int = window
+        self.divider: int = window * (window + 1) // 2
+        self.values: Deque[float] = deque()
+
+        self.period_sum: float = 0      # 加权和
+        self.period_sub: float = 0      # 窗口内数值之和
+        self.trailing_value: float = 0  # 即将移出窗口的数值
+        self.count: int = 0             # 距离上次重新求和的K线数量
+
+    def update_bar(self, bar: BarData) -> float:
+        """用K线收盘价更新"""
+        return self.update(bar.close_price)
+
+    def update(self, value: float) -> float:
+        """写入新数据，返回最新的加权均值，数据不足时为nan"""
+        if self.window == 1:
+            return value
+
+        self.values.append(value)
+
+        if len(self.values) < self.window:
+            self.period_sub += value
+            self.period_sum += value * len(self.values)
+            return nan
+
+        self.period_sub += value
+        self.period_sub -= self.trailing_value
+        self.period_sum += value * self.window
+        self.trailing_value = self.values.popleft()
+
+        result: float = self.period_sum / self.divider
+        self.period_sum -= self.period_sub
+
+        # 每经过一个窗口用缓存重新求和，避免递推的累计误差
+        self.count += 1
+        if self.count == self.window:
+            self.count = 0
+            self.period_sub = sum(self.values) + self.trailing_value
+            self.period_sum = sum(i * v for i, v in enumerate(self.values, 1))
+
+        return result
+
+
+class EmaIndicator:
+    """增量计算指数移动平均，以前window个数值的均值作为初值，与talib.EMA一致"""
+
+    lookback_offset: int = -1
+
+    def __init__(self, window: int) -> None:
+        """构造函数"""
+        self.window: int = window
+        self.k: float = 2 / (window + 1)
+        self.count: int = 0
+        self.value: float = nan
+
+    def update_bar(self, bar: BarData) -> float:
+        """用K线收盘价更新"""
+        return self.update(bar.close_price)
+
+    def update(self, value: float) -> float:
+        """写入新数据，返回最新的EMA，数据不足时为nan"""
+        self.count += 1
+
+        if self.count < self.window:
+            self.value = value if self.count == 1 else self.value + value
+            return nan
+        elif self.count == self.window:
+            self.value = (self.value + value) / self.window if self.window > 1 else value
+        else:
+            self.value = (value - self.value) * self.k + self.value
+
+        return self.value
+
+
+class AtrIndicator:
+    """增量计算平均真实波幅，以前window个真实波幅的均值作为初值，与talib.ATR一致"""
+
+    lookback_offset: int = 0
+
+    def __init__(self, window: int) -> None:
+        """构造函数"""
+        self.window: int = window
+        self.pre_close: float = nan
+        self.count: int = 0
+        self.value: float = nan
+
+    def update_bar(self, bar: BarData) -> float:
+        """用K线最高价、最低价和收盘价更新"""
+        return self.update(bar.high_price, bar.low_price, bar.close_price)
+
+    def update(self, high: float, low: float, close: float) -> float:
+        """写入新K线，返回最新的ATR，数据不足时为nan"""
+        pre_close: float = self.pre_close
+        self.pre_close = close
+
+        # 第一根K线没有前收盘价，无法计算真实波幅
+        if isnan(pre_close):
+            return nan
+
+        tr: float = max(high - low, abs(pre_close - high), abs(pre_close - low))
+        if self.window <= 1:
+            return tr
+
+        self.count += 1
+        if self.count < self.window:
+            self.value = tr if self.count == 1 else self.value + tr
+            return nan
+        elif self.count == self.window:
+            self.value = (self.value + tr) / self.window
+        else:
+            self.value = (self.value * (self.window - 1) + tr) / self.window
+
+        return self.value
+
+
+class StreamingArrayManager:
+    """
+    增量计算技术指标的K线序列管理器，接口和ArrayManager保持一致。
+
+    指标需要在构造后先注册，此后每根K线只做O(1)的递推更新。
+    K线数据和各指标最近size个数值保存在环形缓存中，每个数值同时写入两处，
+    因此最近size个数值始终是一段连续内存，可以无拷贝地返回数组视图。
+    """
+
+    def __init__(self, size: int = 2) -> None:
+        """构造函数"""
+        self.count: int = 0
+        self.size: int = size
+        self.inited: bool = False
+        self.init_count: int = size     # 所有数组都填满有效数值所需的K线数量
+        self.index: int = 0             # 下一个写入位置
+
+        # 依次为开高低收、成交量、成交额、持仓量
+        self.bar_buffer: ndarray = np.zeros((7, size * 2))
+
+        # 已注册的指标，以(名称, 窗口)为键记录其在结果缓存中的行号
+        self.indicators: List[object] = []
+        self.indicator_rows: Dict[Tuple[str, int], int] = {}
+        self.result_buffer: ndarray = np.zeros((0, size * 2))
+
+    def add_sma(self, n: int) -> None:
+        """注册简单移动平均"""
+        self.add_indicator(("sma", n), SmaIndicator(n))
+
+    def add_wma(self, n: int) -> None:
+        """注册线性加权移动平均"""
+        self.add_indicator(("wma", n), WmaIndicator(n))
+
+    def add_ema(self, n: int) -> None:
+        """注册指数移动平均"""
+        self.add_indicator(("ema", n), EmaIndicator(n))
+
+    def add_atr(self, n: int) -> None:
+        """注册平均真实波幅"""
+        self.add_indicator(("atr", n), AtrIndicator(n))
+
+    def add_indicator(self, key: Tuple[str, int], indicator: object) -> None:
+        """注册指标，必须在推送K线之前调用"""
+        if key in self.indicator_rows:
+            return
+
+        self.indicator_rows[key] = len(self.indicators)
+        self.indicators.append(indicator)
+        self.result_buffer = np.full((len(self.indicators), self.size * 2), nan)
+
+        lookback: int = key[1] + indicator.lookback_offset
+        self.init_count = max(self.init_count, lookback + self.size)
+
+    def update_bar(self, bar: BarData) -> None:
+        """更新K线，递推计算所有已注册的指标"""
+        self.count += 1
+        if not self.inited and self.count >= self.init_count:
+            self.inited = True
+
+        values: Tuple[float, ...] = (
+            bar.open_price,
+            bar.high_price,
+            bar.low_price,
+            bar.close_price,
+            bar.volume,
+            bar.turnover,
+            bar.open_interest
+        )
+        i: int = self.index
+        self.bar_buffer[:, i] = values
+        self.bar_buffer[:, i + self.size] = values
+
+        if self.indicators:
+            results: List[float] = [
+                indicator.update_bar(bar) for indicator in self.indicators
+            ]
+            self.result_buffer[:, i] = results
+            self.result_buffer[:, i + self.size] = results
+
+        self.index = (i + 1) % self.size
+
+    def get_array(self, buffer: ndarray, row: int) -> ndarray:
+        """按时间先后排列的最近size个数值"""
+        return buffer[row, self.index:self.index + self.size]
+
+    @property
+    def open_array(self) -> ndarray:
+        """开盘价序列"""
+        return self.get_array(self.bar_buffer, 0)
+
+    @property
+    def high_array(self) -> ndarray:
+        """最高价序列"""
+        return self.get_array(self.bar_buffer, 1)
+
+    @property
+    def low_array(self) -> ndarray:
+        """最低价序列"""
+        return self.get_array(self.bar_buffer, 2)
+
+    @property
+    def close_array(self) -> ndarray:
+        """收盘价序列"""
+        return self.get_array(self.bar_buffer, 3)
+
+    @property
+    def volume_array(self) -> ndarray:
+        """成交量序列"""
+        return self.get_array(self.bar_buffer, 4)
+
+    @property
+    def turnover_array(self) -> ndarray:
+        """成交额序列"""
+        return self.get_array(self.bar_buffer, 5)
+
+    @property
+    def open_interest_array(self) -> ndarray:
+        """持仓量序列"""
+        return self.get_array(self.bar_buffer, 6)
+
+    def get_result(self, key: Tuple[str, int], array: bool) -> Union[float, ndarray]:
+        """读取已注册指标的结果"""
+        result: ndarray = self.get_array(self.result_buffer, self.indicator_rows[key])
+        if array:
+            return result
+        return result[-1]
+
+    def sma(self, n: int, array: bool = False) -> Union[float, ndarray]:
+        """简单移动平均"""
+        return self.get_result(("sma", n), array)
+
+    def wma(self, n: int, array: bool = False) -> Union[float, ndarray]:
+        """线性加权移动平均"""
+        return self.get_result(("wma", n), array)
+
+    def ema(self, n: int, array: bool = False) -> Union[float, ndarray]:
+        """指数移动平均"""
+        return self.get_result(("ema", n), array)
+
+    def atr(self, n: int, array: bool = False) -> Union[float, ndarray]:
+        """平均真实波幅"""
+        return self.get_result(("atr", n), array)
+
+
+# 向量化计算使用的K线字段，和BarData的属性名一致
+BAR_FIELDS: List[str] = [
+    "open_price",
+    "high_price",
+    "low_price",
+    "close_price",
+    "volume",
+    "turnover",
+    "open_interest"
+]
+
+
+def bars_to_arrays(bars: List[BarData]) -> Dict[str, ndarray]:
+    """将K线列表转换为按字段保存的数组，时间为不带时区的datetime64"""
+    arrays: Dict[str, ndarray] = {
+        "datetime": np.array(
+            [bar.datetime.replace(tzinfo=None) for bar in bars],
+            dtype="datetime64[m]"
+        )
+    }
+
+    for name in BAR_FIELDS:
+        arrays[name] = np.array([getattr(bar, name) for bar in bars], dtype=float)
+
+    return arrays
+
+
+def get_setting(strategy_class: type, params: dict) -> dict:
+    """读取策略参数，params中未给出的参数使用策略类的默认值，没有默认值时为None"""
+    return {
+        name: params.get(name, getattr(strategy_class, name, None))
+        for name in strategy_class.parameters
+    }
+
+
+def get_night_mask(datetime_array: ndarray) -> ndarray:
+    """每根K线是否为夜盘时段，与is_night一致"""
+    dt: ndarray = datetime_array.astype("datetime64[m]")
+    minutes: ndarray = (dt - dt.astype("datetime64[D]")).astype(int)
+
+    return (
+        (minutes >= NIGHT_START.hour * 60 + NIGHT_START.minute)
+        | (minutes < NIGHT_END.hour * 60 + NIGHT_END.minute)
+    )
+
+
+def get_trading_day(datetime_array: ndarray) -> ndarray:
+    """计算每根K线所属交易日的编号，切换规则与is_new_trading_day一致"""
+    if not len(datetime_array):
+        return np.zeros(0, dtype=int)
+
+    night: ndarray = get_night_mask(datetime_array)
+    last_night: ndarray = night[:-1]
+    gap: ndarray = np.diff(datetime_array) > np.timedelta64(12, "h")
+    date_array: ndarray = datetime_array.astype("datetime64[D]")
+    new_date: ndarray = date_array[1:] != date_array[:-1]
+
+    new_day: ndarray = np.ones(len(datetime_array), dtype=bool)
+    new_day[1:] = np.where(night[1:], ~last_night | gap, ~last_night & new_date)
+
+    return np.cumsum(new_day) - 1
+
+
+def get_day_start(day: ndarray) -> ndarray:
+    """每根K线所属交易日第一根K线的位置，day为非递减的交易日编号"""
+    position: ndarray = np.arange(len(day))
+    new_day: ndarray = np.r_[True, day[1:] != day[:-1]] if len(day) else day.astype(bool)
+    return np.maximum.accumulate(np.where(new_day, position, 0))
+
+
+def aggregate_arrays(arrays: Dict[str, ndarray], start: ndarray, end: int) -> Dict[str, ndarray]:
+    """将前end根K线按start给出的起始位置分组合成"""
+    result: Dict[str, ndarray] = {
+        "datetime": arrays["datetime"][start],
+        "open_price": arrays["open_price"][start],
+        "high_price": np.maximum.reduceat(arrays["high_price"][:end], start),
+        "low_price": np.minimum.reduceat(arrays["low_price"][:end], start),
+        "close_price": arrays["close_price"][:end][np.r_[start[1:], end] - 1],
+        "volume": np.add.reduceat(arrays["volume"][:end], start),
+        "turnover": np.add.reduceat(arrays["turnover"][:end], start),
+        "open_interest": arrays["open_interest"][:end][np.r_[start[1:], end] - 1],
+    }
+    return result
+
+
+def get_close_mask(datetime_array: ndarray, vt_symbol: str = "", window: int = 1) -> ndarray:
+    """每根K线是否为日盘收盘K线，与TradingDaySeries一致"""
+    close_time: time = get_close_time(vt_symbol, window)
+    minutes: ndarray = datetime_array.astype("datetime64[m]").astype(np.int64) % (24 * 60)
+    return minutes == close_time.hour * 60 + close_time.minute
+
+
+def generate_window_arrays(arrays: Dict[str, ndarray], window: int) -> Tuple[Dict[str, ndarray], ndarray]:
+    """
+    向量化合成N分钟K线，规则与BarGenerator一致。
+
+    返回合成的K线数组，以及每根N分钟K线推送时对应的一分钟K线位置，
+    数据末尾尚未走完的窗口不会推送。
+    """
+    minute: ndarray = arrays["datetime"].astype("datetime64[m]").astype(np.int64) % 60
+    index: ndarray = np.flatnonzero((minute + 1) % window == 0)
+
+    if not len(index):
+        return {name: arrays[name][:0] for name in arrays}, index
+
+    start: ndarray = np.r_[0, index[:-1] + 1]
+    return aggregate_arrays(arrays, start, index[-1] + 1), index
+
+
+def generate_daily_arrays(arrays: Dict[str, ndarray], window: int = 1) -> Tuple[Dict[str, ndarray], ndarray]:
+    """
+    向量化合成N日K线，规则与DailyBarGenerator一致。
+
+    返回合成的K线数组，以及每根K线推送时对应的一分钟K线位置，
+    即下一个交易日的第一根K线，最后一个交易日尚未完成不会推送。
+    """
+    datetime_array: ndarray = arrays["datetime"]
+    day: ndarray = get_trading_day(datetime_array)
+    day_start: ndarray = np.flatnonzero(np.r_[True, day[1:] != day[:-1]]) if len(day) else day
+
+    count: int = (len(day_start) - 1) // window * window
+    if count <= 0:
+        return {name: arrays[name][:0] for name in arrays}, np.zeros(0, dtype=int)
+
+    start: ndarray = day_start[:count:window]
+    index: ndarray = day_start[window:count + 1:window]
+    result: Dict[str, ndarray] = aggregate_arrays(arrays, start, index[-1])
+
+    # 以交易日第一根日盘K线的日期作为K线日期，没有日盘时使用第一根K线的日期
+    night: ndarray = get_night_mask(datetime_array[:index[-1]])
+    position: ndarray = np.where(night, len(night), np.arange(len(night)))
+    day_end: ndarray = np.r_[day_start[1:count], index[-1]]
+    first_day: ndarray = np.minimum.reduceat(position, day_start[:count])
+    first_day = np.where(first_day < day_end, first_day, day_start[:count])
+
+    result["datetime"] = datetime_array[first_day[::window]].astype("datetime64[D]")
+    return result, index
+
+
+def generate_position(n: int, index: ndarray, signal: ndarray, size: Union[float, ndarray] = 1) -> ndarray:
+    """
+    将信号转换为一分钟K线的持仓序列。
+
+    signal为在index位置的K线上发出的信号，1为做多、-1为做空、0为不操作，
+    已持有同方向仓位时忽略信号，反向时先平后开，委托在下一根K线成交，
+    size为开仓数量，可以是和signal等长的数组。
+    """
+    signal = np.asarray(signal)
+    selected: ndarray = np.flatnonzero(signal)
+    direction: ndarray = signal[selected]
+
+    # 连续的同方向信号只有第一个会开仓
+    keep: ndarray = np.ones(len(selected), dtype=bool)
+    keep[1:] = direction[1:] != direction[:-1]
+    selected = selected[keep]
+
+    if isinstance(size, ndarray):
+        size = size[selected]
+    target: ndarray = signal[selected] * size
+
+    fill: ndarray = index[selected] + 1
+    valid: ndarray = fill < n
+
+    position: ndarray = np.zeros(n)
+    position[fill[valid]] = target[valid]
+
+    # 向前填充到下一次成交
+    last: ndarray = np.zeros(n, dtype=int)
+    last[fill[valid]] = fill[valid]
+    return position[np.maximum.accumulate(last)]
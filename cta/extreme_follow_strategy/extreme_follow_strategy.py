@@ -1,3 +1,8 @@
+from typing import Dict
+
+import numpy as np
+from numpy import ndarray
+
 from vnpy_ctastrategy import (
     CtaTemplate,
     CtaEngine,
@@ -7,9 +12,28 @@ from vnpy_ctastrategy import (
     TradeData,
     OrderData,
     BarGenerator,
-    ArrayManager,
 )
 
+# 实盘时以strategies.<模块名>导入，elite_utility需复制到同一目录
+try:
+    from .elite_utility import (
+        TradingDaySeries,
+        generate_position,
+        generate_window_arrays,
+        get_day_start,
+        get_setting,
+        get_trading_day
+    )
+except ImportError:
+    from elite_utility import (
+        TradingDaySeries,
+        generate_position,
+        generate_window_arrays,
+        get_day_start,
+        get_setting,
+        get_trading_day
+    )
+
 
 class ExtremeFollowStrategy(CtaTemplate):
     """极值跟随策略"""
@@ -43,9 +67,8 @@ class ExtremeFollowStrategy(CtaTemplate):
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
         self.bg = BarGenerator(self.on_bar, self.window, self.on_window_bar)
-        self.am = ArrayManager()
-
-        self.last_bar: BarData = None
+        self.series = TradingDaySeries(self.vt_symbol, self.window)
+        self.extreme = IntradayExtreme(self.extreme_window)
 
     def on_init(self) -> None:
         """初始化"""
@@ -72,47 +95,29 @@ class ExtremeFollowStrategy(CtaTemplate):
 
     def on_window_bar(self, bar: BarData) -> None:
         """N分钟K线推送"""
-        # 更新到ArrayManager
-        am: ArrayManager = self.am
-        am.update_bar(bar)
-        if not am.inited:
-            return
-
-        # 新的一天做个初始化，count设置为1
-        if not self.last_bar or self.last_bar.datetime.day != bar.datetime.day:
-            self.bar_count = 1
-        # 不是新的一天。那么先检验是否到了计算信号的要求
-        else:
-            # 更新今日K线数量统计
-            self.bar_count += 1
-
-            # 当天开盘已经经过了一定数量的K线，满足计算信号的要求
-            if self.bar_count > self.min_count:
-                # 计算时序数组切片索引
-                start: int = -self.bar_count
-                end: int = -self.bar_count + max(self.bar_count - self.extreme_window, 1)
-
-                # 计算极大值和极小值
-                high_extreme: float = am.high_array[start:end].max()
-                low_extreme: float = am.low_array[start:end].min()
-
-                if bar.close_price > high_extreme:  # 买
-                    price: float = bar.close_price + self.price_add
-                    if not self.pos:
-                        self.buy(price, self.fixed_size)
-                    elif self.pos < 0:
-                        self.cover(price, abs(self.pos))
-                        self.buy(price, self.fixed_size)
-                elif bar.close_price < low_extreme:  # 卖
-                    price: float = bar.close_price - self.price_add
-                    if not self.pos:
-                        self.short(price, self.fixed_size)
-                    elif self.pos > 0:
-                        self.sell(price, abs(self.pos))
-                        self.short(price, self.fixed_size)
-
-        # 记录当前K线
-        self.last_bar = bar
+        # 按交易日记录K线，夜盘K线归属下一个交易日
+        series: TradingDaySeries = self.series
+        series.update_bar(bar)
+
+        # 更新extreme_window根K线之前的当日极值
+        self.extreme.update(series)
+
+        # 当天开盘已经经过了一定数量的K线，满足计算信号的要求
+        if series.count > self.min_count:
+            if bar.close_price > self.extreme.high:  # 买
+                price: float = bar.close_price + self.price_add
+                if not self.pos:
+                    self.buy(price, self.fixed_size)
+                elif self.pos < 0:
+                    self.cover(price, abs(self.pos))
+                    self.buy(price, self.fixed_size)
+            elif bar.close_price < self.extreme.low:  # 卖
+                price: float = bar.close_price - self.price_add
+                if not self.pos:
+                    self.short(price, self.fixed_size)
+                elif self.pos > 0:
+                    self.sell(price, abs(self.pos))
+                    self.short(price, self.fixed_size)
 
         self.put_event()
 
@@ -127,3 +132,87 @@ class ExtremeFollowStrategy(CtaTemplate):
     def on_stop_order(self, stop_order: StopOrder) -> None:
         """停止单推送"""
         pass
+
+
+class IntradayExtreme:
+    """
+    增量维护当天开盘以来、截至extreme_window根K线之前的最高价和最低价。
+
+    当天第count根K线对应的统计区间为当天前max(count - extreme_window, 1)根K线，
+    区间只会向后扩展，因此每根K线只需将新进入区间的数据纳入统计。
+    """
+
+    def __init__(self, extreme_window: int) -> None:
+        """构造函数"""
+        self.extreme_window: int = extreme_window
+
+        self.included: int = 0          # 已纳入统计的K线数量
+        self.high: float = 0
+        self.low: float = 0
+
+    def update(self, series: TradingDaySeries) -> None:
+        """将超过extreme_window根的当天K线纳入极值统计，新交易日时重新开始"""
+        count: int = series.count
+        if count == 1:
+            self.included = 0
+
+        target: int = max(count - self.extreme_window, 1)
+        if self.included >= target:
+            return
+
+        high_array: ndarray = series.high_array
+        low_array: ndarray = series.low_array
+
+        if not self.included:
+            self.high = high_array[0]
+            self.low = low_array[0]
+            self.included = 1
+
+        for i in range(self.included, target):
+            self.high = max(self.high, high_array[i])
+            self.low = min(self.low, low_array[i])
+
+        self.included = target
+
+
+def generate_signals(arrays: Dict[str, ndarray], params: dict) -> ndarray:
+    """
+    向量化计算全部历史的持仓序列，和ExtremeFollowStrategy的逻辑一致。
+
+    arrays为一分钟K线各字段的数组，params中未给出的参数使用策略的默认值，
+    返回每根一分钟K线结束时的持仓，假设委托都在下一根K线成交。
+
+    BacktestingEngine会将委托价格按pricetick取整，且限价委托价格不够时不会成交，
+    只有K线价格在最小变动价位上且price_add足够大时，持仓才和逐K线回测完全一致。
+    """
+    setting: dict = get_setting(ExtremeFollowStrategy, params)
+
+    bars, index = generate_window_arrays(arrays, setting["window"])
+    close: ndarray = bars["close_price"]
+    n: int = len(close)
+
+    # 每根K线在当天的序号，从1开始
+    day: ndarray = get_trading_day(bars["datetime"])
+    day_start: ndarray = get_day_start(day)
+    count: ndarray = np.arange(n) - day_start + 1
+
+    # 当天前max(count - extreme_window, 1)根K线的最高最低价
+    prefix: ndarray = day_start + np.maximum(count - setting["extreme_window"], 1) - 1
+    high: ndarray = accumulate_daily_max(bars["high_price"], day)[prefix]
+    low: ndarray = -accumulate_daily_max(-bars["low_price"], day)[prefix]
+
+    active: ndarray = count > setting["min_count"]
+    signal: ndarray = np.where(close > high, 1, np.where(close < low, -1, 0)) * active
+    return generate_position(len(arrays["close_price"]), index, signal, setting["fixed_size"])
+
+
+def accumulate_daily_max(values: ndarray, day: ndarray) -> ndarray:
+    """计算当天开盘以来的累计最大值，day为非递减的交易日编号"""
+    n: int = len(values)
+    order: ndarray = np.argsort(values, kind="stable")
+    rank: ndarray = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+
+    # 交易日编号作为高位，排名作为低位，累计最大值不会跨越交易日
+    offset: ndarray = day.astype(np.int64) * n
+    return values[order[np.maximum.accumulate(offset + rank) - offset]]
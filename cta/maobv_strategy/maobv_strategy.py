@@ -1,5 +1,5 @@
-import numpy as np
-import pandas as pd
+from collections import deque
+from math import nan
 
 from vnpy_ctastrategy import (
     CtaTemplate,
@@ -9,12 +9,31 @@ from vnpy_ctastrategy import (
     BarData,
     TradeData,
     OrderData,
-    BarGenerator,
-    ArrayManager,
 )
-from vnpy.trader.constant import Interval
-from datetime import datetime
-from typing import Callable
+from typing import Deque, Dict, Tuple
+
+import numpy as np
+from numpy import ndarray
+from numpy.lib.stride_tricks import sliding_window_view
+import talib
+
+# 实盘时以strategies.<模块名>导入，elite_utility需复制到同一目录
+try:
+    from .elite_utility import (
+        DailyBarGenerator,
+        StreamingArrayManager,
+        generate_daily_arrays,
+        generate_position,
+        get_setting
+    )
+except ImportError:
+    from elite_utility import (
+        DailyBarGenerator,
+        StreamingArrayManager,
+        generate_daily_arrays,
+        generate_position,
+        get_setting
+    )
 
 
 class MAOBVStrategy(CtaTemplate):
@@ -66,7 +85,12 @@ class MAOBVStrategy(CtaTemplate):
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
         self.bg = DailyBarGenerator(self.on_bar, self.window, self.on_daily_bar)
-        self.am = ArrayManager(100)
+
+        # 增量计算的均线和相对成交量指标，均线保留最近两个数值
+        self.am = StreamingArrayManager(2)
+        self.am.add_sma(self.fast_window)
+        self.am.add_sma(self.slow_window)
+        self.obv = ObvIndicator(self.obv_window)
 
     def on_init(self) -> None:
         """初始化"""
@@ -93,29 +117,22 @@ class MAOBVStrategy(CtaTemplate):
 
     def on_daily_bar(self, bar: BarData):
         """日线推送"""
-        am = self.am
+        am: StreamingArrayManager = self.am
         am.update_bar(bar)
-        if not am.inited:
+        self.obv.update(bar)
+        if not am.inited or not self.obv.inited:
             return
 
-        fast_ma = am.sma(self.fast_window, array=True)
+        fast_ma: ndarray = am.sma(self.fast_window, array=True)
         self.fast_ma0 = fast_ma[-1]
         self.fast_ma1 = fast_ma[-2]
 
-        slow_ma = am.sma(self.slow_window, array=True)
+        slow_ma: ndarray = am.sma(self.slow_window, array=True)
         self.slow_ma0 = slow_ma[-1]
         self.slow_ma1 = slow_ma[-2]
 
-        # 计算相对成交量指标
-        df = pd.DataFrame()
-        df['Vt'] = am.volume_array[-self.obv_window:]
-        df['close_price'] = am.close_array[-self.obv_window:]
-        df['pre_close'] = am.close_array[-self.obv_window - 1: -1]
-        df['status'] = np.where(df['close_price'] >= df['pre_close'], 1, -1)
-        df['Vt'] = df['Vt'] * df['status']
-        df['obv'] = df['Vt'].cumsum()
-
-        obv = (df["obv"].iloc[-1] - df['obv'].min()) / (df['obv'].max() - df['obv'].min())
+        # 相对成交量指标
+        obv: float = self.obv.value
 
         cross_over = self.fast_ma0 > self.slow_ma0 and self.fast_ma1 < self.slow_ma1 and obv > self.obv_up
         cross_below = self.fast_ma0 < self.slow_ma0 and self.fast_ma1 > self.slow_ma1 and obv < self.obv_low
@@ -151,127 +168,120 @@ class MAOBVStrategy(CtaTemplate):
         pass
 
 
-class DailyBarGenerator(BarGenerator):
-    """生成日K线"""
+class ObvIndicator:
+    """
+    增量计算窗口内归一化的OBV指标。
 
-    def __init__(
-        self,
-        on_bar: Callable,
-        window: int = 0,
-        on_window_bar: Callable = None,
-        interval: Interval = Interval.MINUTE
-    ) -> None:
-        """生成器"""
-        self.bar: BarData = None
-        self.on_bar: Callable = on_bar
-
-        self.interval: Interval = interval
-        self.interval_count: int = 0
-
-        self.hour_bar: BarData = None
-        self.daily_bar: BarData = None
+    窗口内从头累计的OBV和全局累计的OBV只差一个常数，归一化后结果相同，
+    因此只需维护全局OBV在窗口内的最大最小值，用单调队列实现。
+    """
 
+    def __init__(self, window: int) -> None:
+        """构造函数"""
         self.window: int = window
-        self.window_bar: BarData = None
-        self.on_window_bar: Callable = on_window_bar
-
-        self.last_tick: TickData = None
-
-    def update_bar(self, bar: BarData) -> None:
-        """分钟K线推送"""
-        self.update_bar_daily_window(bar)
-
-    def update_bar_daily_window(self, bar: BarData) -> None:
-        """日线构造"""
-        # If not inited, create window bar object
-        if not self.daily_bar:
-            dt: datetime = bar.datetime.replace(hour=0, minute=0, second=0, microsecond=0)
-            self.daily_bar = BarData(
-                symbol=bar.symbol,
-                exchange=bar.exchange,
-                datetime=dt,
-                gateway_name=bar.gateway_name,
-                open_price=bar.open_price,
-                high_price=bar.high_price,
-                low_price=bar.low_price,
-                close_price=bar.close_price,
-                volume=bar.volume,
-                turnover=bar.turnover,
-                open_interest=bar.open_interest
-            )
+        self.count: int = 0
+        self.obv: float = 0
+        self.pre_close: float = None
+
+        # 单调队列中保存(序号, OBV)，队首即窗口内的最大值和最小值
+        self.max_queue: Deque[Tuple[int, float]] = deque()
+        self.min_queue: Deque[Tuple[int, float]] = deque()
+
+        self.value: float = nan
+
+    @property
+    def inited(self) -> bool:
+        """窗口是否已经写满"""
+        return self.count >= self.window
+
+    def update(self, bar: BarData) -> None:
+        """更新K线，计算最新的相对成交量"""
+        # 第一根K线没有前收盘价，只作为基准
+        if self.pre_close is None:
+            self.pre_close = bar.close_price
             return
 
-        finished_bar: BarData = None
-
-        # If minute bar of new day, then push existing window bar
-        if bar.datetime.day != self.daily_bar.datetime.day:
-            finished_bar = self.daily_bar
-            dt: datetime = bar.datetime.replace(hour=0, minute=0, second=0, microsecond=0)
-            self.daily_bar = BarData(
-                symbol=bar.symbol,
-                exchange=bar.exchange,
-                datetime=dt,
-                gateway_name=bar.gateway_name,
-                open_price=bar.open_price,
-                high_price=bar.high_price,
-                low_price=bar.low_price,
-                close_price=bar.close_price,
-                volume=bar.volume,
-                turnover=bar.turnover,
-                open_interest=bar.open_interest
-            )
-        # Otherwise only update minute bar
+        if bar.close_price >= self.pre_close:
+            self.obv += bar.volume
+        else:
+            self.obv -= bar.volume
+
+        self.pre_close = bar.close_price
+        self.count += 1
+
+        max_queue: Deque[Tuple[int, float]] = self.max_queue
+        while max_queue and max_queue[-1][1] <= self.obv:
+            max_queue.pop()
+        max_queue.append((self.count, self.obv))
+        if max_queue[0][0] <= self.count - self.window:
+            max_queue.popleft()
+
+        min_queue: Deque[Tuple[int, float]] = self.min_queue
+        while min_queue and min_queue[-1][1] >= self.obv:
+            min_queue.pop()
+        min_queue.append((self.count, self.obv))
+        if min_queue[0][0] <= self.count - self.window:
+            min_queue.popleft()
+
+        high: float = max_queue[0][1]
+        low: float = min_queue[0][1]
+        if high > low:
+            self.value = (self.obv - low) / (high - low)
         else:
-            self.daily_bar.high_price = max(
-                self.daily_bar.high_price,
-                bar.high_price
-            )
-            self.daily_bar.low_price = min(
-                self.daily_bar.low_price,
-                bar.low_price
-            )
-
-            self.daily_bar.close_price = bar.close_price
-            self.daily_bar.volume += bar.volume
-            self.daily_bar.turnover += bar.turnover
-            self.daily_bar.open_interest = bar.open_interest
-
-        # Push finished window bar
-        if finished_bar:
-            self.on_daily_bar(finished_bar)
-
-    def on_daily_bar(self, bar: BarData) -> None:
-        """合成N天K线"""
-        if self.window == 1:  # 一天K线
-            self.on_window_bar(bar)
-        else:  # 合成self.window天K线
-            if not self.window_bar:
-                self.window_bar = BarData(
-                    symbol=bar.symbol,
-                    exchange=bar.exchange,
-                    datetime=bar.datetime,
-                    gateway_name=bar.gateway_name,
-                    open_price=bar.open_price,
-                    high_price=bar.high_price,
-                    low_price=bar.low_price
-                )
-            else:
-                self.window_bar.high_price = max(
-                    self.window_bar.high_price,
-                    bar.high_price
-                )
-                self.window_bar.low_price = min(
-                    self.window_bar.low_price,
-                    bar.low_price
-                )
-
-            self.window_bar.close_price = bar.close_price
-            self.window_bar.volume += bar.volume
-            self.window_bar.turnover += bar.turnover
-            self.window_bar.open_interest = bar.open_interest
-
-            self.interval_count += 1
-            if not self.interval_count % self.window:
-                self.interval_count = 0
-                self.on_window_bar(self.window_bar)
-                self.window_bar = None
+            self.value = nan
+
+
+def generate_signals(arrays: Dict[str, ndarray], params: dict) -> ndarray:
+    """
+    向量化计算全部历史的持仓序列，和MAOBVStrategy的逻辑一致。
+
+    arrays为一分钟K线各字段的数组，params中未给出的参数使用策略的默认值，
+    返回每根一分钟K线结束时的持仓，假设委托都在下一根K线成交。
+
+    BacktestingEngine会将委托价格按pricetick取整，且限价委托价格不够时不会成交，
+    只有K线价格在最小变动价位上且price_add足够大时，持仓才和逐K线回测完全一致。
+    """
+    setting: dict = get_setting(MAOBVStrategy, params)
+    fast_window: int = setting["fast_window"]
+    slow_window: int = setting["slow_window"]
+    obv_window: int = setting["obv_window"]
+
+    bars, index = generate_daily_arrays(arrays, setting["window"])
+    close: ndarray = bars["close_price"]
+    n: int = len(close)
+
+    fast_ma: ndarray = talib.SMA(close, fast_window)
+    slow_ma: ndarray = talib.SMA(close, slow_window)
+
+    # 全局OBV，第一根K线只作为基准
+    direction: ndarray = np.where(close[1:] >= close[:-1], 1, -1)
+    obv: ndarray = np.r_[0, np.cumsum(direction * bars["volume"][1:])]
+
+    # 窗口内归一化的相对成交量，窗口不含作为基准的第一根K线
+    value: ndarray = np.full(n, nan)
+    if n > obv_window:
+        windows: ndarray = sliding_window_view(obv[1:], obv_window)
+        high: ndarray = windows.max(axis=1)
+        low: ndarray = windows.min(axis=1)
+        current: ndarray = obv[obv_window:]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            value[obv_window:] = np.where(high > low, (current - low) / (high - low), nan)
+
+    # StreamingArrayManager和ObvIndicator都初始化完成
+    init_count: int = max(2, fast_window + 1, slow_window + 1, obv_window + 1)
+    inited: ndarray = np.arange(1, n + 1) >= init_count
+
+    fast_ma_1: ndarray = np.r_[nan, fast_ma[:-1]]
+    slow_ma_1: ndarray = np.r_[nan, slow_ma[:-1]]
+
+    with np.errstate(invalid="ignore"):
+        cross_over: ndarray = (
+            inited & (fast_ma > slow_ma) & (fast_ma_1 < slow_ma_1) & (value > setting["obv_up"])
+        )
+        cross_below: ndarray = (
+            inited & (fast_ma < slow_ma) & (fast_ma_1 > slow_ma_1) & (value < setting["obv_low"])
+        )
+
+    signal: ndarray = cross_over.astype(int) - cross_below.astype(int)
+    return generate_position(len(arrays["close_price"]), index, signal, setting["fixed_size"])
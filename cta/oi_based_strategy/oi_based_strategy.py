@@ -1,6 +1,6 @@
 import numpy as np
-import pandas as pd
-from typing import List
+from numpy import ndarray
+from typing import Dict, List, Tuple
 
 from vnpy_ctastrategy import (
     CtaTemplate,
@@ -11,9 +11,30 @@ from vnpy_ctastrategy import (
     TradeData,
     OrderData,
     BarGenerator,
-    ArrayManager,
 )
 
+# 实盘时以strategies.<模块名>导入，elite_utility需复制到同一目录
+try:
+    from .elite_utility import (
+        TradingDaySeries,
+        generate_position,
+        generate_window_arrays,
+        get_close_mask,
+        get_day_start,
+        get_setting,
+        get_trading_day
+    )
+except ImportError:
+    from elite_utility import (
+        TradingDaySeries,
+        generate_position,
+        generate_window_arrays,
+        get_close_mask,
+        get_day_start,
+        get_setting,
+        get_trading_day
+    )
+
 
 class OiBasedStrategy(CtaTemplate):
     """持仓量策略"""
@@ -49,12 +70,9 @@ class OiBasedStrategy(CtaTemplate):
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
         self.bg = BarGenerator(self.on_bar, self.window, self.on_Nmin_window_bar)
-        self.am = ArrayManager(500)  # 起码容纳一天以上的分钟数据
-        self.last_bar: BarData = None
-        self.P_list: List = [None]*self.ma_p_window
-        self.Q_list: List = [None]*self.ma_q_window
-        self.P_count = 0
-        self.Q_count = 0
+        self.series = TradingDaySeries(self.vt_symbol, self.window, self.on_day_close)
+        self.p_buffer = RollingMean(self.ma_p_window)
+        self.q_buffer = RollingMean(self.ma_q_window)
 
     def on_init(self) -> None:
         """初始化"""
@@ -81,83 +99,41 @@ class OiBasedStrategy(CtaTemplate):
 
     def on_Nmin_window_bar(self, bar: BarData) -> None:
         """N分钟K线推送"""
-        # 更新到ArrayManager
-        am: ArrayManager = self.am
-        am.update_bar(bar)
-        if not am.inited:
-            return
+        self.series.update_bar(bar)
+
+        self.put_event()
+
+    def on_day_close(self, bar: BarData) -> None:
+        """日盘收盘K线推送"""
+        series: TradingDaySeries = self.series
 
-        if not self.last_bar or self.last_bar.datetime.day != bar.datetime.day:
-            self.last_bar = bar
-            self.count = 1  # 当天第一根K线
+        # 缺少前一交易日数据、当天只有一根K线或错误数据
+        if not series.inited or series.count < 2 or not series.volume_array.all():
             return
 
-        elif bar.datetime.minute == 59 and bar.datetime.hour == 14:
-            # 当前已经收盘，开始计算
-            self.count += 1
-            df = pd.DataFrame()
-            df['Vt'] = am.volume_array[-self.count:]
-            if 0 in np.array(df['Vt']):  # 错误数据
-                return
-
-            V = self.K * df['Vt'].sum()
-            df['close_price'] = am.close_array[-self.count:]
-            df['pre_close'] = am.close_array[-self.count - 1: -1]
-            df['Rt'] = (df['close_price'] - df['pre_close']) / df['pre_close']*1000
-            df['Oi'] = am.open_interest_array[-self.count:]
-            df['pre_Oi'] = am.open_interest_array[-self.count - 1: -1]
-            df['Oi_change'] = df['Oi'] - df['pre_Oi']
-            df['St_P'] = abs(df['Rt']) / np.sqrt(df['Vt'])
-            df['St_Q'] = abs(df['Oi_change']) / np.sqrt(df['Vt'])
-
-            df_P = df
-            # 按照St的数值进行降序
-            df_P = df_P.sort_values(by='St_P', ascending=False)
-            index = np.where(df_P['Vt'].cumsum() >= V)[0][0]
-            P = df_P['Rt'][:index+1].sum()
-
-            df_Q = df
-            df_Q = df_Q.sort_values(by='St_Q', ascending=False)
-            index = np.where(df_Q['Vt'].cumsum() >= V)[0][0]
-            Q = df_Q['Oi_change'][:index+1].sum()
-
-            # 此时P和Q都已经算完了，检查P和Q的序列是否到了窗口数量，因为要算MA
-            if self.P_count < self.ma_p_window or self.Q_count < self.ma_q_window:  # 不够数量
-                self.P_count += 1
-                self.Q_count += 1
-                self.P_list.append(P)
-                self.P_list.pop(0)
-                self.Q_list.append(Q)
-                self.Q_list.pop(0)
-                return
-
-            else:  # 可以交易了，也要先更新P和Q的序列
-                self.P_list.append(P)
-                self.P_list.pop(0)
-                self.Q_list.append(Q)
-                self.Q_list.pop(0)
-                P = P - sum(self.P_list)/len(self.P_list)
-                Q = Q - sum(self.Q_list)/len(self.Q_list)
-
-                if (P < 0 and Q > 0) or (P > 0 and Q < 0):  # 态度趋多，分歧减少（或反）看多
-                    price: float = bar.close_price + self.price_add
-                    if not self.pos:
-                        self.buy(price, self.fixed_size)
-                    elif self.pos < 0:
-                        self.cover(price, abs(self.pos))
-                        self.buy(price, self.fixed_size)
-                elif (P < 0 and Q < 0) or (P > 0 and Q > 0):  # 态度趋空，分歧加大（或反）看空
-                    price: float = bar.close_price - self.price_add
-                    if not self.pos:
-                        self.short(price, self.fixed_size)
-                    elif self.pos > 0:
-                        self.sell(price, abs(self.pos))
-                        self.short(price, self.fixed_size)
-
-        else:  # 不是新的一天，也还没收盘啥也别干，等待记录就好
-            self.count += 1
+        # 当天第一根K线的变化相对前一交易日最后一根K线计算
+        P, Q = calculate_pq(
+            np.concatenate((series.previous_close_array[-1:], series.close_array)),
+            series.volume_array,
+            np.concatenate((series.previous_open_interest_array[-1:], series.open_interest_array)),
+            self.K
+        )
 
-        self.put_event()
+        signal: int = update_signal(self.p_buffer, self.q_buffer, P, Q)
+        if signal > 0:  # 态度趋多，分歧减少（或反）看多
+            price: float = bar.close_price + self.price_add
+            if not self.pos:
+                self.buy(price, self.fixed_size)
+            elif self.pos < 0:
+                self.cover(price, abs(self.pos))
+                self.buy(price, self.fixed_size)
+        elif signal < 0:  # 态度趋空，分歧加大（或反）看空
+            price: float = bar.close_price - self.price_add
+            if not self.pos:
+                self.short(price, self.fixed_size)
+            elif self.pos > 0:
+                self.sell(price, abs(self.pos))
+                self.short(price, self.fixed_size)
 
     def on_order(self, order: OrderData) -> None:
         """委托推送"""
@@ -170,3 +146,130 @@ class OiBasedStrategy(CtaTemplate):
     def on_stop_order(self, stop_order: StopOrder) -> None:
         """停止单推送"""
         pass
+
+
+def calculate_pq(close: ndarray, volume: ndarray, oi: ndarray, k: float) -> Tuple[float, float]:
+    """
+    计算当天的P和Q，k为激进交易占当天总成交量的比率。
+
+    close和oi的第一个元素为前一交易日最后一根K线的数据，比volume多一个。
+    """
+    returns: ndarray = (close[1:] - close[:-1]) / close[:-1] * 1000
+    oi_change: ndarray = oi[1:] - oi[:-1]
+    sqrt_volume: ndarray = np.sqrt(volume)
+    threshold: float = k * volume.sum()
+
+    P: float = aggressive_sum(returns, np.abs(returns) / sqrt_volume, volume, threshold)
+    Q: float = aggressive_sum(oi_change, np.abs(oi_change) / sqrt_volume, volume, threshold)
+    return P, Q
+
+
+def aggressive_sum(values: ndarray, st: ndarray, volume: ndarray, threshold: float) -> float:
+    """按St降序累计成交量，对累计成交量首次达到阈值前的K线求和"""
+    # 反转后升序排序再反转，同值时的顺序和pandas降序sort_values一致
+    n: int = len(st)
+    order: ndarray = (n - 1 - np.argsort(st[::-1]))[::-1]
+
+    index: int = np.searchsorted(volume[order].cumsum(), threshold)
+    return values[order[:index + 1]].sum()
+
+
+class RollingMean:
+    """定长环形缓存，维护窗口内的累计和"""
+
+    def __init__(self, size: int) -> None:
+        """构造函数"""
+        self.size: int = size
+        self.buffer: List[float] = [0] * size
+        self.index: int = 0
+        self.count: int = 0
+        self.sum: float = 0
+
+    @property
+    def inited(self) -> bool:
+        """窗口是否已经写满"""
+        return self.count >= self.size
+
+    @property
+    def mean(self) -> float:
+        """窗口内的均值"""
+        return self.sum / self.count
+
+    def update(self, value: float) -> None:
+        """写入新数据，窗口已满时替换最早的数据"""
+        self.sum += value - self.buffer[self.index]
+        self.buffer[self.index] = value
+
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+        # 每写满一轮重新求和，避免累计误差
+        if not self.index:
+            self.sum = sum(self.buffer)
+
+
+def update_signal(p_buffer: RollingMean, q_buffer: RollingMean, P: float, Q: float) -> int:
+    """更新P和Q的序列，返回相对均值的交易信号，1为看多、-1为看空、0为不操作"""
+    # 先检查P和Q的序列是否到了窗口数量，因为要算MA
+    inited: bool = p_buffer.inited and q_buffer.inited
+
+    p_buffer.update(P)
+    q_buffer.update(Q)
+    if not inited:
+        return 0
+
+    P = P - p_buffer.mean
+    Q = Q - q_buffer.mean
+
+    if (P < 0 and Q > 0) or (P > 0 and Q < 0):
+        return 1
+    elif (P < 0 and Q < 0) or (P > 0 and Q > 0):
+        return -1
+    return 0
+
+
+def generate_signals(arrays: Dict[str, ndarray], params: dict) -> ndarray:
+    """
+    向量化计算全部历史的持仓序列，和OiBasedStrategy的逻辑一致。
+
+    arrays为一分钟K线各字段的数组，params中未给出的参数使用策略的默认值，
+    可以额外传入vt_symbol用于确定收盘时间，返回每根一分钟K线结束时的持仓，
+    假设委托都在下一根K线成交。
+
+    BacktestingEngine会将委托价格按pricetick取整，且限价委托价格不够时不会成交，
+    只有K线价格在最小变动价位上且price_add足够大时，持仓才和逐K线回测完全一致。
+    """
+    setting: dict = get_setting(OiBasedStrategy, params)
+
+    bars, index = generate_window_arrays(arrays, setting["window"])
+    close: ndarray = bars["close_price"]
+    volume: ndarray = bars["volume"]
+    open_interest: ndarray = bars["open_interest"]
+
+    day: ndarray = get_trading_day(bars["datetime"])
+    day_start: ndarray = get_day_start(day)
+
+    # 每个交易日只在收盘K线计算一次，P和Q的滚动均值按交易日递推
+    close_index: ndarray = np.flatnonzero(
+        get_close_mask(bars["datetime"], params.get("vt_symbol", ""), setting["window"])
+    )
+    signal: ndarray = np.zeros(len(close_index), dtype=int)
+
+    p_buffer: RollingMean = RollingMean(setting["ma_p_window"])
+    q_buffer: RollingMean = RollingMean(setting["ma_q_window"])
+
+    for i, end in enumerate(close_index):
+        # 缺少前一交易日数据、当天只有一根K线或错误数据
+        start: int = day_start[end]
+        if not start or end == start or not volume[start:end + 1].all():
+            continue
+
+        P, Q = calculate_pq(
+            close[start - 1:end + 1],
+            volume[start:end + 1],
+            open_interest[start - 1:end + 1],
+            setting["K"]
+        )
+        signal[i] = update_signal(p_buffer, q_buffer, P, Q)
+
+    return generate_position(len(arrays["close_price"]), index[close_index], signal, setting["fixed_size"])
@@ -1,4 +1,9 @@
+from math import isnan, nan
+from typing import Dict
+
+import numpy as np
 from numpy import ndarray
+import talib
 
 from vnpy.trader.constant import Interval
 
@@ -11,9 +16,26 @@ from vnpy_ctastrategy import (
     TradeData,
     OrderData,
     BarGenerator,
-    ArrayManager,
 )
 
+# 实盘时以strategies.<模块名>导入，elite_utility需复制到同一目录
+try:
+    from .elite_utility import (
+        SmaIndicator,
+        StreamingArrayManager,
+        generate_position,
+        generate_window_arrays,
+        get_setting
+    )
+except ImportError:
+    from elite_utility import (
+        SmaIndicator,
+        StreamingArrayManager,
+        generate_position,
+        generate_window_arrays,
+        get_setting
+    )
+
 
 class RumiStrategy(CtaTemplate):
     """RUMI策略"""
@@ -58,7 +80,14 @@ class RumiStrategy(CtaTemplate):
             # interval=Interval.HOUR
         )
 
-        self.am = ArrayManager(200)
+        self.am = StreamingArrayManager()
+        self.am.add_sma(self.fast_window)
+        self.am.add_wma(self.slow_window)
+        self.am.add_atr(self.atr_window)
+
+        # 均线差值的滚动均值，以及其上一个数值
+        self.diff_sma = SmaIndicator(self.diff_window)
+        self.last_ma_diff: float = nan
 
     def on_init(self) -> None:
         """初始化"""
@@ -88,19 +117,19 @@ class RumiStrategy(CtaTemplate):
         self.cancel_all()
 
         # 更新到ArrayManager
-        am: ArrayManager = self.am
+        am: StreamingArrayManager = self.am
         am.update_bar(bar)
-        if not am.inited:
-            return
 
-        # 计算均线数组
-        fast_array: ndarray = am.sma(self.fast_window, array=True)
-        slow_array: ndarray = am.wma(self.slow_window, array=True)
+        # 计算均线差值，慢速均线可用后开始计算其滚动均值
+        diff: float = am.sma(self.fast_window) - am.wma(self.slow_window)
+        if isnan(diff):
+            return
 
-        # 计算均线差值
-        diff_array: ndarray = fast_array - slow_array
-        diff_mean_0 = diff_array[-self.diff_window:].mean()
-        diff_mean_1 = diff_array[-self.diff_window-1:-1].mean()
+        diff_mean_0: float = self.diff_sma.update(diff)
+        diff_mean_1: float = self.last_ma_diff
+        self.ma_diff = self.last_ma_diff = diff_mean_0
+        if not am.inited or isnan(diff_mean_1) or isnan(diff_mean_0):
+            return
 
         # 判断上下穿
         cross_over = diff_mean_0 > 0 and diff_mean_1 <= 0
@@ -147,3 +176,44 @@ class RumiStrategy(CtaTemplate):
     def on_stop_order(self, stop_order: StopOrder) -> None:
         """停止单推送"""
         pass
+
+
+def generate_signals(arrays: Dict[str, ndarray], params: dict) -> ndarray:
+    """
+    向量化计算全部历史的持仓序列，和RumiStrategy的逻辑一致。
+
+    arrays为一分钟K线各字段的数组，params中未给出的参数使用策略的默认值，
+    返回每根一分钟K线结束时的持仓，假设委托都在下一根K线成交。
+
+    BacktestingEngine会将委托价格按pricetick取整，且限价委托价格不够时不会成交，
+    只有K线价格在最小变动价位上且price_add足够大时，持仓才和逐K线回测完全一致。
+    """
+    setting: dict = get_setting(RumiStrategy, params)
+    fast_window: int = setting["fast_window"]
+    slow_window: int = setting["slow_window"]
+    atr_window: int = RumiStrategy.atr_window
+
+    bars, index = generate_window_arrays(arrays, 30)
+    close: ndarray = bars["close_price"]
+
+    # 均线差值及其滚动均值，慢速均线可用后开始计算
+    diff: ndarray = talib.SMA(close, fast_window) - talib.WMA(close, slow_window)
+    diff_mean: ndarray = talib.SMA(diff, setting["diff_window"])
+    diff_mean_1: ndarray = np.r_[nan, diff_mean[:-1]]
+
+    # StreamingArrayManager的初始化K线数量
+    init_count: int = max(2, fast_window + 1, slow_window + 1, atr_window + 2)
+    inited: ndarray = np.arange(1, len(close) + 1) >= init_count
+
+    # 和nan比较的结果为False，无需单独处理
+    with np.errstate(invalid="ignore"):
+        cross_over: ndarray = inited & (diff_mean > 0) & (diff_mean_1 <= 0)
+        cross_below: ndarray = inited & (diff_mean < 0) & (diff_mean_1 >= 0)
+
+    # 根据风险度计算交易数量
+    atr: ndarray = talib.ATR(bars["high_price"], bars["low_price"], close, atr_window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        size: ndarray = np.maximum((RumiStrategy.risk_level / atr).astype(int), 1)
+
+    signal: ndarray = cross_over.astype(int) - cross_below.astype(int)
+    return generate_position(len(arrays["close_price"]), index, signal, size)
@@ -1,3 +1,10 @@
+from collections import deque
+from math import isnan, nan
+from typing import Deque, Dict, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+from numpy.lib.stride_tricks import sliding_window_view
 import talib
 
 from vnpy_ctastrategy import (
@@ -9,9 +16,24 @@ from vnpy_ctastrategy import (
     TradeData,
     OrderData,
     BarGenerator,
-    ArrayManager,
 )
 
+# 实盘时以strategies.<模块名>导入，elite_utility需复制到同一目录
+try:
+    from .elite_utility import (
+        EmaIndicator,
+        StreamingArrayManager,
+        generate_window_arrays,
+        get_setting
+    )
+except ImportError:
+    from elite_utility import (
+        EmaIndicator,
+        StreamingArrayManager,
+        generate_window_arrays,
+        get_setting
+    )
+
 
 class TrendModelSysStrategy(CtaTemplate):
     """长短MACD震荡反程序化策略"""
@@ -69,10 +91,17 @@ class TrendModelSysStrategy(CtaTemplate):
         super().__init__(cta_engine, strategy_name, vt_symbol, setting)
 
         self.bg = BarGenerator(self.on_bar, self.window, self.on_5min_bar)
-        self.am = ArrayManager(100)
-        self.high_price = []
-        self.low_price = []
-        self.bar_number = []
+
+        # 离场信号需要前trailbar根K线的最高最低价
+        self.am = StreamingArrayManager(self.trailbar + 1)
+        self.am.add_ema(self.fast_window)
+        self.am.add_ema(self.slow_window)
+
+        # 快慢EMA之差的信号线，以及最近两个mdif
+        self.signal_ema = EmaIndicator(self.macd_window)
+        self.last_mdif: float = nan
+
+        self.crosses: Deque[Tuple[int, float, float]] = deque(maxlen=self.ncos)
 
     def on_init(self) -> None:
         """初始化"""
@@ -99,18 +128,26 @@ class TrendModelSysStrategy(CtaTemplate):
 
     def on_5min_bar(self, bar: BarData):
         """日线推送"""
-        am = self.am
+        am: StreamingArrayManager = self.am
         am.update_bar(bar)
-        if not am.inited:
+
+        # 慢速EMA可用后就开始计算信号线，信号线需要macd_window个mval
+        mval: float = am.ema(self.fast_window) - am.ema(self.slow_window)
+        if isnan(mval):
             return
 
-        self.count += 1  # 第几根K线
-        self.mval = am.ema(self.fast_window, array=True) - am.ema(self.slow_window, array=True)
-        self.mavg = talib.EMA(self.mval, self.macd_window)
+        self.mval = mval
+        self.mavg = self.signal_ema.update(mval)
         self.mdif = self.mval - self.mavg
 
-        cross_over = self.mdif[-1] > 0 and self.mdif[-2] < 0
-        cross_below = self.mdif[-1] < 0 and self.mdif[-2] > 0
+        last_mdif: float = self.last_mdif
+        self.last_mdif = self.mdif
+        if not am.inited or isnan(last_mdif) or isnan(self.mdif):
+            return
+
+        self.count += 1  # 第几根K线
+        cross_over = self.mdif > 0 and last_mdif < 0
+        cross_below = self.mdif < 0 and last_mdif > 0
 
         if self.pos > 0:
             self.cancel_all()
@@ -124,21 +161,20 @@ class TrendModelSysStrategy(CtaTemplate):
                 self.cover(price, abs(self.pos))
 
         if cross_over or cross_below:
-            self.bar_number.append(self.count)  # 记录已经来了多少根K线
-            self.high_price.append(bar.high_price)
-            self.low_price.append(bar.low_price)
+            # 只保留最近ncos次交叉的K线编号和最高最低价
+            self.crosses.append((self.count, bar.high_price, bar.low_price))
 
-            if len(self.bar_number) < self.ncos:  # 不到指定交叉次数，退出
+            if len(self.crosses) < self.ncos:  # 不到指定交叉次数，退出
                 return
 
             # 到了指定交叉次数，开始统计最近ncos次交叉是否在n_bars根K线内发生
-            if self.bar_number[-1] - self.bar_number[-self.ncos] > self.n_bars:
+            if self.crosses[-1][0] - self.crosses[0][0] > self.n_bars:
                 return
 
             # 满足条件开始挂单
             if self.pos == 0:
-                self.highest = max(self.high_price[-self.ncos:])
-                self.lowest = min(self.low_price[-self.ncos:])
+                self.highest = max(high for _, high, _ in self.crosses)
+                self.lowest = min(low for _, _, low in self.crosses)
                 buy_price: float = self.highest + self.price_add
                 short_price: float = self.lowest - self.price_add
                 self.buy(buy_price, self.fixed_size, stop=True)
@@ -157,3 +193,126 @@ class TrendModelSysStrategy(CtaTemplate):
     def on_stop_order(self, stop_order: StopOrder) -> None:
         """停止单推送"""
         pass
+
+
+def generate_signals(arrays: Dict[str, ndarray], params: dict) -> ndarray:
+    """
+    向量化计算全部历史的持仓序列，和TrendModelSysStrategy的逻辑一致。
+
+    arrays为一分钟K线各字段的数组，params中未给出的参数使用策略的默认值，
+    返回每根一分钟K线结束时的持仓，假设限价委托都在下一根K线成交，
+    停止单在触发的K线成交。
+
+    BacktestingEngine会将委托价格按pricetick取整，这里的停止单触发价没有取整，
+    K线价格不在最小变动价位上时，停止单的触发K线可能和逐K线回测不同。
+    """
+    setting: dict = get_setting(TrendModelSysStrategy, params)
+    fast_window: int = setting["fast_window"]
+    slow_window: int = setting["slow_window"]
+    ncos: int = setting["ncos"]
+    trailbar: int = setting["trailbar"]
+    price_add: float = setting["price_add"]
+    fixed_size: float = setting["fixed_size"]
+
+    bars, index = generate_window_arrays(arrays, setting["window"])
+    high: ndarray = bars["high_price"]
+    low: ndarray = bars["low_price"]
+    close: ndarray = bars["close_price"]
+    n: int = len(close)
+
+    # 快慢EMA之差及其信号线
+    mval: ndarray = talib.EMA(close, fast_window) - talib.EMA(close, slow_window)
+    mdif: ndarray = mval - talib.EMA(mval, setting["macd_window"])
+    last_mdif: ndarray = np.r_[nan, mdif[:-1]]
+
+    init_count: int = max(trailbar + 1, fast_window + trailbar, slow_window + trailbar)
+    active: ndarray = (np.arange(1, n + 1) >= init_count) & ~np.isnan(mdif) & ~np.isnan(last_mdif)
+    count: ndarray = np.cumsum(active)
+
+    cross: ndarray = active & (((mdif > 0) & (last_mdif < 0)) | ((mdif < 0) & (last_mdif > 0)))
+
+    # 离场信号，和前trailbar根K线的最高最低价比较
+    exit_long: ndarray = np.zeros(n, dtype=bool)
+    exit_short: ndarray = np.zeros(n, dtype=bool)
+    if n > trailbar:
+        exit_long[trailbar:] = close[trailbar:] < sliding_window_view(low[:-1], trailbar).min(axis=1)
+        exit_short[trailbar:] = close[trailbar:] > sliding_window_view(high[:-1], trailbar).max(axis=1)
+
+    # 最近ncos次交叉在n_bars根K线内发生时，在交叉K线的最高最低价挂出停止单
+    entry: ndarray = np.zeros(n, dtype=bool)
+    buy_price: ndarray = np.zeros(n)
+    short_price: ndarray = np.zeros(n)
+
+    cross_index: ndarray = np.flatnonzero(cross)
+    if len(cross_index) >= ncos:
+        current: ndarray = cross_index[ncos - 1:]
+        first: ndarray = cross_index[:len(cross_index) - ncos + 1]
+        entry[current] = count[current] - count[first] <= setting["n_bars"]
+        buy_price[current] = sliding_window_view(high[cross_index], ncos).max(axis=1) + price_add
+        short_price[current] = sliding_window_view(low[cross_index], ncos).min(axis=1) - price_add
+
+    # 停止单的触发依赖之前的持仓，逐根K线递推，先用下一根窗口K线的最高最低价判断是否触发
+    minute_high: ndarray = arrays["high_price"]
+    minute_low: ndarray = arrays["low_price"]
+    total: int = len(minute_high)
+
+    window_high: List[float] = high.tolist()
+    window_low: List[float] = low.tolist()
+    index_list: List[int] = index.tolist()
+
+    changes: List[Tuple[int, float]] = []       # (一分钟K线位置, 成交后的持仓)
+    stops: List[Tuple[int, float]] = []         # (方向, 触发价格)
+    pos: float = 0
+
+    for i in np.flatnonzero(active).tolist():
+        start: int = index_list[i] + 1
+
+        # 持有仓位时撤销停止单，满足条件时平仓
+        if pos:
+            stops = []
+
+            if (pos > 0 and exit_long[i]) or (pos < 0 and exit_short[i]):
+                pos = 0
+                if start < total:
+                    changes.append((start, pos))
+        elif entry[i]:
+            stops.append((1, buy_price[i]))
+            stops.append((-1, short_price[i]))
+
+        if not stops:
+            continue
+
+        if i + 1 < n:
+            end: int = index_list[i + 1] + 1
+            next_high: float = window_high[i + 1]
+            next_low: float = window_low[i + 1]
+        else:
+            end = total
+            next_high = minute_high[start:].max(initial=-np.inf)
+            next_low = minute_low[start:].min(initial=np.inf)
+
+        # 触发的停止单按触发时间依次成交，未触发的继续保留
+        triggered: List[Tuple[int, int]] = []
+        remaining: List[Tuple[int, float]] = []
+
+        for direction, price in stops:
+            if direction > 0 and next_high >= price:
+                triggered.append((start + int(np.argmax(minute_high[start:end] >= price)), direction))
+            elif direction < 0 and next_low <= price:
+                triggered.append((start + int(np.argmax(minute_low[start:end] <= price)), direction))
+            else:
+                remaining.append((direction, price))
+
+        for k, direction in sorted(triggered, key=lambda x: x[0]):
+            pos += direction * fixed_size
+            changes.append((k, pos))
+
+        stops = remaining
+
+    position: ndarray = np.zeros(total)
+    last: ndarray = np.zeros(total, dtype=int)
+    for k, value in changes:
+        position[k] = value
+        last[k] = k
+
+    return position[np.maximum.accumulate(last)]
@@ -0,0 +1,158 @@
+from typing import Tuple
+
+import numpy as np
+from numpy import ndarray
+import pandas as pd
+
+
+def calculate_entry(signal: ndarray, window: int, quantile: float) -> Tuple[ndarray, ndarray]:
+    """滚动窗口计算信号的上下分位数，作为多空开仓阈值"""
+    # pandas的滚动分位数基于跳表实现，每根K线只做O(log window)的插入和删除
+    rolling = pd.Series(signal).rolling(window)
+    long_entry: ndarray = rolling.quantile(1 - quantile).to_numpy()
+    short_entry: ndarray = rolling.quantile(quantile).to_numpy()
+    return long_entry, short_entry
+
+
+def find_first(values: ndarray, start: int, upper: float, lower: float) -> int:
+    """查找start之后第一个大于等于upper或小于等于lower的位置，找不到时返回数组长度"""
+    n: int = len(values)
+    size: int = 64
+
+    # 分块查找，块长度逐步翻倍，总计算量和持仓时间成正比
+    while start < n:
+        end: int = min(start + size, n)
+        chunk: ndarray = values[start:end]
+        hit: ndarray = (chunk >= upper) | (chunk <= lower)
+
+        if hit.any():
+            return start + int(hit.argmax())
+
+        start = end
+        size *= 2
+
+    return n
+
+
+def calculate_pos(
+    close: ndarray,
+    signal: ndarray,
+    long_entry: ndarray,
+    short_entry: ndarray,
+    window: int,
+    tp_percent: float,
+    sl_percent: float,
+    capital: int
+) -> ndarray:
+    """
+    根据开仓阈值和止盈止损计算每根K线的持仓，前window-1根K线为nan。
+
+    空仓时只需跳到下一个满足开仓条件的K线，持仓时只需查找第一个触发止盈止损的K线，
+    因此循环次数和交易次数成正比。
+    """
+    n: int = len(close)
+    pos: ndarray = np.zeros(n)
+    pos[:window - 1] = np.nan
+
+    # 和nan比较的结果为False，分位数不足窗口时不会开仓
+    with np.errstate(invalid="ignore"):
+        long_signal: ndarray = signal >= long_entry
+        short_signal: ndarray = signal <= short_entry
+
+    entries: ndarray = np.flatnonzero(long_signal | short_signal)
+    i: int = window - 1
+
+    while i < n:
+        # 空仓时找到下一个开仓信号
+        k: int = np.searchsorted(entries, i)
+        if k == len(entries):
+            break
+
+        i = int(entries[k])
+        last_price: float = float(close[i])
+        volume: int = int(round(capital / last_price))
+
+        # 开仓数量取整为0时仍为空仓，下一根K线继续判断
+        if not volume:
+            i += 1
+            continue
+
+        if long_signal[i]:
+            long_sl: float = last_price * (1 - sl_percent)
+            long_tp: float = last_price * (1 + tp_percent)
+            exit_ix: int = find_first(close, i + 1, long_tp, long_sl)
+            pos[i + 1:exit_ix + 1] = volume
+        else:
+            short_sl: float = last_price * (1 + sl_percent)
+            short_tp: float = last_price * (1 - tp_percent)
+            exit_ix: int = find_first(close, i + 1, short_sl, short_tp)
+            pos[i + 1:exit_ix + 1] = -volume
+
+        # 平仓K线之后恢复空仓
+        i = exit_ix + 1
+
+    return pos
+
+
+def calculate_nav(close: ndarray, pos: ndarray, capital: int, commission: float) -> ndarray:
+    """根据持仓计算策略净值，计算顺序和逐列的DataFrame运算一致"""
+    change: ndarray = np.zeros(len(close))
+    change[1:] = close[1:] - close[:-1]
+
+    trade: ndarray = np.zeros(len(pos))
+    trade[1:] = pos[1:] - pos[:-1]
+    trade[np.isnan(trade)] = 0
+
+    fee: ndarray = np.abs(trade * close * commission)
+    pnl: ndarray = change * pos - fee
+
+    # 和pandas的cumsum一样跳过nan
+    nav: ndarray = np.nancumsum(pnl) / capital + 1
+    nav[np.isnan(pnl)] = np.nan
+    return nav
+
+
+def run_backtesting(
+    df: pd.DataFrame,
+    window: int = 10000,
+    tp_percent: float = 0.05,
+    sl_percent: float = 0.05,
+    quantile: float = 0.2,
+    capital: int = 1_000_000,
+    commission: float = 3 / 10000
+) -> pd.DataFrame:
+    """执行回测任务，结果写入df的对应列"""
+    close: ndarray = df["close_price"].to_numpy(dtype=float)
+    signal: ndarray = df["signal"].to_numpy(dtype=float)
+
+    long_entry, short_entry = calculate_entry(signal, window, quantile)
+    pos: ndarray = calculate_pos(
+        close,
+        signal,
+        long_entry,
+        short_entry,
+        window,
+        tp_percent,
+        sl_percent,
+        capital
+    )
+
+    # 统计盈亏结果
+    df["long_entry"] = long_entry
+    df["short_entry"] = short_entry
+    df["pos"] = pos
+    df["change"] = (df["close_price"] - df["close_price"].shift(1)).fillna(0)
+    df["trade"] = (df["pos"] - df["pos"].shift(1)).fillna(0)
+    df["fee"] = abs(df["trade"] * df["close_price"] * commission)
+    df["pnl"] = df["change"] * df["pos"] - df["fee"]
+
+    df["signal_nav"] = df["pnl"].cumsum() / capital + 1
+    df["index_nav"] = df["close_price"] / df["close_price"].iat[0]
+
+    return df
+
+
+def calculate_sharpe(nav: pd.Series) -> float:
+    """计算夏普比率"""
+    r: pd.Series = nav.pct_change()
+    return r.mean() / r.std()
@@ -0,0 +1,277 @@
+import atexit
+import shelve
+from collections import OrderedDict, deque
+from hashlib import blake2b
+from math import isnan, sqrt, tanh
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+import pandas as pd
+
+from gp_backtesting import calculate_entry, calculate_nav, calculate_pos, calculate_sharpe
+
+
+def hash_array(array: ndarray) -> str:
+    """计算数组内容的哈希值"""
+    array = np.ascontiguousarray(array, dtype=float)
+    return blake2b(array.data, digest_size=16).hexdigest()
+
+
+class FitnessCache:
+    """
+    适应度的LRU缓存，可选用磁盘文件在多次运行之间持久化。
+
+    内存中最多保存size条结果，未命中时再查询磁盘文件，新结果同时写入内存和磁盘。
+    可以用with语句在退出时关闭磁盘文件，未关闭时也会在解释器退出前自动关闭。
+    """
+
+    def __init__(self, size: int = 100_000, path: str = "") -> None:
+        """构造函数，path为空时只使用内存缓存"""
+        self.size: int = size
+        self.path: str = path
+
+        self.data: OrderedDict[str, float] = OrderedDict()
+        self.db: Optional[shelve.Shelf] = None
+
+        self.hits: int = 0
+        self.disk_hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: str) -> Optional[float]:
+        """读取缓存结果，不存在时返回None"""
+        value: Optional[float] = self.data.get(key, None)
+        if value is not None:
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+        db: Optional[shelve.Shelf] = self.get_db()
+        if db is not None and key in db:
+            value = db[key]
+            self.save(key, value)
+            self.disk_hits += 1
+            return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: float) -> None:
+        """写入缓存结果"""
+        self.save(key, value)
+
+        db: Optional[shelve.Shelf] = self.get_db()
+        if db is not None:
+            db[key] = value
+
+    def save(self, key: str, value: float) -> None:
+        """写入内存，超出容量时淘汰最久未使用的结果"""
+        self.data[key] = value
+        self.data.move_to_end(key)
+
+        if len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+    def get_db(self) -> Optional[shelve.Shelf]:
+        """首次使用时打开磁盘文件"""
+        if self.db is None and self.path:
+            self.db = shelve.open(self.path)
+
+            # 解释器退出时确保数据写入磁盘
+            atexit.register(self.close)
+
+        return self.db
+
+    def close(self) -> None:
+        """关闭磁盘文件"""
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+            atexit.unregister(self.close)
+
+    def __enter__(self) -> "FitnessCache":
+        """进入with语句"""
+        return self
+
+    def __exit__(self, exc_type: type, exc_value: Exception, traceback: object) -> None:
+        """退出with语句时关闭磁盘文件"""
+        self.close()
+
+    def get_statistics(self) -> Dict[str, float]:
+        """获取缓存命中统计"""
+        total: int = self.hits + self.disk_hits + self.misses
+
+        return {
+            "total": total,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / total if total else 0
+        }
+
+
+def calculate_fitness(
+    close: ndarray,
+    signal: ndarray,
+    window: int = 10000,
+    tp_percent: float = 0.05,
+    sl_percent: float = 0.05,
+    quantile: float = 0.2,
+    capital: int = 1_000_000,
+    commission: float = 3 / 10000
+) -> float:
+    """回测信号并计算夏普比率，只读取输入数组而不修改"""
+    long_entry, short_entry = calculate_entry(signal, window, quantile)
+    pos: ndarray = calculate_pos(
+        close,
+        signal,
+        long_entry,
+        short_entry,
+        window,
+        tp_percent,
+        sl_percent,
+        capital
+    )
+    nav: ndarray = calculate_nav(close, pos, capital, commission)
+    return calculate_sharpe(pd.Series(nav))
+
+
+class SignalFitness:
+    """
+    基于回测夏普比率的信号适应度，结果按信号内容缓存。
+
+    不同的GP程序经常输出完全相同的信号，命中缓存时无需重复回测，
+    缓存键同时包含收盘价数据和回测参数，参数变化后不会读到旧结果。
+    """
+
+    def __init__(self, close: ndarray, cache: FitnessCache = None, **setting) -> None:
+        """构造函数，setting为calculate_fitness的回测参数"""
+        self.close: ndarray = np.ascontiguousarray(close, dtype=float)
+        self.cache: FitnessCache = cache if cache is not None else FitnessCache()
+        self.setting: dict = setting
+
+        hasher: blake2b = blake2b(self.close.data, digest_size=8)
+        hasher.update(repr(sorted(setting.items())).encode())
+        self.prefix: str = hasher.hexdigest()
+
+    def __call__(self, signal: ndarray) -> float:
+        """计算信号的适应度"""
+        signal = np.ascontiguousarray(signal, dtype=float)
+        key: str = self.prefix + hash_array(signal)
+
+        value: Optional[float] = self.cache.get(key)
+        if value is None:
+            value = calculate_fitness(self.close, signal, **self.setting)
+            self.cache.put(key, value)
+
+        return value
+
+
+class StagedFitness:
+    """
+    分阶段计算适应度，先在最近一段数据上快速回测，排名靠前的信号才进行全量回测。
+
+    第一阶段使用最后stage_size根K线，并可按step间隔抽样以进一步减少计算量，
+    阶段得分不低于最近history个得分的percentile分位数时晋级全量回测。
+
+    阶段得分和全量得分来自不同的样本，不能直接比较，因此晋级信号的适应度不低于floor，
+    被淘汰的信号按阶段得分映射到[floor - 1.5, floor - 0.5]区间，始终排在所有晋级信号之后，
+    阶段回测没有交易的信号适应度为floor - 2。
+    """
+
+    def __init__(
+        self,
+        close: ndarray,
+        cache: FitnessCache = None,
+        stage_size: int = 30000,
+        step: int = 1,
+        percentile: float = 80,
+        history: int = 1000,
+        min_count: int = 20,
+        log_interval: int = 0,
+        floor: float = -10,
+        **setting
+    ) -> None:
+        """构造函数，setting为calculate_fitness的回测参数"""
+        self.full: SignalFitness = SignalFitness(close, cache, **setting)
+
+        # 抽样后滚动分位数的窗口同步缩小
+        stage_setting: dict = dict(setting)
+        stage_setting["window"] = max(setting.get("window", 10000) // step, 1)
+
+        self.stage_slice: slice = slice(-stage_size, None, step)
+        self.stage: SignalFitness = SignalFitness(close[self.stage_slice], None, **stage_setting)
+
+        # 夏普比率按K线计算，抽样后近似放大sqrt(step)倍
+        self.scale: float = sqrt(step)
+
+        self.percentile: float = percentile
+        self.min_count: int = min_count
+        self.log_interval: int = log_interval
+        self.floor: float = floor
+
+        self.scores: Deque[float] = deque(maxlen=history)
+        self.results: List[Tuple[float, float]] = []        # 晋级信号的(阶段得分, 全量得分)
+        self.count: int = 0
+
+    def __call__(self, signal: ndarray) -> float:
+        """计算信号的适应度"""
+        signal = np.asarray(signal, dtype=float)
+        score: float = self.stage(signal[self.stage_slice]) / self.scale
+        self.count += 1
+
+        # 阶段回测没有交易的信号直接淘汰
+        if isnan(score):
+            value: float = self.floor - 2
+        elif self.check_promote(score):
+            full_score: float = self.full(signal)
+            self.results.append((score, full_score))
+
+            # 全量回测没有交易时同样排在最后
+            if isnan(full_score):
+                value = self.floor - 2
+            else:
+                value = max(full_score, self.floor)
+        else:
+            # 保持淘汰信号之间的排序，但低于所有晋级信号
+            value = self.floor - 1 + tanh(score) / 2
+
+        if self.log_interval and not self.count % self.log_interval:
+            statistics: dict = self.get_statistics()
+            print(
+                f"分阶段适应度：总数{statistics['total']}，"
+                f"淘汰比例{statistics['pruned_fraction']:.2%}，"
+                f"阶段得分相关性{statistics['correlation']:.4f}"
+            )
+
+        return value
+
+    def check_promote(self, score: float) -> bool:
+        """检查阶段得分是否晋级全量回测"""
+        self.scores.append(score)
+
+        if len(self.scores) <= self.min_count:
+            return True
+
+        threshold: float = np.percentile(self.scores, self.percentile)
+        return score >= threshold
+
+    def get_statistics(self) -> Dict[str, float]:
+        """获取淘汰比例以及晋级信号阶段得分和全量得分的相关系数"""
+        promoted: int = len(self.results)
+
+        correlation: float = np.nan
+        if promoted > 2:
+            results: ndarray = np.array(self.results)
+            results = results[np.isfinite(results).all(axis=1)]
+
+            if len(results) > 2:
+                correlation = np.corrcoef(results[:, 0], results[:, 1])[0, 1]
+
+        return {
+            "total": self.count,
+            "promoted": promoted,
+            "pruned_fraction": 1 - promoted / self.count if self.count else 0,
+            "correlation": correlation
+        }
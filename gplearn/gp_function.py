@@ -0,0 +1,201 @@
+from collections import OrderedDict
+from functools import partial
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from numpy import ndarray
+from numpy.lib.stride_tricks import sliding_window_view
+import pandas as pd
+
+from gplearn.functions import _Function, _function_map, make_function
+
+
+class FunctionCache:
+    """
+    算子计算结果的LRU缓存，键为算子名称和输入数组的内存地址、形状和步长。
+
+    缓存同时持有输入数组的引用，缓存期间输入数组的内存不会被释放和复用，
+    因此相同的键一定对应相同的输入数据，查询时无需读取整个数组。
+    四则运算也经过缓存，种群中相同的子树返回同一个结果数组，其上层算子的键也相同，
+    因此重复的子树只需计算一次，每一代演化结束后调用clear清空。
+    """
+
+    def __init__(self, size: int = 256) -> None:
+        """构造函数，size为最多缓存的数组数量"""
+        self.size: int = size
+        self.data: OrderedDict[tuple, Tuple[Tuple[ndarray, ...], ndarray]] = OrderedDict()
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: tuple) -> Optional[ndarray]:
+        """读取缓存结果，不存在时返回None"""
+        value: Optional[Tuple[Tuple[ndarray, ...], ndarray]] = self.data.get(key, None)
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value[1]
+
+    def put(self, key: tuple, args: Tuple[ndarray, ...], result: ndarray) -> None:
+        """写入缓存结果和对应的输入数组，超出容量时淘汰最久未使用的结果"""
+        self.data[key] = (args, result)
+        self.data.move_to_end(key)
+
+        if len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self.data.clear()
+
+    def get_statistics(self) -> Dict[str, float]:
+        """获取缓存命中统计"""
+        total: int = self.hits + self.misses
+
+        return {
+            "total": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0
+        }
+
+
+# 当前进程中的算子缓存
+function_cache: FunctionCache = FunctionCache()
+
+
+def ts_mean(x: ndarray, window: int) -> ndarray:
+    """滚动均值"""
+    return pd.Series(x).rolling(window).mean().to_numpy()
+
+
+def ts_std(x: ndarray, window: int) -> ndarray:
+    """滚动标准差"""
+    return pd.Series(x).rolling(window).std().to_numpy()
+
+
+def ts_rank(x: ndarray, window: int) -> ndarray:
+    """当前值在滚动窗口中的百分比排名"""
+    return pd.Series(x).rolling(window).rank(pct=True).to_numpy()
+
+
+def delta(x: ndarray, window: int) -> ndarray:
+    """当前值和window个周期之前的差值"""
+    result: ndarray = np.full(len(x), np.nan)
+    result[window:] = x[window:] - x[:-window]
+    return result
+
+
+def decay_linear(x: ndarray, window: int) -> ndarray:
+    """线性衰减加权均值，越近的数据权重越大"""
+    result: ndarray = np.full(len(x), np.nan)
+    if len(x) < window:
+        return result
+
+    weights: ndarray = np.arange(1, window + 1)
+    result[window - 1:] = sliding_window_view(x, window) @ weights / weights.sum()
+    return result
+
+
+def correlation(x: ndarray, y: ndarray, window: int) -> ndarray:
+    """滚动相关系数"""
+    return pd.Series(x).rolling(window).corr(pd.Series(y)).to_numpy()
+
+
+def get_key(name: str, args: Tuple[ndarray, ...]) -> tuple:
+    """以算子名称和输入数组的内存布局作为缓存键"""
+    return (name,) + tuple(
+        (arg.__array_interface__["data"][0], arg.shape, arg.strides, arg.dtype.str)
+        for arg in args
+    )
+
+
+def calculate(name: str, func: Callable, args: Tuple[ndarray, ...], finite: bool = True) -> ndarray:
+    """计算算子，相同输入直接返回缓存结果，finite时将无效数值置为0"""
+    args = tuple(np.asarray(arg) for arg in args)
+    key: tuple = get_key(name, args)
+
+    result: Optional[ndarray] = function_cache.get(key)
+    if result is not None:
+        return result
+
+    with np.errstate(all="ignore"):
+        result = func(*[arg.astype(float, copy=False) for arg in args])
+
+    # 窗口不足和计算溢出的数值置为0，满足gplearn对输出有限值的要求
+    if finite:
+        result = np.nan_to_num(result, nan=0, posinf=0, neginf=0)
+
+    result.setflags(write=False)
+
+    function_cache.put(key, args, result)
+    return result
+
+
+def make_ts_function(name: str, func: Callable, window: int, arity: int = 1) -> _Function:
+    """创建固定窗口的gplearn时序算子"""
+    function_name: str = f"{name}_{window}"
+    window_func: Callable = partial(func, window=window)
+
+    if arity == 1:
+        def ts_function(x: ndarray) -> ndarray:
+            return calculate(function_name, window_func, (x,))
+    else:
+        def ts_function(x: ndarray, y: ndarray) -> ndarray:
+            return calculate(function_name, window_func, (x, y))
+
+    return make_function(function=ts_function, name=function_name, arity=arity)
+
+
+def make_cached_function(name: str) -> _Function:
+    """创建经过缓存的gplearn内置四则运算，计算方式和内置函数完全相同"""
+    func: Callable = _function_map[name].function
+
+    def cached_function(x: ndarray, y: ndarray) -> ndarray:
+        return calculate(name, func, (x, y), False)
+
+    return make_function(function=cached_function, name=name, arity=2)
+
+
+def create_function_set(windows: Sequence[int] = (5, 10, 20, 60)) -> list:
+    """创建包含四则运算和各窗口时序算子的函数集"""
+    function_set: list = [make_cached_function(name) for name in ["add", "sub", "mul", "div"]]
+
+    for window in windows:
+        function_set.extend([
+            make_ts_function("ts_mean", ts_mean, window),
+            make_ts_function("ts_std", ts_std, window),
+            make_ts_function("ts_rank", ts_rank, window),
+            make_ts_function("delta", delta, window),
+            make_ts_function("decay_linear", decay_linear, window),
+            make_ts_function("correlation", correlation, window, 2),
+        ])
+
+    return function_set
+
+
+def fit_by_generation(estimator: object, x: ndarray, y: ndarray) -> None:
+    """
+    逐代演化，每一代结束后清空当前进程的算子缓存。
+
+    通过warm_start每次只多演化一代，gplearn会丢弃已演化各代的随机数种子，
+    结果和一次演化全部代数相同，达到stopping_criteria时同样提前停止。
+    """
+    generations: int = estimator.generations
+
+    for generation in range(1, generations + 1):
+        # 第一代重新开始演化，之后在已有种群上继续
+        estimator.set_params(generations=generation, warm_start=generation > 1)
+        estimator.fit(x, y)
+        function_cache.clear()
+
+        best_fitness: float = estimator.run_details_["best_fitness"][-1]
+        if estimator._metric.greater_is_better:
+            if best_fitness >= estimator.stopping_criteria:
+                break
+        elif best_fitness <= estimator.stopping_criteria:
+            break
@@ -0,0 +1,68 @@
+import os
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+from numpy import ndarray
+import pandas as pd
+
+from gp_fitness import FitnessCache, SignalFitness
+
+
+# 优先使用内存文件系统保存共享数据
+SHARED_FOLDER: str = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# 当前进程中已经创建的适应度函数，键为共享数据目录
+process_fitness: Dict[str, SignalFitness] = {}
+
+
+def share_data(filename: str, path: str) -> None:
+    """读取feather文件，将其中的数值列逐列保存为npy文件"""
+    df: pd.DataFrame = pd.read_feather(filename)
+
+    for name, column in df.select_dtypes("number").items():
+        np.save(Path(path).joinpath(name + ".npy"), column.to_numpy(dtype=float))
+
+
+def load_data(path: str) -> Dict[str, ndarray]:
+    """以内存映射方式只读打开共享数据，多个进程共享同一份物理内存"""
+    return {
+        filepath.stem: np.load(filepath, mmap_mode="r")
+        for filepath in sorted(Path(path).glob("*.npy"))
+    }
+
+
+class SharedFitness:
+    """
+    可以在进程之间传递的适应度函数，用于gplearn的多进程并行演化。
+
+    序列化时只包含共享数据目录和回测参数，各进程首次调用时以内存映射方式
+    只读打开收盘价数据并创建各自的缓存，不会为每个任务复制数据。
+    """
+
+    def __init__(self, path: str, cache_size: int = 100_000, **setting) -> None:
+        """构造函数，path为share_data保存数据的目录，setting为回测参数"""
+        self.path: str = path
+        self.cache_size: int = cache_size
+        self.setting: dict = setting
+
+    def __call__(self, y: ndarray, y_pred: ndarray, w: ndarray) -> float:
+        """计算适应度，参数和gplearn的make_fitness要求一致"""
+        fitness: SignalFitness = self.get_fitness()
+
+        # 检查y数据长度
+        if len(y) < len(fitness.close):
+            return 0
+
+        return fitness(y_pred)
+
+    def get_fitness(self) -> SignalFitness:
+        """获取当前进程中的适应度函数"""
+        fitness: SignalFitness = process_fitness.get(self.path, None)
+
+        if fitness is None or fitness.setting != self.setting:
+            close: ndarray = load_data(self.path)["close_price"]
+            fitness = SignalFitness(close, FitnessCache(self.cache_size), **self.setting)
+            process_fitness[self.path] = fitness
+
+        return fitness
@@ -0,0 +1,379 @@
+import json
+import os
+import shutil
+import time
+from abc import ABC, abstractmethod
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from pandas import DataFrame, Series
+
+from rank_store import build_rank_store
+
+
+# 上期所，大商所，郑商所共42个品种
+SYMBOLS: List[str] = [
+    'I', 'J', 'JM', 'EG', 'L', 'PP', 'V', 'A', 'B', 'C', 'CS', 'JD', 'M', 'P', 'Y',
+    'SF', 'SM', 'ZC', 'FG', 'MA', 'TA', 'AP', 'CF', 'CY', 'OI', 'RM', 'RS', 'SR',
+    'AG', 'AU', 'HC', 'RB', 'BU', 'FU', 'RU', 'SP', 'AL', 'CU', 'NI', 'PB', 'SN', 'ZN'
+]
+
+START_DATE: str = "2013-11-05"      # 持仓排名数据的起始日期
+RANK_COLUMNS: List[str] = ["trading_date", "commodity_id", "rank", "member_name", "volume", "volume_change"]
+SUM_COLUMNS: List[str] = ["rank", "volume", "volume_change"]
+
+
+class RankDatafeed(ABC):
+    """持仓排名数据源"""
+
+    @abstractmethod
+    def query_member_rank(self, symbol: str, start: str, end: str, rank_by: str) -> DataFrame:
+        """查询[start, end]内的会员持仓排名，rank_by为long或short，列同RANK_COLUMNS"""
+        pass
+
+    @abstractmethod
+    def query_total_oi(self, symbol: str, start: str, end: str) -> Series:
+        """查询[start, end]内品种所有合约的每日总持仓量，索引为trading_date"""
+        pass
+
+
+class RqdataRankDatafeed(RankDatafeed):
+    """米筐持仓排名数据源"""
+
+    def __init__(self, username: str, password: str) -> None:
+        """构造函数"""
+        self.username: str = username
+        self.password: str = password
+        self.instruments: Optional[DataFrame] = None
+
+        self.init()
+
+    def init(self) -> None:
+        """初始化米筐连接"""
+        import rqdatac
+
+        self.rq = rqdatac
+        self.rq.init(self.username, self.password)
+
+    def __getstate__(self) -> dict:
+        """传给子进程时不序列化rqdatac模块"""
+        state: dict = self.__dict__.copy()
+        state.pop("rq")
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        """在子进程中重新初始化连接"""
+        self.__dict__.update(state)
+        self.init()
+
+    def query_member_rank(self, symbol: str, start: str, end: str, rank_by: str) -> DataFrame:
+        """查询会员持仓排名"""
+        df: Optional[DataFrame] = self.rq.futures.get_member_rank(
+            symbol, start_date=start, end_date=end, rank_by=rank_by
+        )
+        if df is None:
+            return DataFrame(columns=RANK_COLUMNS)
+
+        df = df.reset_index()
+        df["trading_date"] = pd.to_datetime(df["trading_date"]).dt.strftime("%Y-%m-%d")
+        return df[RANK_COLUMNS]
+
+    def query_total_oi(self, symbol: str, start: str, end: str) -> Series:
+        """查询总持仓量，整段时间内的全部合约合并为一次查询"""
+        # 合约列表只需查询一次
+        if self.instruments is None:
+            self.instruments = self.rq.all_instruments(type="Future")
+
+        df: DataFrame = self.instruments
+        contracts: List[str] = df[
+            (df["underlying_symbol"] == symbol)
+            & (df["listed_date"] != "0000-00-00")
+            & (df["listed_date"] <= end)
+            & (df["de_listed_date"] >= start)
+        ]["order_book_id"].tolist()
+
+        price: Optional[DataFrame] = self.rq.get_price(
+            contracts, start_date=start, end_date=end, fields="open_interest", expect_df=True
+        )
+        if price is None:
+            return Series(dtype=float)
+
+        total_oi: Series = price["open_interest"].groupby(level="date").sum()
+        total_oi.index = pd.to_datetime(total_oi.index).strftime("%Y-%m-%d")
+        return total_oi
+
+
+class CsvRankDatafeed(RankDatafeed):
+    """
+    本地csv文件数据源，格式同米筐导出的原始数据，用于离线测试。
+
+    总持仓量读取total_oi_folder下的{symbol}_total_oi.csv，
+    不能指向生成器输出的processed_data目录，否则增量更新的输入会来自自身之前的输出。
+    """
+
+    def __init__(self, folder: Path, total_oi_folder: Optional[Path] = None) -> None:
+        """构造函数，total_oi_folder默认和原始数据目录相同"""
+        self.folder: Path = folder
+        self.total_oi_folder: Path = total_oi_folder or folder
+        self.cache: Dict[Path, DataFrame] = {}
+
+    def load_csv(self, path: Path) -> DataFrame:
+        """读取csv文件并缓存"""
+        if path not in self.cache:
+            self.cache[path] = pd.read_csv(path)
+        return self.cache[path]
+
+    def query_member_rank(self, symbol: str, start: str, end: str, rank_by: str) -> DataFrame:
+        """查询会员持仓排名"""
+        df: DataFrame = self.load_csv(self.folder.joinpath(f"{symbol}_{rank_by}.csv"))
+        return df[(df["trading_date"] >= start) & (df["trading_date"] <= end)]
+
+    def query_total_oi(self, symbol: str, start: str, end: str) -> Series:
+        """查询总持仓量"""
+        df: DataFrame = self.load_csv(self.total_oi_folder.joinpath(f"{symbol}_total_oi.csv"))
+        df = df[(df["trading_date"] >= start) & (df["trading_date"] <= end)]
+        return df.set_index("trading_date")[f"{symbol}_total_oi"]
+
+
+class RankDataGenerator:
+    """持仓排名数据的增量生成"""
+
+    def __init__(self, datafeed: RankDatafeed, raw_path: Path, data_path: Path) -> None:
+        """构造函数"""
+        self.datafeed: RankDatafeed = datafeed
+        self.raw_path: Path = raw_path          # 原始数据{symbol}_long/short.csv所在目录
+        self.data_path: Path = data_path        # 策略使用的processed_data目录
+
+        self.data_path.mkdir(exist_ok=True)
+
+        # 各品种已完成的最后交易日
+        self.checkpoint_path: Path = data_path.joinpath("checkpoint.json")
+        self.checkpoint: Dict[str, str] = {}
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path) as f:
+                self.checkpoint = json.load(f)
+
+    def update(
+        self,
+        symbols: List[str] = SYMBOLS,
+        end: str = "",
+        max_workers: int = 1,
+        rebuild: bool = False
+    ) -> Dict[str, float]:
+        """更新全部品种的数据到end日期，完成后重建面板数据，返回各品种耗时"""
+        if not end:
+            end = datetime.now().strftime("%Y-%m-%d")
+
+        # 各品种互相独立，可以分配到进程池并行处理
+        costs: Dict[str, float] = {}
+        if max_workers > 1:
+            with ProcessPoolExecutor(max_workers) as executor:
+                futures: Dict[Future, str] = {
+                    executor.submit(self.update_symbol, symbol, end, rebuild): symbol for symbol in symbols
+                }
+                for future in as_completed(futures):
+                    symbol: str = futures[future]
+                    try:
+                        last_date, costs[symbol] = future.result()
+                    except Exception as e:
+                        print(f"{symbol}数据生成失败：{e}")
+                        continue
+                    self.save_checkpoint(symbol, last_date, costs[symbol])
+        else:
+            for symbol in symbols:
+                try:
+                    last_date, costs[symbol] = self.update_symbol(symbol, end, rebuild)
+                except Exception as e:
+                    print(f"{symbol}数据生成失败：{e}")
+                    continue
+                self.save_checkpoint(symbol, last_date, costs[symbol])
+
+        build_rank_store(self.data_path)
+
+        return costs
+
+    def save_checkpoint(self, symbol: str, last_date: str, cost: float) -> None:
+        """记录断点，失败后从下一个交易日继续"""
+        print(f"{symbol}数据生成完成，耗时{cost:.2f}秒")
+
+        if last_date:
+            self.checkpoint[symbol] = last_date
+            save_json(self.checkpoint_path, self.checkpoint)
+
+    def update_symbol(self, symbol: str, end: str, rebuild: bool = False) -> Tuple[str, float]:
+        """追加单个品种的新交易日数据，rebuild时从头生成，返回完成的最后交易日和耗时"""
+        start_time: float = time.perf_counter()
+
+        start: str = START_DATE if rebuild else self.get_start_date(symbol)
+        if start > end:
+            return self.checkpoint.get(symbol, ""), time.perf_counter() - start_time
+
+        # 各文件先写入临时文件，全部成功后再统一替换，中途失败时原文件均保持不变
+        staged: List[Tuple[Path, Path]] = []
+        try:
+            for rank_by in ["long", "short"]:
+                rank: DataFrame = self.datafeed.query_member_rank(symbol, start, end, rank_by)
+                stage_csv(staged, self.raw_path.joinpath(f"{symbol}_{rank_by}.csv"), rank, False, rebuild)
+
+                # 只对新增的交易日做汇总
+                processed: DataFrame = rank.groupby("trading_date")[SUM_COLUMNS].sum()
+                processed_path: Path = self.data_path.joinpath(f"{symbol}_processed_{rank_by}.csv")
+                stage_csv(staged, processed_path, processed, True, rebuild)
+
+                rank = rank.assign(volume=rank["volume"] ** 2)
+                weighted: DataFrame = rank.groupby("trading_date")[SUM_COLUMNS].sum()
+                weighted_path: Path = self.data_path.joinpath(f"{symbol}_weighted_processed_{rank_by}.csv")
+                stage_csv(staged, weighted_path, weighted, True, rebuild)
+
+            total_oi: Series = self.datafeed.query_total_oi(symbol, start, end).astype(float)
+            total_oi = total_oi.rename(f"{symbol}_total_oi").rename_axis("trading_date")
+            stage_csv(staged, self.data_path.joinpath(f"{symbol}_total_oi.csv"), total_oi.to_frame(), True, rebuild)
+        except Exception:
+            for tmp_path, _ in staged:
+                tmp_path.unlink(missing_ok=True)
+            raise
+
+        # 替换过程中断时部分文件已更新而断点未前进，重试时stage_csv会跳过文件中已有的交易日
+        for tmp_path, path in staged:
+            os.replace(tmp_path, path)
+
+        last_date: str = min(read_last_date(path) for path in self.get_output_paths(symbol))
+        return last_date, time.perf_counter() - start_time
+
+    def get_output_paths(self, symbol: str) -> List[Path]:
+        """获取品种的全部处理后数据文件"""
+        return [
+            self.data_path.joinpath(f"{symbol}_processed_long.csv"),
+            self.data_path.joinpath(f"{symbol}_processed_short.csv"),
+            self.data_path.joinpath(f"{symbol}_weighted_processed_long.csv"),
+            self.data_path.joinpath(f"{symbol}_weighted_processed_short.csv"),
+            self.data_path.joinpath(f"{symbol}_total_oi.csv"),
+        ]
+
+    def get_start_date(self, symbol: str) -> str:
+        """获取品种需要更新的起始日期"""
+        last_date: str = self.checkpoint.get(symbol, "")
+
+        # 没有断点记录时以已有的处理后数据为准
+        if not last_date:
+            last_date = min(read_last_date(path) for path in self.get_output_paths(symbol))
+
+        if not last_date:
+            return START_DATE
+
+        start: datetime = datetime.strptime(last_date, "%Y-%m-%d") + timedelta(days=1)
+        return start.strftime("%Y-%m-%d")
+
+
+def read_last_date(path: Path) -> str:
+    """读取csv文件最后一行的交易日，文件不存在或无数据时返回空字符串"""
+    if not path.exists():
+        return ""
+
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        f.seek(max(f.tell() - 1024, 0))
+        lines: List[bytes] = f.read().splitlines()
+
+    last_line: str = lines[-1].decode("utf-8") if lines else ""
+    if not last_line or last_line.startswith("trading_date"):
+        return ""
+    return last_line.split(",")[0]
+
+
+def stage_csv(
+    staged: List[Tuple[Path, Path]],
+    path: Path,
+    df: DataFrame,
+    index: bool = True,
+    overwrite: bool = False
+) -> None:
+    """
+    将追加后的完整文件写入临时文件，(临时文件, 目标文件)记录到staged中，由调用方统一替换。
+
+    追加时跳过目标文件中已有的交易日，overwrite时覆盖原文件。
+    """
+    if not overwrite:
+        last_date: str = read_last_date(path)
+
+        if last_date and index:
+            df = df[df.index > last_date]
+        elif last_date:
+            df = df[df["trading_date"] > last_date]
+
+    if df.empty:
+        return
+
+    tmp_path: Path = path.with_name(path.name + ".tmp")
+
+    if overwrite or not path.exists():
+        df.to_csv(tmp_path, index=index)
+    else:
+        shutil.copyfile(path, tmp_path)
+        df.to_csv(tmp_path, mode="a", header=False, index=index)
+
+    staged.append((tmp_path, path))
+
+
+def save_json(path: Path, data: dict) -> None:
+    """原子写入json文件"""
+    tmp_path: Path = path.with_name(path.name + ".tmp")
+
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+
+    os.replace(tmp_path, path)
+
+
+def main() -> None:
+    """命令行入口，默认从米筐查询数据，原始csv保存在当前目录，处理后的数据保存在processed_data"""
+    parser: ArgumentParser = ArgumentParser(description="持仓排名数据生成")
+    parser.add_argument("--symbols", nargs="*", default=SYMBOLS, help="品种代码")
+    parser.add_argument("--end", default="", help="结束日期，默认为今天")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="进程数")
+    parser.add_argument("--rebuild", action="store_true", help="从头生成全部数据")
+    parser.add_argument(
+        "--datafeed",
+        choices=["rqdata", "csv"],
+        default="rqdata",
+        help="数据源，csv为读取本地导出文件的离线测试数据源"
+    )
+    parser.add_argument("--username", default="", help="米筐账号")
+    parser.add_argument("--password", default="", help="米筐密码")
+    parser.add_argument("--csv-folder", default="", help="csv数据源的原始数据目录")
+    parser.add_argument("--total-oi-folder", default="", help="csv数据源的总持仓量目录，默认同原始数据目录")
+    args: Namespace = parser.parse_args()
+
+    cwd: Path = Path.cwd()
+    data_path: Path = cwd.joinpath("processed_data")
+
+    if args.datafeed == "rqdata":
+        if not args.username or not args.password:
+            parser.error("米筐数据源需要提供--username和--password")
+
+        datafeed: RankDatafeed = RqdataRankDatafeed(args.username, args.password)
+    else:
+        if not args.csv_folder:
+            parser.error("csv数据源需要提供--csv-folder")
+
+        csv_folder: Path = Path(args.csv_folder)
+        total_oi_folder: Path = Path(args.total_oi_folder) if args.total_oi_folder else csv_folder
+
+        if total_oi_folder.resolve() == data_path.resolve():
+            parser.error("总持仓量不能读取processed_data目录，否则增量更新的输入来自自身之前的输出")
+
+        datafeed: RankDatafeed = CsvRankDatafeed(csv_folder, total_oi_folder)
+
+    generator: RankDataGenerator = RankDataGenerator(datafeed, cwd, data_path)
+
+    start_time: float = time.perf_counter()
+    generator.update(args.symbols, args.end, args.workers, args.rebuild)
+    print(f"全部完成，总耗时{time.perf_counter() - start_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,19 @@
-from typing import List, Dict
-# from datetime import datetime
-import os
-import pandas as pd
-from pandas import DataFrame
+from typing import List, Dict, Tuple
+from datetime import datetime, date
+from pathlib import Path
 import numpy as np
+from numpy import ndarray
 from vnpy_portfoliostrategy import StrategyTemplate, StrategyEngine
 from vnpy_portfoliostrategy.utility import PortfolioBarGenerator
 # from vnpy.trader.utility import BarGenerator, extract_vt_symbol
 from vnpy.trader.object import TickData, BarData
 
+# 实盘时以strategies.oi_concentration_strategy导入，rank_store需复制到同一目录
+try:
+    from .rank_store import RankStore
+except ImportError:
+    from rank_store import RankStore
+
 
 class OiConcentrationStrategy(StrategyTemplate):
     """"""
@@ -16,11 +21,15 @@ class OiConcentrationStrategy(StrategyTemplate):
     author = "VeighNa Elite"
 
     R = 5  # 时间窗口
+    quantile = 0.2  # 多空各自交易的品种比例
+    factor = "weightedlsdev2"  # 排序因子，可用"lrsrdev2:0.5,weightedlsdev2:0.5"的形式复合
     price_add = 5
     fixed_size = 1
 
     parameters = [
         "R",
+        "quantile",
+        "factor",
         "price_add",
         "fixed_size"
     ]
@@ -40,55 +49,39 @@ class OiConcentrationStrategy(StrategyTemplate):
         self.pbg = PortfolioBarGenerator(self.on_bars)
         self.targets: Dict[str, int] = {}
 
-        # 相对强弱
-        self.lrsr: Dict[str, List] = {}
-        self.weightedls: Dict[str, List] = {}
-        #  先初始化
-        for vt_symbol in self.vt_symbols:
-            self.lrsr[vt_symbol] = []
-            self.weightedls[vt_symbol] = []
-
-        # 相对强弱的异常度
-        self.lrsrdev1: Dict[str, float] = {}
-        self.lrsrdev2: Dict[str, float] = {}
-        self.lrsrdev3: Dict[str, float] = {}
-        self.weightedlsdev1: Dict[str, float] = {}
-        self.weightedlsdev2: Dict[str, float] = {}
-        self.weightedlsdev3: Dict[str, float] = {}
-
-        cwd = os.getcwd()
-        self.weighted_oi_long: Dict[str, DataFrame] = {}  # 加权的前20大会员多头持仓
-        self.weighted_oi_short: Dict[str, DataFrame] = {}  # 加权的前20大会员空头持仓
-        self.oi_long: Dict[str, DataFrame] = {}  # 原始的前20大会员多头持仓
-        self.oi_short: Dict[str, DataFrame] = {}  # 原始的前20大会员空头持仓
-        self.total_oi: Dict[str, DataFrame] = {}  # 总持仓量
-        # 上期所，大商所，郑商所共42个品种
-        symbols: List = [
-            'I888.DCE', 'J888.DCE', 'JM888.DCE', 'EG888.DCE',
-            'L888.DCE', 'PP888.DCE', 'V888.DCE', 'A888.DCE', 'B888.DCE',
-            'C888.DCE', 'CS888.DCE', 'JD888.DCE', 'M888.DCE', 'P888.DCE',
-            'Y888.DCE', 'SF888.CZCE', 'SM888.CZCE', 'ZC888.CZCE', 'FG888.CZCE',
-            'MA888.CZCE', 'TA888.CZCE', 'AP888.CZCE', 'CF888.CZCE',
-            'CY888.CZCE', 'OI888.CZCE', 'RM888.CZCE', 'RS888.CZCE',
-            'SR888.CZCE', 'AG888.SHFE', 'AU888.SHFE', 'HC888.SHFE',
-            'RB888.SHFE', 'BU888.SHFE', 'FU888.SHFE', 'RU888.SHFE',
-            'SP888.SHFE', 'AL888.SHFE', 'CU888.SHFE', 'NI888.SHFE',
-            'PB888.SHFE', 'SN888.SHFE', 'ZN888.SHFE']
-        for symbol in symbols:
-            self.weighted_oi_long[symbol] = pd.read_csv(cwd + '\\processed_data' + '\\' + symbol.split('888')[0] + '_weighted_processed_long.csv')
-            self.weighted_oi_long[symbol].index = self.weighted_oi_long[symbol]['trading_date']
-        for symbol in symbols:
-            self.weighted_oi_short[symbol] = pd.read_csv(cwd + '\\processed_data' + '\\' + symbol.split('888')[0] + '_weighted_processed_short.csv')
-            self.weighted_oi_short[symbol].index = self.weighted_oi_short[symbol]['trading_date']
-        for symbol in symbols:
-            self.oi_long[symbol] = pd.read_csv(cwd + '\\processed_data' + '\\' + symbol.split('888')[0] + '_processed_long.csv')
-            self.oi_long[symbol].index = self.oi_long[symbol]['trading_date']
-        for symbol in symbols:
-            self.oi_short[symbol] = pd.read_csv(cwd + '\\processed_data' + '\\' + symbol.split('888')[0] + '_processed_short.csv')
-            self.oi_short[symbol].index = self.oi_short[symbol]['trading_date']
-        for symbol in symbols:
-            self.total_oi[symbol] = pd.read_csv(cwd + '\\processed_data' + '\\' + symbol.split('888')[0] + '_total_oi.csv')
-            self.total_oi[symbol].index = self.total_oi[symbol]['trading_date']
+        # 异常度需要至少1天的历史数据，R小于2时无法计算
+        if self.R < 2:
+            self.write_log(f"时间窗口R={self.R}过小，已调整为2")
+            self.R = 2
+
+        # 相对强弱及其异常度的滚动缓存
+        self.lrsr_buffer: DeviationBuffer = DeviationBuffer(self.R - 1, len(self.vt_symbols))
+        self.weightedls_buffer: DeviationBuffer = DeviationBuffer(self.R - 1, len(self.vt_symbols))
+
+        # 排序因子在六个异常度指标上的权重
+        self.factor_weights: ndarray = parse_factor(self.factor)
+
+        # 只加载订阅品种的持仓排名数据，对齐为交易日×品种的二维数组
+        store: RankStore = RankStore(Path.cwd().joinpath("processed_data"))
+        rank_data: Dict[str, ndarray] = store.load(
+            [vt_symbol.split('888')[0] for vt_symbol in self.vt_symbols]
+        )
+        self.oi_long: ndarray = rank_data["long"]                        # 原始的前20大会员多头持仓
+        self.oi_short: ndarray = rank_data["short"]                      # 原始的前20大会员空头持仓
+        self.weighted_oi_long: ndarray = rank_data["weighted_long"]      # 加权的前20大会员多头持仓
+        self.weighted_oi_short: ndarray = rank_data["weighted_short"]    # 加权的前20大会员空头持仓
+        self.total_oi: ndarray = rank_data["total_oi"]                   # 总持仓量
+
+        # 数据齐全且总持仓量为正的位置才可计算指标
+        self.rank_mask: ndarray = np.isfinite(
+            self.oi_long + self.oi_short + self.weighted_oi_long + self.weighted_oi_short + self.total_oi
+        )
+        self.rank_mask[self.rank_mask] = self.total_oi[self.rank_mask] > 0
+
+        # 品种和交易日到整数索引的映射
+        self.symbol_index: Dict[str, int] = {vt_symbol: i for i, vt_symbol in enumerate(self.vt_symbols)}
+        self.date_index: Dict[date, int] = {d: i for i, d in enumerate(store.dates.tolist())}
+        self.missing_symbols: List[str] = []
 
     def on_init(self):
         """
@@ -118,61 +111,59 @@ class OiConcentrationStrategy(StrategyTemplate):
     def on_bars(self, bars: Dict[str, BarData]):
         """"""
         self.cancel_all()
-        #  清空之前的信号，确保字典里面装的都是今天的
-        self.lrsrdev1.clear()
-        self.lrsrdev2.clear()
-        self.weightedlsdev1.clear()
-        self.weightedlsdev2.clear()
 
         #  计算指标，找到排名前20%和后20%的品种
-        # 先计算LRSR指标
-        for vt_symbol in bars.keys():
-            try:
-                # total_oi: float = bars[vt_symbol].open_interest用主力持仓排名取代全部合约
-                dt = bars[vt_symbol].datetime
-                total_oi: float = self.total_oi[vt_symbol][vt_symbol.split('888')[0] + '_total_oi'][dt.strftime('%Y-%m-%d')]
-                oi_long: float = self.oi_long[vt_symbol]['volume'][dt.strftime('%Y-%m-%d')]  # 该品种当天前20大会员多头持仓
-                oi_short: float = self.oi_short[vt_symbol]['volume'][dt.strftime('%Y-%m-%d')]  # 该品种当天前20大会员空头持仓
-                lrsr: float = (oi_long - oi_short) / total_oi
-                self.lrsr[vt_symbol].append(lrsr)
-            except:
-                print('持仓排名数据缺失')
-
-        # 再计算WeightedLS指标
-        for vt_symbol in bars.keys():
-            try:
-                # total_oi: float = bars[vt_symbol].open_interest
-                dt = bars[vt_symbol].datetime
-                total_oi: float = self.total_oi[vt_symbol][vt_symbol.split('888')[0] + '_total_oi'][dt.strftime('%Y-%m-%d')]
-                oi_long: float = self.weighted_oi_long[vt_symbol]['volume'][dt.strftime('%Y-%m-%d')]  # 该品种当天前20大会员多头持仓
-                oi_short: float = self.weighted_oi_short[vt_symbol]['volume'][dt.strftime('%Y-%m-%d')]  # 该品种当天前20大会员空头持仓
-                weightedls: float = (oi_long - oi_short) / total_oi
-                self.weightedls[vt_symbol].append(weightedls)
-            except:
-                print('持仓排名数据缺失')
-
-        #  计算异常度指标，只计算dev1和dev2,共4个
-        for vt_symbol in bars.keys():
-            if len(self.lrsr[vt_symbol]) >= self.R:
-                mean = np.mean(self.lrsr[vt_symbol][-self.R: -1])
-                std = np.std(self.lrsr[vt_symbol][-self.R: -1])
-                self.lrsrdev1[vt_symbol] = (self.lrsr[vt_symbol][-1] - mean) / mean
-                self.lrsrdev2[vt_symbol] = (self.lrsr[vt_symbol][-1] - mean) / std
-                mean = np.mean(self.weightedls[vt_symbol][-self.R: -1])
-                std = np.std(self.weightedls[vt_symbol][-self.R: -1])
-                self.weightedlsdev1[vt_symbol] = (self.weightedls[vt_symbol][-1] - mean) / mean
-                self.weightedlsdev2[vt_symbol] = (self.weightedls[vt_symbol][-1] - mean) / std
-
-        #  尝试使用weightedlsdev2指标来搞
-
-        ascending_sort = sorted(self.weightedlsdev2.items(),  key=lambda d: d[1], reverse=False)
-        trading_num = round(len(ascending_sort) * 0.2)  # 买卖数量，前后20%
-        long_symbols: List = []
-        short_symbols: List = []
-        for item in ascending_sort[:trading_num]:  # 值最小的20%应该做空
-            short_symbols.append(item[0])
-        for item in ascending_sort[-trading_num:]:  # 值最大的20%要买入
-            long_symbols.append(item[0])
+        # 当天有行情且有持仓排名数据的品种
+        dt: datetime = next(iter(bars.values())).datetime
+        ix: int = self.date_index.get(dt.date(), None)
+
+        bar_mask: ndarray = np.array([vt_symbol in bars for vt_symbol in self.vt_symbols])
+        if ix is None:
+            available: ndarray = np.zeros(len(self.vt_symbols), dtype=bool)
+        else:
+            available: ndarray = bar_mask & self.rank_mask[ix]
+
+        # 缺失品种发生变化时才输出日志
+        missing_symbols: List[str] = [self.vt_symbols[i] for i in np.flatnonzero(bar_mask & ~available)]
+        if missing_symbols != self.missing_symbols:
+            self.missing_symbols = missing_symbols
+            if missing_symbols:
+                self.write_log(f"持仓排名数据缺失：{','.join(missing_symbols)}")
+
+        # 计算LRSR和WeightedLS指标
+        if ix is not None:
+            # total_oi = bars[vt_symbol].open_interest用主力持仓排名取代全部合约
+            total_oi: ndarray = self.total_oi[ix]
+            lrsr: ndarray = np.divide(
+                self.oi_long[ix] - self.oi_short[ix], total_oi,
+                out=np.full(len(total_oi), np.nan), where=available
+            )
+            weightedls: ndarray = np.divide(
+                self.weighted_oi_long[ix] - self.weighted_oi_short[ix], total_oi,
+                out=np.full(len(total_oi), np.nan), where=available
+            )
+
+            # 更新滚动缓存，同时计算异常度指标
+            self.lrsr_buffer.update(lrsr, available)
+            self.weightedls_buffer.update(weightedls, available)
+
+        # 计算排序因子，找到排名前后一定比例的品种
+        devs: ndarray = np.stack([
+            self.lrsr_buffer.dev1,
+            self.lrsr_buffer.dev2,
+            self.lrsr_buffer.dev3,
+            self.weightedls_buffer.dev1,
+            self.weightedls_buffer.dev2,
+            self.weightedls_buffer.dev3
+        ])
+        used: ndarray = self.factor_weights != 0
+        scores: ndarray = self.factor_weights[used] @ devs[used]
+        scores[~(bar_mask & self.weightedls_buffer.inited)] = np.nan
+
+        short_index, long_index = select_symbols(scores, self.quantile)    # 值最小的做空，最大的买入
+        direction: ndarray = np.zeros(len(self.vt_symbols), dtype=int)
+        direction[short_index] = -1
+        direction[long_index] = 1
 
         #  先全部清仓
         for vt_symbol in self.vt_symbols:
@@ -184,14 +175,9 @@ class OiConcentrationStrategy(StrategyTemplate):
                 price = bars[vt_symbol].close_price + self.price_add
                 self.cover(vt_symbol, price, abs(current_pos))
 
-        # 再重新等权重分配目标仓位
-        for vt_symbol in bars.keys():
-            if vt_symbol in long_symbols:  # 在买入的列表里，花10000块钱去买
-                target_pos = 10000 / bars[vt_symbol].close_price
-            elif vt_symbol in short_symbols:  # 在卖出的列表里，10000块钱去卖
-                target_pos = -10000 / bars[vt_symbol].close_price
-            else:
-                target_pos = 0
+        # 再重新等权重分配目标仓位，多空各花10000块钱
+        for vt_symbol, bar in bars.items():
+            target_pos = int(direction[self.symbol_index[vt_symbol]]) * 10000 / bar.close_price
             self.targets[vt_symbol] = round(target_pos)
 
         # 下单交易
@@ -205,3 +191,105 @@ class OiConcentrationStrategy(StrategyTemplate):
                 self.short(vt_symbol, price, abs(trading_volume))
 
         self.put_event()
+
+
+DEV_NAMES: List[str] = [
+    "lrsrdev1",
+    "lrsrdev2",
+    "lrsrdev3",
+    "weightedlsdev1",
+    "weightedlsdev2",
+    "weightedlsdev3"
+]
+
+
+def parse_factor(factor: str) -> ndarray:
+    """解析排序因子字符串，返回六个异常度指标的权重"""
+    weights: ndarray = np.zeros(len(DEV_NAMES))
+
+    for item in factor.split(","):
+        name, _, weight = item.strip().partition(":")
+        weights[DEV_NAMES.index(name)] += float(weight) if weight else 1
+
+    return weights
+
+
+def select_symbols(scores: ndarray, quantile: float) -> Tuple[ndarray, ndarray]:
+    """横截面选出得分最低和最高的品种，nan不参与排序，返回两组品种索引"""
+    valid: ndarray = np.flatnonzero(~np.isnan(scores))
+    trading_num: int = round(len(valid) * quantile)
+
+    if not trading_num:
+        empty: ndarray = np.array([], dtype=int)
+        return empty, empty
+
+    # 同值时按升序稳定排序的结果取舍，即低分组取靠前的品种，高分组取靠后的品种
+    values: ndarray = scores[valid]
+    lowest: ndarray = valid[partition_index(values, trading_num)]
+    highest: ndarray = valid[len(values) - 1 - partition_index(-values[::-1], trading_num)]
+    return lowest, highest
+
+
+def partition_index(values: ndarray, k: int) -> ndarray:
+    """选出最小的k个值的位置，同值时优先取靠前的位置"""
+    threshold: float = np.partition(values, k - 1)[k - 1]
+    below: ndarray = np.flatnonzero(values < threshold)
+    equal: ndarray = np.flatnonzero(values == threshold)
+    return np.concatenate([below, equal[:k - len(below)]])
+
+
+class DeviationBuffer:
+    """按品种滚动计算异常度指标的环形缓存"""
+
+    def __init__(self, size: int, count: int) -> None:
+        """构造函数"""
+        if size < 1:
+            raise ValueError(f"历史窗口长度必须大于0：{size}")
+
+        self.size: int = size                               # 历史窗口长度，即R-1
+        self.buffer: ndarray = np.zeros((size, count))      # 每列为一个品种的历史数据
+        self.index: ndarray = np.zeros(count, dtype=int)    # 各品种下一个写入位置
+        self.count: ndarray = np.zeros(count, dtype=int)    # 各品种已缓存的数据量
+
+        # 窗口内的累计和与平方和
+        self.sum: ndarray = np.zeros(count)
+        self.square_sum: ndarray = np.zeros(count)
+
+        # 最近一次计算的异常度，历史不足的品种为nan
+        self.dev1: ndarray = np.full(count, np.nan)     # 相对于历史均值的偏离
+        self.dev2: ndarray = np.full(count, np.nan)     # 标准化因子值
+        self.dev3: ndarray = np.full(count, np.nan)     # 历史分位点
+        self.inited: ndarray = np.zeros(count, dtype=bool)
+
+    def update(self, values: ndarray, mask: ndarray) -> None:
+        """写入mask所选品种的当天数值，并计算其异常度"""
+        # 历史窗口已满的品种先计算异常度
+        ready: ndarray = mask & (self.count >= self.size)
+        if ready.any():
+            value: ndarray = values[ready]
+            mean: ndarray = self.sum[ready] / self.size
+            var: ndarray = np.maximum(self.square_sum[ready] / self.size - mean ** 2, 0)
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.dev1[ready] = (value - mean) / mean
+                self.dev2[ready] = (value - mean) / np.sqrt(var)
+            self.dev3[ready] = (self.buffer[:, ready] < value).sum(axis=0) / self.size
+            self.inited[ready] = True
+
+        # 写入新数据，窗口已满时替换最早的数据
+        columns: ndarray = np.flatnonzero(mask)
+        rows: ndarray = self.index[columns]
+        value: ndarray = values[columns]
+        old: ndarray = np.where(self.count[columns] >= self.size, self.buffer[rows, columns], 0)
+
+        self.sum[columns] += value - old
+        self.square_sum[columns] += value ** 2 - old ** 2
+        self.buffer[rows, columns] = value
+
+        self.index[columns] = (rows + 1) % self.size
+        self.count[columns] = np.minimum(self.count[columns] + 1, self.size)
+
+        # 每写满一轮用缓存重新求和，避免累计误差
+        wrapped: ndarray = columns[self.index[columns] == 0]
+        self.sum[wrapped] = self.buffer[:, wrapped].sum(axis=0)
+        self.square_sum[wrapped] = (self.buffer[:, wrapped] ** 2).sum(axis=0)
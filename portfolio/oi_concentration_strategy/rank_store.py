@@ -0,0 +1,144 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+import pandas as pd
+
+
+# 面板数据字段及其对应的processed_data文件后缀
+FIELDS: Dict[str, str] = {
+    "long": "_processed_long.csv",                      # 前20大会员多头持仓
+    "short": "_processed_short.csv",                    # 前20大会员空头持仓
+    "weighted_long": "_weighted_processed_long.csv",    # 加权的前20大会员多头持仓
+    "weighted_short": "_weighted_processed_short.csv",  # 加权的前20大会员空头持仓
+    "total_oi": "_total_oi.csv",                        # 总持仓量
+}
+
+STORE_FOLDER: str = "rank_store"
+MANIFEST_NAME: str = "manifest.json"
+
+
+def load_field(data_path: Path, symbol: str, field: str) -> pd.Series:
+    """读取单个品种单个字段的处理后数据"""
+    df: pd.DataFrame = pd.read_csv(data_path.joinpath(symbol + FIELDS[field]), index_col="trading_date")
+
+    if field == "total_oi":
+        return df[symbol + "_total_oi"]
+    return df["volume"]
+
+
+def get_manifest(data_path: Path) -> Dict[str, List[int]]:
+    """获取processed_data下各csv文件的修改时间和大小"""
+    manifest: Dict[str, List[int]] = {}
+
+    for f in sorted(data_path.glob("*.csv")):
+        stat: os.stat_result = f.stat()
+        manifest[f.name] = [stat.st_mtime_ns, stat.st_size]
+
+    return manifest
+
+
+def load_manifest(store_path: Path) -> Dict[str, List[int]]:
+    """读取生成面板时记录的csv文件清单，不存在时返回空字典"""
+    manifest_path: Path = store_path.joinpath(MANIFEST_NAME)
+    if not manifest_path.exists():
+        return {}
+
+    with open(manifest_path, encoding="UTF-8") as f:
+        return json.load(f)
+
+
+def check_rank_store(data_path: Path) -> bool:
+    """检查npy面板是否和当前的csv文件一致"""
+    store_path: Path = data_path.joinpath(STORE_FOLDER)
+    return load_manifest(store_path) == get_manifest(data_path)
+
+
+def build_rank_store(data_path: Path) -> None:
+    """将processed_data下的csv文件转换为品种×字段×交易日的npy面板"""
+    # 读取前记录文件清单，读取期间csv再被修改时下次检查仍会重新生成
+    manifest: Dict[str, List[int]] = get_manifest(data_path)
+
+    symbols: List[str] = sorted(
+        f.name[:-len(FIELDS["total_oi"])] for f in data_path.glob("*" + FIELDS["total_oi"])
+    )
+
+    series: Dict[Tuple[str, str], pd.Series] = {}
+    for symbol in symbols:
+        for field in FIELDS:
+            series[(symbol, field)] = load_field(data_path, symbol, field)
+
+    # 全部品种交易日的并集作为统一的日期索引
+    index: pd.Index = pd.Index([])
+    for s in series.values():
+        index = index.union(s.index)
+
+    dates: ndarray = np.array(index, dtype="datetime64[D]")
+
+    # 按品种连续存放，只加载部分品种时仅读取对应的数据块
+    panel: ndarray = np.full((len(symbols), len(FIELDS), len(dates)), np.nan)
+    for i, symbol in enumerate(symbols):
+        for j, field in enumerate(FIELDS):
+            panel[i, j] = series[(symbol, field)].reindex(index).to_numpy(dtype=float)
+
+    store_path: Path = data_path.joinpath(STORE_FOLDER)
+    store_path.mkdir(exist_ok=True)
+
+    save_npy(store_path.joinpath("dates.npy"), dates)
+    save_npy(store_path.joinpath("symbols.npy"), np.array(symbols))
+    save_npy(store_path.joinpath("panel.npy"), panel)
+
+    # 清单最后写入，生成中断时清单不一致，下次读取会重新生成
+    manifest_path: Path = store_path.joinpath(MANIFEST_NAME)
+    tmp_path: Path = manifest_path.with_name(MANIFEST_NAME + ".tmp")
+
+    with open(tmp_path, "w", encoding="UTF-8") as f:
+        json.dump(manifest, f)
+
+    os.replace(tmp_path, manifest_path)
+
+
+def save_npy(path: Path, array: ndarray) -> None:
+    """先写入临时文件再替换，避免读到写了一半的文件"""
+    tmp_path: Path = path.with_name(path.name + ".tmp")
+
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+
+    os.replace(tmp_path, path)
+
+
+class RankStore:
+    """持仓排名面板数据的内存映射读取器"""
+
+    def __init__(self, data_path: Path) -> None:
+        """构造函数，csv文件在生成面板之后有变化时重新生成"""
+        store_path: Path = data_path.joinpath(STORE_FOLDER)
+        if not check_rank_store(data_path):
+            build_rank_store(data_path)
+
+        self.dates: ndarray = np.load(store_path.joinpath("dates.npy"))
+        self.symbols: List[str] = np.load(store_path.joinpath("symbols.npy")).tolist()
+
+        # 内存映射打开，实际读取推迟到load调用
+        self.panel: ndarray = np.load(store_path.joinpath("panel.npy"), mmap_mode="r")
+
+    def load(self, symbols: List[str]) -> Dict[str, ndarray]:
+        """加载指定品种的数据，返回各字段交易日×品种的二维数组"""
+        data: Dict[str, ndarray] = {
+            field: np.full((len(self.dates), len(symbols)), np.nan) for field in FIELDS
+        }
+
+        for i, symbol in enumerate(symbols):
+            # 存储中没有的品种保持为缺失值
+            if symbol not in self.symbols:
+                continue
+
+            values: ndarray = self.panel[self.symbols.index(symbol)]
+            for j, field in enumerate(FIELDS):
+                data[field][:, i] = values[j]
+
+        return data
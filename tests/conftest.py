@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+
+# 策略和公共模块均以脚本目录的方式导入，和回测notebook中的sys.path设置一致
+ROOT: Path = Path(__file__).parent.parent
+
+PATHS: list = [
+    ROOT.joinpath("cta"),
+    *ROOT.joinpath("cta").glob("*_strategy"),
+    *ROOT.joinpath("portfolio").glob("*_strategy")
+]
+
+for path in PATHS:
+    if str(path) not in sys.path:
+        sys.path.append(str(path))
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from numpy import ndarray
+
+from vnpy.trader.constant import Exchange, Interval
+from vnpy.trader.database import BarOverview
+from vnpy.trader.object import BarData
+
+from elite_cache import BarCache, load_npz
+
+
+SYMBOL: str = "rb2010"
+EXCHANGE: Exchange = Exchange.SHFE
+INTERVAL: Interval = Interval.MINUTE
+
+
+def generate_bars(start: datetime, end: datetime) -> List[BarData]:
+    """每天9点到9点59生成1分钟K线"""
+    bars: List[BarData] = []
+
+    day: datetime = start
+    while day <= end:
+        for minute in range(60):
+            price: float = 3000 + len(bars)
+            bars.append(BarData(
+                symbol=SYMBOL,
+                exchange=EXCHANGE,
+                interval=INTERVAL,
+                datetime=day.replace(hour=9, minute=minute),
+                open_price=price,
+                high_price=price + 1,
+                low_price=price - 1,
+                close_price=price,
+                volume=1,
+                gateway_name="DB"
+            ))
+        day += timedelta(days=1)
+
+    return bars
+
+
+class FakeDatabase:
+    """只实现K线查询和汇总的内存数据库，可以模拟数据补录"""
+
+    def __init__(self) -> None:
+        self.bars: List[BarData] = []
+        self.queries: List[tuple] = []
+
+    def save_bars(self, bars: List[BarData]) -> None:
+        self.bars = sorted(self.bars + bars, key=lambda bar: bar.datetime)
+
+    def load_bar_data(
+        self,
+        symbol: str,
+        exchange: Exchange,
+        interval: Interval,
+        start: datetime,
+        end: datetime
+    ) -> List[BarData]:
+        self.queries.append((start, end))
+        return [bar for bar in self.bars if start <= bar.datetime <= end]
+
+    def get_bar_overview(self) -> List[BarOverview]:
+        if not self.bars:
+            return []
+
+        return [BarOverview(
+            symbol=SYMBOL,
+            exchange=EXCHANGE,
+            interval=INTERVAL,
+            count=len(self.bars),
+            start=self.bars[0].datetime,
+            end=self.bars[-1].datetime
+        )]
+
+
+def load_january(cache: BarCache) -> Dict[str, ndarray]:
+    return cache.load_arrays(SYMBOL, EXCHANGE, INTERVAL, datetime(2020, 1, 1), datetime(2020, 1, 31, 23, 59))
+
+
+def test_backfill(tmp_path: Path) -> None:
+    """数据库补录K线后，缓存能读取到补录的部分，补全之后不再查询数据库"""
+    database: FakeDatabase = FakeDatabase()
+    cache: BarCache = BarCache(tmp_path)
+    cache.database = database
+
+    file_path: Path = tmp_path.joinpath(f"{SYMBOL}.{EXCHANGE.value}", INTERVAL.value, "2020-01.npz")
+
+    # 数据库为空时不写入缓存文件
+    assert len(load_january(cache)["datetime"]) == 0
+    assert not file_path.exists()
+
+    # 只有部分数据时，截止时间为最后一根K线
+    database.save_bars(generate_bars(datetime(2020, 1, 1), datetime(2020, 1, 10)))
+    assert len(load_january(cache)["datetime"]) == 600
+
+    covered, _ = load_npz(file_path)
+    assert covered == datetime(2020, 1, 10, 9, 59)
+
+    # 补录月内剩余数据和之后的数据
+    database.save_bars(generate_bars(datetime(2020, 1, 11), datetime(2020, 2, 5)))
+    arrays: Dict[str, ndarray] = load_january(cache)
+
+    expected: List[BarData] = [bar for bar in database.bars if bar.datetime.month == 1]
+    np.testing.assert_array_equal(arrays["close_price"], [bar.close_price for bar in expected])
+    assert database.queries[-1][0] == datetime(2020, 1, 10, 9, 59, 1)
+
+    covered, _ = load_npz(file_path)
+    assert covered == datetime(2020, 1, 31, 23, 59)
+
+    # 周期已完整，不再查询数据库
+    count: int = len(database.queries)
+    load_january(cache)
+    assert len(database.queries) == count
@@ -0,0 +1,44 @@
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+from numpy import ndarray
+import pytest
+
+from vnpy.trader.object import BarData
+
+import elite_loader
+from elite_loader import load_array_chunks, load_bar_chunks
+from elite_utility import BAR_FIELDS, bars_to_arrays
+from test_elite_cache import EXCHANGE, INTERVAL, SYMBOL, FakeDatabase, generate_bars
+
+
+START: datetime = datetime(2020, 1, 1)
+END: datetime = datetime(2020, 3, 31, 23, 59)
+
+
+@pytest.fixture
+def database(monkeypatch: pytest.MonkeyPatch) -> FakeDatabase:
+    database: FakeDatabase = FakeDatabase()
+    database.save_bars(generate_bars(START, END))
+
+    monkeypatch.setattr(elite_loader, "get_database", lambda: database)
+    return database
+
+
+def test_bar_chunks(database: FakeDatabase) -> None:
+    """各段K线按时间顺序首尾相接，不重复也不遗漏"""
+    chunks: List[List[BarData]] = list(load_bar_chunks(SYMBOL, EXCHANGE, INTERVAL, START, END, 7, 3))
+
+    assert len(chunks) == 13
+    assert [bar for bars in chunks for bar in bars] == database.bars
+
+
+def test_array_chunks(database: FakeDatabase) -> None:
+    """分段返回的数组拼接后和一次性转换的结果一致"""
+    chunks: List[Dict[str, ndarray]] = list(load_array_chunks(SYMBOL, EXCHANGE, INTERVAL, START, END, 7, 3))
+    expected: Dict[str, ndarray] = bars_to_arrays(database.bars)
+
+    assert len(chunks) == 13
+    for name in ["datetime"] + BAR_FIELDS:
+        np.testing.assert_array_equal(np.concatenate([arrays[name] for arrays in chunks]), expected[name])
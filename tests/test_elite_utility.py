@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import numpy as np
+from numpy import ndarray
+import pytest
+import talib
+
+from vnpy.trader.constant import Exchange, Interval
+from vnpy.trader.object import BarData
+
+from elite_utility import (
+    AtrIndicator,
+    EmaIndicator,
+    SmaIndicator,
+    StreamingArrayManager,
+    WmaIndicator
+)
+
+
+WINDOWS: List[int] = [1, 2, 3, 10, 50]
+
+
+def generate_arrays(n: int = 5000, seed: int = 0) -> Dict[str, ndarray]:
+    """生成随机游走的K线数组"""
+    rng: np.random.Generator = np.random.default_rng(seed)
+
+    close: ndarray = 4000 + np.cumsum(rng.normal(0, 5, n))
+    open_: ndarray = close + rng.normal(0, 2, n)
+    high: ndarray = np.maximum(open_, close) + rng.uniform(0, 5, n)
+    low: ndarray = np.minimum(open_, close) - rng.uniform(0, 5, n)
+
+    return {
+        "open_price": open_,
+        "high_price": high,
+        "low_price": low,
+        "close_price": close,
+        "volume": rng.uniform(100, 1000, n),
+        "turnover": rng.uniform(1e6, 1e7, n),
+        "open_interest": rng.uniform(1e4, 2e4, n)
+    }
+
+
+def generate_bars(arrays: Dict[str, ndarray]) -> List[BarData]:
+    """将K线数组转换为BarData列表"""
+    start: datetime = datetime(2020, 1, 2, 9)
+
+    return [
+        BarData(
+            symbol="IF888",
+            exchange=Exchange.CFFEX,
+            datetime=start + timedelta(minutes=i),
+            interval=Interval.MINUTE,
+            gateway_name="TEST",
+            **{name: float(array[i]) for name, array in arrays.items()}
+        )
+        for i in range(len(arrays["close_price"]))
+    ]
+
+
+def run_indicator(indicator: object, update: Callable, n: int) -> ndarray:
+    """逐个推送数据，收集每一步的输出"""
+    return np.array([update(indicator, i) for i in range(n)])
+
+
+@pytest.fixture(scope="module")
+def arrays() -> Dict[str, ndarray]:
+    """随机K线数组"""
+    return generate_arrays()
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_sma(arrays: Dict[str, ndarray], window: int) -> None:
+    """SMA累加顺序和talib一致，结果逐位相同"""
+    close: ndarray = arrays["close_price"]
+    result: ndarray = run_indicator(SmaIndicator(window), lambda ind, i: ind.update(close[i]), len(close))
+
+    np.testing.assert_array_equal(result, talib.SMA(close, window))
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_ema(arrays: Dict[str, ndarray], window: int) -> None:
+    """EMA初值和递推方式和talib一致，结果逐位相同"""
+    close: ndarray = arrays["close_price"]
+    result: ndarray = run_indicator(EmaIndicator(window), lambda ind, i: ind.update(close[i]), len(close))
+
+    np.testing.assert_array_equal(result, talib.EMA(close, window))
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_wma(arrays: Dict[str, ndarray], window: int) -> None:
+    """WMA定期重新求和，和talib的递推结果只有浮点误差"""
+    close: ndarray = arrays["close_price"]
+    result: ndarray = run_indicator(WmaIndicator(window), lambda ind, i: ind.update(close[i]), len(close))
+
+    expected: ndarray = close if window == 1 else talib.WMA(close, window)
+    np.testing.assert_allclose(result, expected, rtol=1e-13, equal_nan=True)
+    np.testing.assert_array_equal(np.isnan(result), np.isnan(expected))
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_atr(arrays: Dict[str, ndarray], window: int) -> None:
+    """ATR以Wilder方式平滑，和talib只有浮点误差"""
+    high: ndarray = arrays["high_price"]
+    low: ndarray = arrays["low_price"]
+    close: ndarray = arrays["close_price"]
+
+    result: ndarray = run_indicator(
+        AtrIndicator(window), lambda ind, i: ind.update(high[i], low[i], close[i]), len(close)
+    )
+
+    expected: ndarray = talib.TRANGE(high, low, close) if window == 1 else talib.ATR(high, low, close, window)
+    np.testing.assert_allclose(result, expected, rtol=1e-13, equal_nan=True)
+    np.testing.assert_array_equal(np.isnan(result), np.isnan(expected))
+
+
+@pytest.mark.parametrize("window", WINDOWS)
+def test_streaming_array_manager(arrays: Dict[str, ndarray], window: int) -> None:
+    """StreamingArrayManager的数组视图和在完整序列上计算的talib指标一致"""
+    size: int = 20
+    am: StreamingArrayManager = StreamingArrayManager(size)
+    am.add_sma(window)
+    am.add_wma(window)
+    am.add_ema(window)
+    am.add_atr(window)
+
+    high: ndarray = arrays["high_price"]
+    low: ndarray = arrays["low_price"]
+    close: ndarray = arrays["close_price"]
+
+    expected: Dict[str, ndarray] = {
+        "sma": talib.SMA(close, window),
+        "wma": close if window == 1 else talib.WMA(close, window),
+        "ema": talib.EMA(close, window),
+        "atr": talib.TRANGE(high, low, close) if window == 1 else talib.ATR(high, low, close, window)
+    }
+
+    for i, bar in enumerate(generate_bars(arrays)):
+        am.update_bar(bar)
+
+        if not am.inited:
+            continue
+
+        np.testing.assert_array_equal(am.close_array, close[i + 1 - size:i + 1])
+        np.testing.assert_array_equal(am.high_array, high[i + 1 - size:i + 1])
+        np.testing.assert_array_equal(am.low_array, low[i + 1 - size:i + 1])
+
+        for name, values in expected.items():
+            result: ndarray = getattr(am, name)(window, array=True)
+
+            # 初始化完成后指标数组已填满有效数值
+            assert not np.isnan(result).any()
+            np.testing.assert_allclose(result, values[i + 1 - size:i + 1], rtol=1e-13)
+            assert getattr(am, name)(window) == result[-1]
+
+    assert am.inited
@@ -0,0 +1,153 @@
+import os
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+import pytest
+
+import generate_data
+from generate_data import CsvRankDatafeed, RankDataGenerator, read_last_date
+from rank_store import RankStore
+
+
+SYMBOL: str = "AG"
+DATES: List[str] = [d.strftime("%Y-%m-%d") for d in pd.bdate_range("2020-01-02", periods=10)]
+MEMBERS: List[str] = ["甲", "乙", "丙"]
+
+
+def create_source(folder: Path) -> None:
+    """生成格式同米筐导出数据的原始持仓排名和总持仓量csv文件"""
+    rng: np.random.Generator = np.random.default_rng(0)
+
+    for rank_by in ["long", "short"]:
+        rows: List[list] = []
+        for date in DATES:
+            for rank, member in enumerate(MEMBERS, 1):
+                rows.append([date, SYMBOL, rank, member, int(rng.integers(100, 1000)), int(rng.integers(-50, 50))])
+
+        df: DataFrame = DataFrame(rows, columns=generate_data.RANK_COLUMNS)
+        df.to_csv(folder.joinpath(f"{SYMBOL}_{rank_by}.csv"), index=False)
+
+    total_oi: DataFrame = DataFrame({
+        "trading_date": DATES,
+        f"{SYMBOL}_total_oi": rng.integers(10000, 20000, len(DATES)).astype(float)
+    })
+    total_oi.to_csv(folder.joinpath(f"{SYMBOL}_total_oi.csv"), index=False)
+
+
+@pytest.fixture
+def generator(tmp_path: Path) -> RankDataGenerator:
+    """以本地csv文件为数据源的生成器，输出写入临时目录"""
+    source: Path = tmp_path.joinpath("source")
+    source.mkdir()
+    create_source(source)
+
+    raw_path: Path = tmp_path.joinpath("raw")
+    raw_path.mkdir()
+
+    return RankDataGenerator(CsvRankDatafeed(source), raw_path, raw_path.joinpath("processed_data"))
+
+
+def get_files(generator: RankDataGenerator) -> List[Path]:
+    """品种的全部输出文件，包括原始数据和处理后数据"""
+    return [
+        generator.raw_path.joinpath(f"{SYMBOL}_long.csv"),
+        generator.raw_path.joinpath(f"{SYMBOL}_short.csv"),
+        *generator.get_output_paths(SYMBOL)
+    ]
+
+
+def check_files(generator: RankDataGenerator, end: str) -> None:
+    """各文件的交易日不重复，且正好覆盖到end为止的全部交易日"""
+    dates: List[str] = [d for d in DATES if d <= end]
+
+    for path in get_files(generator):
+        df: DataFrame = pd.read_csv(path)
+
+        if "member_name" in df:
+            assert not df.duplicated(["trading_date", "member_name"]).any(), path.name
+            assert sorted(df["trading_date"].unique()) == dates, path.name
+        else:
+            assert df["trading_date"].tolist() == dates, path.name
+
+
+def test_incremental_update(generator: RankDataGenerator) -> None:
+    """增量更新只追加新的交易日，已有数据保持不变"""
+    generator.update([SYMBOL], DATES[4])
+    check_files(generator, DATES[4])
+    assert generator.checkpoint[SYMBOL] == DATES[4]
+
+    before: DataFrame = pd.read_csv(generator.data_path.joinpath(f"{SYMBOL}_processed_long.csv"))
+
+    generator.update([SYMBOL], DATES[-1])
+    check_files(generator, DATES[-1])
+    assert generator.checkpoint[SYMBOL] == DATES[-1]
+
+    after: DataFrame = pd.read_csv(generator.data_path.joinpath(f"{SYMBOL}_processed_long.csv"))
+    pd.testing.assert_frame_equal(after.iloc[:len(before)], before)
+
+    # 汇总值和原始数据一致
+    raw: DataFrame = pd.read_csv(generator.raw_path.joinpath(f"{SYMBOL}_long.csv"))
+    expected: pd.Series = raw.groupby("trading_date")["volume"].sum()
+    np.testing.assert_array_equal(after["volume"].to_numpy(), expected.to_numpy())
+
+
+def test_resume_after_interrupt(generator: RankDataGenerator, monkeypatch: pytest.MonkeyPatch) -> None:
+    """替换文件中途中断、断点未前进时，重新运行不会产生重复数据"""
+    generator.update([SYMBOL], DATES[4])
+
+    # 只替换前两个文件后中断
+    replace: Callable = os.replace
+    count: List[int] = [0]
+
+    def interrupted_replace(src: Path, dst: Path) -> None:
+        count[0] += 1
+        if count[0] > 2:
+            raise KeyboardInterrupt
+        replace(src, dst)
+
+    monkeypatch.setattr(generate_data.os, "replace", interrupted_replace)
+    with pytest.raises(KeyboardInterrupt):
+        generator.update_symbol(SYMBOL, DATES[-1])
+    monkeypatch.setattr(generate_data.os, "replace", replace)
+
+    # 部分文件已追加，断点仍停留在之前的交易日
+    assert generator.checkpoint[SYMBOL] == DATES[4]
+    assert len({read_last_date(path) for path in get_files(generator)}) == 2
+
+    generator.update([SYMBOL], DATES[-1])
+    check_files(generator, DATES[-1])
+
+
+def test_failure_keeps_files(generator: RankDataGenerator, monkeypatch: pytest.MonkeyPatch) -> None:
+    """品种数据生成失败时，已有文件均保持不变"""
+    generator.update([SYMBOL], DATES[4])
+    contents: List[bytes] = [path.read_bytes() for path in get_files(generator)]
+
+    def fail(*args: object) -> None:
+        raise RuntimeError("查询失败")
+
+    monkeypatch.setattr(generator.datafeed, "query_total_oi", fail)
+    generator.update([SYMBOL], DATES[-1])
+
+    assert [path.read_bytes() for path in get_files(generator)] == contents
+    assert not list(generator.raw_path.rglob("*.tmp"))
+
+
+def test_rank_store_rebuild(generator: RankDataGenerator) -> None:
+    """csv文件变化后，RankStore重新生成面板数据"""
+    generator.update([SYMBOL], DATES[4])
+
+    store: RankStore = RankStore(generator.data_path)
+    assert len(store.dates) == 5
+
+    # 在生成器之外追加一个交易日的数据
+    for path in generator.get_output_paths(SYMBOL):
+        with open(path, "a") as f:
+            f.write(f"{DATES[5]},1,2,3\n" if "processed" in path.name else f"{DATES[5]},4\n")
+
+    store = RankStore(generator.data_path)
+    assert str(store.dates[-1]) == DATES[5]
+    assert store.load([SYMBOL])["total_oi"][-1, 0] == 4
@@ -0,0 +1,191 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+from numpy import ndarray
+import pytest
+
+from vnpy.trader.constant import Exchange, Interval
+from vnpy.trader.object import BarData
+from vnpy_ctastrategy.backtesting import BacktestingEngine
+
+from elite_utility import bars_to_arrays
+
+import continuous_breakthroughs_strategy
+import cpv_strategy
+import extreme_follow_strategy
+import maobv_strategy
+import oi_based_strategy
+import rumi_strategy
+import trend_model_sys_strategy
+
+
+# 夜盘、上午两节和下午的交易时段
+SESSIONS: List[Tuple[Tuple[int, int], Tuple[int, int]]] = [
+    ((21, 0), (23, 0)),
+    ((9, 0), (10, 15)),
+    ((10, 30), (11, 30)),
+    ((13, 30), (15, 0))
+]
+
+# 策略模块、策略类和参数，price_add足够大以保证限价委托在下一根K线成交
+CASES: List[Tuple[object, type, dict]] = [
+    (rumi_strategy, rumi_strategy.RumiStrategy, {"price_add": 1000}),
+    (
+        rumi_strategy,
+        rumi_strategy.RumiStrategy,
+        {"price_add": 1000, "fast_window": 5, "slow_window": 20, "diff_window": 10}
+    ),
+    (
+        maobv_strategy,
+        maobv_strategy.MAOBVStrategy,
+        {"price_add": 1000, "fast_window": 3, "slow_window": 8, "obv_window": 6, "obv_up": 0.3, "obv_low": 0.7}
+    ),
+    (
+        maobv_strategy,
+        maobv_strategy.MAOBVStrategy,
+        {"price_add": 1000, "fast_window": 2, "slow_window": 5, "obv_window": 4, "obv_up": 0, "obv_low": 1, "window": 2}
+    ),
+    (continuous_breakthroughs_strategy, continuous_breakthroughs_strategy.ContiBreStrategy, {"price_add": 1000}),
+    (
+        continuous_breakthroughs_strategy,
+        continuous_breakthroughs_strategy.ContiBreStrategy,
+        {"price_add": 1000, "n1": 2, "n2": 10, "count": 20, "window": 15}
+    ),
+    (extreme_follow_strategy, extreme_follow_strategy.ExtremeFollowStrategy, {"price_add": 1000}),
+    (
+        extreme_follow_strategy,
+        extreme_follow_strategy.ExtremeFollowStrategy,
+        {"price_add": 1000, "extreme_window": 3, "min_count": 2, "window": 1}
+    ),
+    (cpv_strategy, cpv_strategy.CpvStrategy, {"price_add": 1000}),
+    (cpv_strategy, cpv_strategy.CpvStrategy, {"price_add": 1000, "fixed_size": 3}),
+    (oi_based_strategy, oi_based_strategy.OiBasedStrategy, {"price_add": 1000}),
+    (
+        oi_based_strategy,
+        oi_based_strategy.OiBasedStrategy,
+        {"price_add": 1000, "ma_p_window": 3, "ma_q_window": 5, "window": 5, "K": 0.3}
+    ),
+    (trend_model_sys_strategy, trend_model_sys_strategy.TrendModelSysStrategy, {"price_add": 5}),
+    (
+        trend_model_sys_strategy,
+        trend_model_sys_strategy.TrendModelSysStrategy,
+        {"price_add": 1, "ncos": 2, "n_bars": 40, "window": 1}
+    ),
+    (
+        trend_model_sys_strategy,
+        trend_model_sys_strategy.TrendModelSysStrategy,
+        {"price_add": 0, "ncos": 3, "n_bars": 200, "window": 15, "trailbar": 2}
+    ),
+]
+
+
+def generate_bars(days: int, seed: int, night: bool) -> List[BarData]:
+    """生成价格在最小变动价位1上的随机一分钟K线"""
+    rng: np.random.Generator = np.random.default_rng(seed)
+
+    bars: List[BarData] = []
+    price: float = 4000
+    open_interest: float = 1e6
+    day: datetime = datetime(2021, 1, 4)
+
+    for _ in range(days):
+        while day.weekday() >= 5:
+            day += timedelta(days=1)
+
+        for (start_hour, start_minute), (end_hour, end_minute) in SESSIONS:
+            # 夜盘属于前一个自然日的晚上，周一的夜盘在上周五
+            if start_hour == 21:
+                if not night:
+                    continue
+                base: datetime = day - timedelta(days=1 if day.weekday() else 3)
+            else:
+                base = day
+
+            dt: datetime = base.replace(hour=start_hour, minute=start_minute)
+            end: datetime = base.replace(hour=end_hour, minute=end_minute)
+
+            while dt < end:
+                open_price: float = price
+                price = max(1, price + round(rng.normal() * 3))
+                volume: float = float(rng.integers(1, 2000))
+                open_interest += round(rng.normal() * 200)
+
+                bars.append(BarData(
+                    symbol="rb888",
+                    exchange=Exchange.SHFE,
+                    datetime=dt,
+                    interval=Interval.MINUTE,
+                    volume=volume,
+                    turnover=volume * price,
+                    open_interest=open_interest,
+                    open_price=open_price,
+                    high_price=max(open_price, price) + round(abs(rng.normal())),
+                    low_price=min(open_price, price) - round(abs(rng.normal())),
+                    close_price=price,
+                    gateway_name="TEST"
+                ))
+                dt += timedelta(minutes=1)
+
+        day += timedelta(days=1)
+
+    return bars
+
+
+def run_engine(strategy_class: type, bars: List[BarData], setting: dict) -> ndarray:
+    """用BacktestingEngine逐K线回放，记录每根K线结束时的持仓"""
+    engine: BacktestingEngine = BacktestingEngine()
+    engine.output = lambda msg: None
+    engine.set_parameters(
+        vt_symbol=bars[0].vt_symbol,
+        interval=Interval.MINUTE,
+        start=bars[0].datetime,
+        end=bars[-1].datetime,
+        rate=0,
+        slippage=0,
+        size=10,
+        pricetick=1,
+        capital=1_000_000_000
+    )
+    engine.add_strategy(strategy_class, setting)
+
+    # 不读取数据库，全部K线都在交易状态下回放，和generate_signals看到的历史一致
+    engine.load_bar = lambda *args, **kwargs: []
+    engine.history_data = bars
+
+    positions: List[int] = []
+    new_bar = engine.new_bar
+
+    def record_bar(bar: BarData) -> None:
+        new_bar(bar)
+        positions.append(engine.strategy.pos)
+
+    engine.new_bar = record_bar
+    engine.run_backtesting()
+
+    return np.array(positions, dtype=float)
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["day", "night"])
+def bars(request: pytest.FixtureRequest) -> List[BarData]:
+    """有夜盘和无夜盘的随机K线"""
+    return generate_bars(200, 1, request.param)
+
+
+@pytest.mark.parametrize(
+    "module, strategy_class, setting",
+    CASES,
+    ids=[f"{case[1].__name__}-{i}" for i, case in enumerate(CASES)]
+)
+def test_generate_signals(bars: List[BarData], module: object, strategy_class: type, setting: dict) -> None:
+    """向量化持仓序列和BacktestingEngine逐K线回测的持仓逐根一致"""
+    expected: ndarray = run_engine(strategy_class, bars, setting)
+
+    arrays: Dict[str, ndarray] = bars_to_arrays(bars)
+    result: ndarray = module.generate_signals(arrays, setting)
+
+    # 持仓需要有变化，避免参数设置导致的空测试
+    assert np.diff(expected).any()
+
+    mismatch: ndarray = np.flatnonzero(result != expected)
+    assert not len(mismatch), f"第一处不一致：{bars[mismatch[0]].datetime}"